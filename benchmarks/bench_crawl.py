@@ -0,0 +1,208 @@
+"""
+端到端爬取基准：爬虫 + 图片管道 + SaveJsonPipeline + 企业微信投递
+
+数据源:
+    synthetic  本地合成站点（benchmarks.servers.SyntheticSite），可生成上千个列表/详情页
+    replay     重放 .scrapy/httpcache/hku_arts_news 中录制的真实页面，不访问网络
+
+企业微信消息发到本地 MockWebhook；数据目录放在临时目录，不影响 Desktop/hku_news_data。
+报告 items/sec、单条 item 的管道耗时 p50/p99、峰值 RSS、add_article 耗时随文章数的变化
+以及 news_index.json 导出耗时，并写入 JSON（默认 benchmarks/results/<时间>-<数据源>.json）便于对比。
+
+用法:
+    python -m benchmarks.bench_crawl synthetic --pages 50 --per-page 20
+    python -m benchmarks.bench_crawl replay
+    python -m benchmarks.bench_crawl synthetic --output before.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.instruments import RECORDER
+from benchmarks.servers import MockWebhook, SyntheticSite
+from hku_scraper.metrics import percentile
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_REPLAY_DIR = ROOT / '.scrapy' / 'httpcache'
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+# 每多少篇文章汇总一次 add_article 耗时
+INDEX_BUCKET = 250
+
+
+def peak_rss_mb():
+    """本进程峰值常驻内存（MB）；没有 resource 模块（Windows）时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def index_buckets(samples, bucket=INDEX_BUCKET):
+    """按文章数分桶汇总 add_article 耗时，观察随语料增长的写入成本"""
+    rows = {}
+    for size, ms in samples:
+        rows.setdefault(size // bucket, []).append(ms)
+    return [{
+        'articles_from': key * bucket,
+        'count': len(values),
+        'mean_ms': round(sum(values) / len(values), 3),
+        'p99_ms': round(percentile(values, 99), 3),
+    } for key, values in sorted(rows.items())]
+
+
+def build_settings(args, data_dir, webhook_url):
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'hku_scraper.settings')
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    settings.setdict({
+        'LOG_LEVEL': args.log_level,
+        'TELNETCONSOLE_ENABLED': False,
+        # cookies 中间件会让 tldextract 联网下载公共后缀表，基准不需要 cookies
+        'COOKIES_ENABLED': False,
+        'HTTPCACHE_ENABLED': False,
+        'AUTOTHROTTLE_ENABLED': False,
+        'DOWNLOAD_DELAY': 0,
+        'CONCURRENT_REQUESTS': args.concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': args.concurrency,
+        'IMAGES_STORE': str(data_dir / 'images'),
+        'WECHAT_WEBHOOK_URL': webhook_url,
+        # 不限速：测的是本地投递能力，而不是企业微信的配额
+        'WECHAT_RATE_PER_MINUTE': 10 ** 6,
+        'WECHAT_DRAIN_TIMEOUT': args.drain_timeout,
+        'WECHAT_DIGEST': args.digest,
+        'OFFLOAD_POOL': args.offload_pool,
+        'OFFLOAD_WORKERS': args.offload_workers,
+        'ITEM_PIPELINES': {
+            'benchmarks.instruments.LatencyPipeline': 1,
+            'hku_scraper.offload.OffloadPipeline': 50,
+            'hku_scraper.images.CachedImagesPipeline': 100,
+            'benchmarks.instruments.TimedSaveJsonPipeline': 200,
+        },
+    }, priority='cmdline')
+    return settings
+
+
+def run(args):
+    """运行一次基准，返回报告字典"""
+    home = Path(tempfile.mkdtemp(prefix='hku-bench-'))
+    # 数据目录、articles.db、outbox.db 全部放到临时目录
+    os.environ['HOME'] = str(home)
+    os.environ.pop('USERPROFILE', None)
+    from hku_scraper.utils import get_data_dir
+    data_dir = get_data_dir()
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    from scrapy.crawler import CrawlerProcess
+
+    site = SyntheticSite(pages=args.pages, per_page=args.per_page, text_chars=args.text_chars,
+                         images=args.images) if args.source == 'synthetic' else None
+    with MockWebhook() as webhook, (site or nullcontext()):
+        settings = build_settings(args, data_dir, webhook.url)
+        if site is not None:
+            from hku_scraper.spiders.news_sites_spider import NewsSitesSpider
+            sites_file = home / 'sites.json'
+            sites_file.write_text(json.dumps({'sites': [site.site_definition()]}), encoding='utf-8')
+            settings.set('SITES_FILE', str(sites_file), priority='cmdline')
+            spider_cls, spider_kwargs = NewsSitesSpider, {'sites_file': sites_file}
+        else:
+            from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+            settings.set('BENCH_REPLAY_DIR', str(Path(args.replay_dir).resolve()), priority='cmdline')
+            settings.set('DOWNLOADER_MIDDLEWARES', {'benchmarks.instruments.ReplayMiddleware': 900},
+                         priority='cmdline')
+            spider_cls, spider_kwargs = HKUArtsNewsSpider, {}
+
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(spider_cls)
+        process.crawl(crawler, **spider_kwargs)
+        started = time.perf_counter()
+        process.start()
+        elapsed = time.perf_counter() - started
+        webhook_counts = dict(webhook.counts)
+
+    latencies = RECORDER.latencies_ms
+    items = len(latencies)
+    # 吞吐只算到最后一条 item 处理完；之后是等待发件箱投递完（drain）的时间
+    crawl_s = (RECORDER.last_item_at - started) if RECORDER.last_item_at else elapsed
+    stats = crawler.stats.get_stats()
+    return {
+        'source': args.source,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'log_level')},
+        'items': items,
+        'requests': stats.get('downloader/request_count', 0),
+        'elapsed_s': round(elapsed, 3),
+        'crawl_s': round(crawl_s, 3),
+        'items_per_sec': round(items / crawl_s, 2) if crawl_s else None,
+        'pipeline_latency_ms': {
+            'p50': round(percentile(latencies, 50), 3) if latencies else None,
+            'p99': round(percentile(latencies, 99), 3) if latencies else None,
+            'max': round(max(latencies), 3) if latencies else None,
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'index_write': {
+            'add_article': index_buckets(RECORDER.add_article),
+            'export_index_ms': round(RECORDER.export_index_ms, 3) if RECORDER.export_index_ms else None,
+        },
+        'webhook_messages': webhook_counts,
+    }
+
+
+def print_report(report):
+    latency = report['pipeline_latency_ms']
+    print(f'[{report["source"]}] {report["items"]} items / {report["requests"]} requests '
+          f'in {report["crawl_s"]}s -> {report["items_per_sec"]} items/s '
+          f'(total {report["elapsed_s"]}s incl. outbox drain)')
+    print(f'  pipeline latency p50 {latency["p50"]} ms, p99 {latency["p99"]} ms, max {latency["max"]} ms')
+    print(f'  peak RSS {report["peak_rss_mb"]} MB, webhook {report["webhook_messages"]}')
+    print(f'  export_index {report["index_write"]["export_index_ms"]} ms')
+    print(f'  {"articles":>10} {"count":>6} {"add mean ms":>12} {"add p99 ms":>11}')
+    for row in report['index_write']['add_article']:
+        print(f'  {row["articles_from"]:>10} {row["count"]:>6} {row["mean_ms"]:>12} {row["p99_ms"]:>11}')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('source', choices=('synthetic', 'replay'))
+    parser.add_argument('--pages', type=int, default=50, help='合成站点列表页数')
+    parser.add_argument('--per-page', type=int, default=20, help='每个列表页的文章数')
+    parser.add_argument('--text-chars', type=int, default=3000, help='每篇文章正文字符数')
+    parser.add_argument('--images', type=int, default=2, help='每篇文章图片数')
+    parser.add_argument('--replay-dir', default=str(DEFAULT_REPLAY_DIR), help='Scrapy 文件缓存目录')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--drain-timeout', type=float, default=120,
+                        help='爬虫结束后等待发件箱投递完的最长秒数')
+    parser.add_argument('--digest', action='store_true', help='企业微信摘要模式（合并为新闻速递消息）')
+    parser.add_argument('--offload-pool', choices=('thread', 'process'), default='process')
+    parser.add_argument('--offload-workers', type=int, default=None,
+                        help='解析/图片/保存的 worker 数（默认按 CPU 核数，0 为全部在 reactor 线程执行）')
+    parser.add_argument('--output', help='报告 JSON 路径（默认 benchmarks/results/<时间>-<数据源>.json）')
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_report(report)
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-{args.source}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f'  report -> {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+详情页提取微基准：hku_scraper.extractor.extract_article 对比旧版 parse_article 中的多次 CSS 查询
+
+页面来源：.scrapy/httpcache 中录制的详情页（含 content-container 的响应，responses.db 与旧版文件缓存）+ 合成的大页面。
+页面只解析一次（response.selector 预先构建），计时只包含提取本身。
+合成页面在正文中夹带 <script>，新提取器会跳过这些文本，因此 same text 为 False 属预期。
+
+用法:
+    python -m benchmarks.bench_extractor [--repeat 20] [--replay-dir .scrapy/httpcache]
+"""
+
+import ast
+import zlib
+import random
+import sqlite3
+import argparse
+import timeit
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.servers import make_text
+from hku_scraper.extractor import extract_article
+from hku_scraper.httpcache import CACHE_DB
+
+ROOT = Path(__file__).parent.parent
+DEFAULT_REPLAY_DIR = ROOT / '.scrapy' / 'httpcache'
+DETAIL = 'div.content-container'
+
+
+def legacy_extract(response, detail=DETAIL, text_limit=5000, image_limit=10):
+    """旧版 HKUArtsNewsSpider.parse_article 的提取逻辑（含从未使用的 article_body 序列化）"""
+    article_body = response.css(f'{detail} div.content, div.article-content, main, article').get()
+    if not article_body:
+        article_body = response.css('body').get()
+    article_text = ' '.join(response.css(f'{detail} ::text').getall()).strip()
+    article_text = ' '.join(article_text.split())
+    image_urls = response.css(f'{detail} img::attr(src), {detail} img::attr(data-src)').getall()
+    image_urls = [urljoin(response.url, img.strip()) for img in image_urls if img]
+    return article_text[:text_limit], image_urls[:image_limit]
+
+
+def new_extract(response, detail=DETAIL, text_limit=5000, image_limit=10):
+    return extract_article(response.selector.root, response.url, detail, text_limit, image_limit)
+
+
+def recorded_pages(replay_dir):
+    """从 responses.db（hku_scraper.httpcache）与 Scrapy 文件缓存中读取含正文容器的详情页"""
+    pages = []
+    cache_db = Path(replay_dir) / CACHE_DB
+    if cache_db.exists():
+        conn = sqlite3.connect(f'file:{cache_db}?mode=ro', uri=True)
+        try:
+            for url, body, compressed in conn.execute('SELECT url, body, compressed FROM responses ORDER BY url'):
+                body = zlib.decompress(body) if compressed else body
+                if b'content-container' in body:
+                    pages.append((f'recorded {urlparse(url).path[:40]}', url, body))
+        finally:
+            conn.close()
+    for meta_file in sorted(Path(replay_dir).glob('*/*/*/meta')):
+        entry = meta_file.parent
+        body = (entry / 'response_body').read_bytes()
+        if b'content-container' not in body:
+            continue
+        url = ast.literal_eval(meta_file.read_text())['response_url']  # Scrapy 以 repr(dict) 写 meta
+        pages.append((f'recorded {urlparse(url).path[:40]}', url, body))
+    return pages
+
+
+def synthetic_page(chars, images, seed=0):
+    text = make_text(random.Random(seed), chars)
+    paragraphs = ''.join(f'<p>{text[i:i + 400]}</p><script>var x = {i};</script>'
+                         for i in range(0, len(text), 400))
+    imgs = ''.join(f'<img src="/img/{i}.jpg" data-src="/img/{i}@2x.jpg">' for i in range(images))
+    body = (f'<html><body><nav>{"<a href=/x>menu</a>" * 200}</nav>'
+            f'<div class="content-container">{paragraphs}{imgs}</div>'
+            f'<footer>{"<p>footer</p>" * 200}</footer></body></html>')
+    return (f'synthetic {chars} chars/{images} imgs', 'https://arts.hku.hk/news/synthetic',
+            body.encode('utf-8'))
+
+
+def run(replay_dir=DEFAULT_REPLAY_DIR, repeat=20):
+    pages = recorded_pages(replay_dir) + [synthetic_page(3000, 5), synthetic_page(200000, 300)]
+    results = []
+    for name, url, body in pages:
+        response = HtmlResponse(url=url, body=body, encoding='utf-8')
+        response.selector  # 解析一次，不计入提取耗时
+        legacy = legacy_extract(response)
+        new = new_extract(response)
+        row = {'page': name, 'kb': round(len(body) / 1024, 1),
+               'same_images': legacy[1] == new[1], 'same_text': legacy[0] == new[0]}
+        for label, func in (('legacy', legacy_extract), ('extractor', new_extract)):
+            best = min(timeit.repeat(lambda: func(response), number=1, repeat=repeat))
+            row[f'{label}_ms'] = round(best * 1000, 3)
+        row['speedup'] = round(row['legacy_ms'] / max(row['extractor_ms'], 1e-6), 1)
+        results.append(row)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--replay-dir', default=str(DEFAULT_REPLAY_DIR))
+    args = parser.parse_args(argv)
+    print(f'{"page":<50} {"KB":>7} {"legacy ms":>10} {"extractor ms":>13} {"speedup":>8}  same text/images')
+    for row in run(args.replay_dir, args.repeat):
+        print(f'{row["page"]:<50} {row["kb"]:>7} {row["legacy_ms"]:>10} {row["extractor_ms"]:>13} '
+              f'{row["speedup"]:>7}x  {row["same_text"]}/{row["same_images"]}')
+
+
+if __name__ == '__main__':
+    main()
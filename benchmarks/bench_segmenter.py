@@ -0,0 +1,111 @@
+"""
+分段算法微基准：hku_scraper.segmenter.split_markdown 对比旧版 send_to_wechat 中的二分算法
+
+用法:
+    python -m benchmarks.bench_segmenter [--repeat 5]
+"""
+
+import argparse
+import random
+import timeit
+
+from hku_scraper.segmenter import split_markdown, utf8_len
+
+
+def legacy_split(title, text, url, scraped_at):
+    """旧版 SaveJsonPipeline.send_to_wechat 的分段逻辑（每次二分都重新编码剩余文本）"""
+    plain_text = text.replace('\n', ' ').strip()
+    md_template_prefix = f"**{title}**\n\n"
+    md_template_suffix = f"\n\n[阅读原文]({url})\n\n_抓取时间: {scraped_at}_"
+    full_content = md_template_prefix + plain_text + md_template_suffix
+    if len(full_content.encode('utf-8')) <= 4050:
+        return [full_content]
+    max_segment_bytes = 4050
+    segments = []
+    remaining_text = plain_text
+    segment_num = 1
+    while remaining_text:
+        if segment_num == 1:
+            segment_header = md_template_prefix
+        else:
+            segment_header = f"**{title}（续{segment_num}）**\n\n"
+        header_bytes = len(segment_header.encode('utf-8'))
+        suffix_continue = "\n\n_（内容较长，续见下条）_"
+        suffix_continue_bytes = len(suffix_continue.encode('utf-8'))
+        suffix_final_bytes = len(md_template_suffix.encode('utf-8'))
+        available_bytes = max_segment_bytes - header_bytes - suffix_continue_bytes
+        low, high = 0, len(remaining_text)
+        best_chars = 0
+        while low <= high:
+            mid = (low + high) // 2
+            if len(remaining_text[:mid].encode('utf-8')) <= available_bytes:
+                best_chars = mid
+                low = mid + 1
+            else:
+                high = mid - 1
+        segment_text = remaining_text[:best_chars]
+        is_last = len(remaining_text[best_chars:].strip()) < 100
+        if is_last:
+            full_segment = segment_header + segment_text + md_template_suffix
+            if len(full_segment.encode('utf-8')) > max_segment_bytes:
+                available_bytes_final = max_segment_bytes - header_bytes - suffix_final_bytes
+                low, high = 0, len(remaining_text)
+                best_chars = 0
+                while low <= high:
+                    mid = (low + high) // 2
+                    if len(remaining_text[:mid].encode('utf-8')) <= available_bytes_final:
+                        best_chars = mid
+                        low = mid + 1
+                    else:
+                        high = mid - 1
+                segment_text = remaining_text[:best_chars]
+            segment_md = segment_header + segment_text + md_template_suffix
+        else:
+            segment_md = segment_header + segment_text + suffix_continue
+        segments.append(segment_md)
+        remaining_text = remaining_text[len(segment_text):].strip()
+        segment_num += 1
+    return segments
+
+
+def make_text(chars, seed=0):
+    """生成中英混排的长文本"""
+    rng = random.Random(seed)
+    words = ['香港大学', '文学院', '新闻', '研究', 'HKU', 'Arts', 'research', '2025', '。', '，', '. ', ' ']
+    out = []
+    total = 0
+    while total < chars:
+        w = rng.choice(words)
+        out.append(w)
+        total += len(w)
+    return ''.join(out)[:chars]
+
+
+def run(repeat=5):
+    results = []
+    for chars in (5000, 50000, 200000):
+        text = make_text(chars)
+        args = ('HKU Arts 新闻标题', text, 'https://arts.hku.hk/news/x', '2025-01-01T00:00:00')
+        new_segments = split_markdown(*args)
+        assert all(utf8_len(s) <= 4050 for s in new_segments)
+        row = {'chars': chars, 'segments': len(new_segments)}
+        for name, func in (('legacy', legacy_split), ('segmenter', split_markdown)):
+            best = min(timeit.repeat(lambda: func(*args), number=1, repeat=repeat))
+            row[f'{name}_ms'] = round(best * 1000, 2)
+        row['speedup'] = round(row['legacy_ms'] / max(row['segmenter_ms'], 1e-6), 1)
+        results.append(row)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+    print(f'{"chars":>8} {"segments":>9} {"legacy ms":>10} {"segmenter ms":>13} {"speedup":>8}')
+    for row in run(args.repeat):
+        print(f'{row["chars"]:>8} {row["segments"]:>9} {row["legacy_ms"]:>10} '
+              f'{row["segmenter_ms"]:>13} {row["speedup"]:>7}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+基准测试埋点：由 Scrapy 按路径加载的管道 / 下载中间件
+
+放在独立模块中：bench_crawl 以 `python -m` 运行时是 __main__，
+Scrapy 按 "benchmarks.bench_crawl.X" 加载会得到另一份模块，测量数据无法汇总。
+"""
+
+import time
+
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest
+from pathlib import Path
+
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.settings import Settings
+
+from hku_scraper.httpcache import CACHE_DB, CompressedLRUStorage
+from hku_scraper.pipelines import SaveJsonPipeline
+
+
+class Recorder:
+    """一次运行的测量数据（Scrapy 自行实例化管道，只能通过模块级对象汇总）"""
+
+    def __init__(self):
+        self.latencies_ms = []
+        self.add_article = []   # (写入前的文章数, 耗时 ms)
+        self.export_index_ms = None
+        self.last_item_at = None
+
+
+RECORDER = Recorder()
+
+
+class LatencyPipeline:
+    """放在最前面的管道：记录 item 进入管道的时间，item_scraped 时计算整条管道链的耗时"""
+
+    STAMP = '_bench_started'
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls()
+        crawler.signals.connect(pipeline.item_scraped, signal=signals.item_scraped)
+        return pipeline
+
+    def process_item(self, item, spider):
+        item[self.STAMP] = time.perf_counter()
+        return item
+
+    def item_scraped(self, item, response, spider):
+        started = item.pop(self.STAMP, None)
+        if started is not None:
+            RECORDER.last_item_at = time.perf_counter()
+            RECORDER.latencies_ms.append((RECORDER.last_item_at - started) * 1000)
+
+
+class TimedSaveJsonPipeline(SaveJsonPipeline):
+    """SaveJsonPipeline，额外记录索引写入（add_article / export_index）耗时"""
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        store = self.store
+        add_article = store.add_article
+        export_index = store.export_index
+
+        def timed_add(*args, **kwargs):
+            size = len(store)
+            started = time.perf_counter()
+            try:
+                return add_article(*args, **kwargs)
+            finally:
+                RECORDER.add_article.append((size, (time.perf_counter() - started) * 1000))
+
+        def timed_export(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return export_index(*args, **kwargs)
+            finally:
+                RECORDER.export_index_ms = (time.perf_counter() - started) * 1000
+
+        store.add_article = timed_add
+        store.export_index = timed_export
+
+
+class ReplayMiddleware:
+    """从 HTTP 缓存重放响应；缓存中没有的请求直接忽略，从不访问网络
+
+    目录下有 responses.db（hku_scraper.httpcache）时从中读取，否则按 Scrapy 文件缓存格式读取旧录制。
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        replay_dir = crawler.settings.get('BENCH_REPLAY_DIR')
+        storage_cls = CompressedLRUStorage if Path(replay_dir, CACHE_DB).exists() else FilesystemCacheStorage
+        self.storage = storage_cls(Settings({
+            'HTTPCACHE_DIR': replay_dir,
+            'HTTPCACHE_EXPIRATION_SECS': 0,
+            # 重放只读，不淘汰
+            'HTTPCACHE_MAX_BYTES': 0,
+        }))
+        self.misses = 0
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.storage.open_spider(spider)
+
+    def process_request(self, request):
+        response = self.storage.retrieve_response(self.crawler.spider, request)
+        if response is None:
+            self.misses += 1
+            raise IgnoreRequest(f'not recorded: {request.url}')
+        return response
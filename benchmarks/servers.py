@@ -0,0 +1,190 @@
+"""
+基准测试用的本地 HTTP 服务
+
+- SyntheticSite: 生成任意数量的新闻列表页 / 详情页 / 图片，结构与 arts.hku.hk 相同
+  （div.inner-box ul.news li、div.content-container），列表页按 /news?page=N 分页
+- MockWebhook: 模拟企业微信机器人，所有请求返回 errcode=0 并计数
+
+两者都在后台线程中运行 ThreadingHTTPServer，端口由系统分配。
+"""
+
+import json
+import random
+import threading
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+PUNCTUATION = ['。', '，', '. ', ' ']
+
+
+def make_text(rng, chars):
+    """随机中英混排正文；每篇用字不同，避免被内容指纹判成近似重复"""
+    out, total = [], 0
+    while total < chars:
+        if rng.random() < 0.7:
+            word = ''.join(chr(rng.randrange(0x4E00, 0x9FA6)) for _ in range(rng.randrange(2, 5)))
+        else:
+            word = ''.join(chr(rng.randrange(97, 123)) for _ in range(rng.randrange(3, 9))) + ' '
+        if rng.random() < 0.15:
+            word += rng.choice(PUNCTUATION)
+        out.append(word)
+        total += len(word)
+    return ''.join(out)[:chars]
+
+
+def make_png(size=64, seed=0):
+    """生成一张小 PNG（需要 Pillow，与 ImagesPipeline 的依赖相同）"""
+    from PIL import Image
+    rng = random.Random(seed)
+    image = Image.new('RGB', (size, size), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buf = BytesIO()
+    image.save(buf, 'PNG')
+    return buf.getvalue()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # 头和正文分两次写出，不关 Nagle 会在 keep-alive 连接上每个响应多等 40ms（延迟 ACK）
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server:
+    """在后台线程运行的 HTTP 服务，可用作上下文管理器"""
+
+    handler_cls = None
+
+    def __init__(self, host='127.0.0.1', port=0):
+        handler = type('Handler', (self.handler_cls,), {'owner': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _SiteHandler(_QuietHandler):
+    def do_GET(self):
+        site = self.owner
+        parsed = urlparse(self.path)
+        if parsed.path in ('/', '/news'):
+            page = int(parse_qs(parsed.query).get('page', ['1'])[0])
+            body = site.list_page(page)
+        elif parsed.path.startswith('/news/'):
+            body = site.detail_page(int(parsed.path.rsplit('/', 1)[1]))
+        elif parsed.path.startswith('/img/'):
+            self._send(200, site.image, 'image/png')
+            return
+        else:
+            body = None
+        if body is None:
+            self._send(404, b'not found', 'text/plain')
+        else:
+            self._send(200, body.encode('utf-8'), 'text/html; charset=utf-8')
+
+
+class SyntheticSite(_Server):
+    """合成新闻站点：pages 个列表页，每页 per_page 篇文章"""
+
+    handler_cls = _SiteHandler
+
+    def __init__(self, pages=50, per_page=20, text_chars=3000, images=2, seed=0, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = pages
+        self.per_page = per_page
+        self.text_chars = text_chars
+        self.images = images
+        self.seed = seed
+        self.image = make_png(seed=seed) if images else b''
+
+    @property
+    def articles(self):
+        return self.pages * self.per_page
+
+    def site_definition(self, name='synthetic'):
+        """对应 config/sites.json 的站点定义（不限速，测的是本地处理能力）"""
+        return {
+            'name': name,
+            'start_urls': [f'{self.base_url}/'],
+            'allowed_domains': ['127.0.0.1'],
+            'list_selector': 'div.inner-box ul.news li',
+            'detail_selector': 'div.content-container',
+            'pagination': {'url_template': '/news?page={page}', 'max_pages': self.pages},
+            'politeness': {'concurrency': 64, 'delay': 0},
+        }
+
+    def list_page(self, page):
+        if not 1 <= page <= self.pages:
+            return None
+        first = (page - 1) * self.per_page
+        items = ''.join(f'<li><a href="/news/{n}">Synthetic news {n}</a></li>'
+                        for n in range(first, first + self.per_page))
+        return f'<html><body><div class="inner-box"><ul class="news">{items}</ul></div></body></html>'
+
+    def detail_page(self, n):
+        if not 0 <= n < self.articles:
+            return None
+        text = make_text(random.Random(self.seed * 1_000_003 + n), self.text_chars)
+        images = ''.join(f'<img src="/img/{n}-{i}.png">' for i in range(self.images))
+        return (f'<html><body><div class="content-container"><h1>Synthetic news {n}</h1>'
+                f'<p>{text}</p>{images}</div></body></html>')
+
+
+class _WebhookHandler(_QuietHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        self.owner.record(payload)
+        self._send(200, b'{"errcode": 0, "errmsg": "ok"}', 'application/json')
+
+
+class MockWebhook(_Server):
+    """模拟企业微信机器人 webhook，按消息类型计数"""
+
+    handler_cls = _WebhookHandler
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    @property
+    def url(self):
+        return f'{self.base_url}/cgi-bin/webhook/send?key=bench'
+
+    def record(self, payload):
+        with self._lock:
+            kind = payload.get('msgtype', 'unknown')
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    @property
+    def received(self):
+        with self._lock:
+            return sum(self.counts.values())
@@ -0,0 +1,81 @@
+/**
+ * HKU 冷数据归档读取（格式见 hku_scraper/archive.py）
+ *
+ * archive/articles.idx: 8 字节魔数 + 每个文章 id 一项 20 字节 (段号 u32, 偏移 u64, 长度 u32, CRC32 u32)
+ * archive/segment-NNNNNN.seg: 文章记录为 zlib 压缩的原 N_article.json 内容
+ * archive/images.idx: 图片相对路径 -> [段号, 偏移, 长度, CRC32]
+ */
+
+const fs = require('fs');
+const path = require('path');
+const zlib = require('zlib');
+
+const HEADER_SIZE = 8;
+const ENTRY_SIZE = 20;
+
+function readRange(file, offset, length) {
+    const fd = fs.openSync(file, 'r');
+    try {
+        const buf = Buffer.alloc(length);
+        const n = fs.readSync(fd, buf, 0, length, offset);
+        return n === length ? buf : null;
+    } finally {
+        fs.closeSync(fd);
+    }
+}
+
+function segmentFile(dataDir, number) {
+    return path.join(dataDir, 'archive', `segment-${String(number).padStart(6, '0')}.seg`);
+}
+
+/**
+ * 读取已归档的文章，未归档时返回 null
+ */
+function readArchivedArticle(dataDir, id) {
+    const articleId = Number.parseInt(id, 10);
+    const indexFile = path.join(dataDir, 'archive', 'articles.idx');
+    if (!Number.isInteger(articleId) || articleId < 0 || !fs.existsSync(indexFile)) {
+        return null;
+    }
+    const entry = readRange(indexFile, HEADER_SIZE + articleId * ENTRY_SIZE, ENTRY_SIZE);
+    if (!entry) {
+        return null;
+    }
+    const segment = entry.readUInt32LE(0);
+    if (segment === 0) {
+        return null;
+    }
+    const offset = Number(entry.readBigUInt64LE(4));
+    const length = entry.readUInt32LE(12);
+    const record = readRange(segmentFile(dataDir, segment), offset, length);
+    return record ? JSON.parse(zlib.inflateSync(record).toString('utf-8')) : null;
+}
+
+/**
+ * 读取已归档的图片字节，未归档时返回 null
+ */
+function readArchivedImage(dataDir, relPath) {
+    const indexFile = path.join(dataDir, 'archive', 'images.idx');
+    if (!fs.existsSync(indexFile)) {
+        return null;
+    }
+    const location = JSON.parse(fs.readFileSync(indexFile, 'utf-8'))[relPath.split(path.sep).join('/')];
+    if (!location) {
+        return null;
+    }
+    const [segment, offset, length] = location;
+    return readRange(segmentFile(dataDir, segment), offset, length);
+}
+
+/**
+ * 读取文章：N_article.json 优先，否则从归档读取；都没有时返回 null
+ */
+function readArticle(dataDir, id) {
+    const articleFile = path.join(dataDir, `${id}_article.json`);
+    if (fs.existsSync(articleFile)) {
+        return JSON.parse(fs.readFileSync(articleFile, 'utf-8'));
+    }
+    return readArchivedArticle(dataDir, id);
+}
+
+module.exports = { readArticle, readArchivedArticle, readArchivedImage };
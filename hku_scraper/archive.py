@@ -0,0 +1,349 @@
+"""
+HKU 冷数据归档
+把较早的 N_article.json 与只被这些文章引用的图片打包进 hku_news_data/archive/ 下的段文件，
+减少数据目录中的小文件数量；最近的文章保持原样（热数据）。
+
+- 段文件 segment-NNNNNN.seg：8 字节魔数 + 记录首尾相接；文章记录为 zlib 压缩的原 JSON 文件内容，
+  图片记录为原始字节（JPEG 已压缩）。每条记录单独压缩，可以随机读取；段文件写好后不再修改，读取时 mmap
+- articles.idx：8 字节魔数 + 按文章 id 排列的定长项 (段号, 偏移, 长度, CRC32)，
+  第 id 项位于 8 + id * 20，按 id 查找为 O(1)；段号 0 表示未归档
+- images.idx：图片相对路径（full/xxx.jpg）-> [段号, 偏移, 长度, CRC32] 的 JSON
+
+归档顺序：写段文件（fsync 后改名）-> 原子替换索引 -> 删除已归档的散文件；
+中途崩溃最多留下未被索引引用的段文件，散文件仍在，不会丢数据。
+已归档的文章被复查更新时会重新写出 N_article.json，读取时热文件优先，下次归档再打包新内容。
+
+用法:
+    python -m hku_scraper.archive compact [天数]      # 归档 scraped_at 早于 N 天（默认 90）的文章
+    python -m hku_scraper.archive show <文章id>
+"""
+
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from hku_scraper.store import article_filename
+from hku_scraper.utils import get_data_dir
+
+ARCHIVE_DIR = 'archive'
+INDEX_FILE = 'articles.idx'
+IMAGES_INDEX_FILE = 'images.idx'
+
+SEGMENT_MAGIC = b'HKUSEG01'
+INDEX_MAGIC = b'HKUIDX01'
+# 段号, 偏移, 长度, CRC32
+ENTRY = struct.Struct('<IQII')
+
+DEFAULT_COLD_DAYS = 90
+COMPRESS_LEVEL = 6
+
+
+def segment_name(number):
+    return f'segment-{number:06d}.seg'
+
+
+def _fsync_replace(tmp_file, path):
+    with open(tmp_file, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def _write_atomic(path, data):
+    tmp_file = Path(str(path) + '.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+    _fsync_replace(tmp_file, path)
+
+
+class SegmentWriter:
+    """写一个新的段文件；commit 之前只存在 .tmp 文件"""
+
+    def __init__(self, archive_dir, number):
+        self.number = number
+        self.path = Path(archive_dir) / segment_name(number)
+        self.tmp_path = Path(str(self.path) + '.tmp')
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(SEGMENT_MAGIC)
+        self.offset = len(SEGMENT_MAGIC)
+
+    def append(self, data):
+        """追加一条记录，返回 (段号, 偏移, 长度, CRC32)"""
+        location = (self.number, self.offset, len(data), zlib.crc32(data))
+        self.file.write(data)
+        self.offset += len(data)
+        return location
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ArchiveReader:
+    """按文章 id / 图片路径读取归档
+
+    段文件只追加新文件、从不修改，mmap 后一直复用；articles.idx 每次归档会被整体替换，
+    读入内存并在文件变化时重新加载（不 mmap 索引，Windows 上被映射的文件无法被替换）。
+    """
+
+    def __init__(self, data_dir=None):
+        self.archive_dir = (Path(data_dir) if data_dir else get_data_dir()) / ARCHIVE_DIR
+        self._lock = threading.Lock()
+        self._segments = {}
+        self._index = b''
+        self._index_stat = None
+        self._images = {}
+        self._images_stat = None
+
+    def close(self):
+        with self._lock:
+            for mapped, f in self._segments.values():
+                mapped.close()
+                f.close()
+            self._segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _reload(self):
+        index_file = self.archive_dir / INDEX_FILE
+        stat = _stat_key(index_file)
+        if stat != self._index_stat:
+            data = index_file.read_bytes() if stat else b''
+            if data and not data.startswith(INDEX_MAGIC):
+                raise ValueError(f'无效的归档索引: {index_file}')
+            self._index, self._index_stat = data, stat
+        images_file = self.archive_dir / IMAGES_INDEX_FILE
+        stat = _stat_key(images_file)
+        if stat != self._images_stat:
+            self._images = json.loads(images_file.read_text(encoding='utf-8')) if stat else {}
+            self._images_stat = stat
+
+    def _segment(self, number):
+        entry = self._segments.get(number)
+        if entry is None:
+            f = open(self.archive_dir / segment_name(number), 'rb')
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if mapped[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                mapped.close()
+                f.close()
+                raise ValueError(f'无效的段文件: {segment_name(number)}')
+            entry = self._segments[number] = (mapped, f)
+        return entry[0]
+
+    def _read(self, location):
+        number, offset, length, crc = location
+        data = self._segment(number)[offset:offset + length]
+        if zlib.crc32(data) != crc:
+            raise ValueError(f'归档记录校验失败: {segment_name(number)} @ {offset}')
+        return data
+
+    def location(self, article_id):
+        """文章在归档中的位置 (段号, 偏移, 长度, CRC32)，未归档时返回 None"""
+        with self._lock:
+            self._reload()
+            start = len(INDEX_MAGIC) + article_id * ENTRY.size
+            if article_id < 0 or start + ENTRY.size > len(self._index):
+                return None
+            location = ENTRY.unpack_from(self._index, start)
+        return location if location[0] else None
+
+    def __contains__(self, article_id):
+        return self.location(article_id) is not None
+
+    def get_article_bytes(self, article_id):
+        """已归档文章的原 JSON 文件内容，未归档时返回 None"""
+        location = self.location(article_id)
+        if location is None:
+            return None
+        with self._lock:
+            return zlib.decompress(self._read(location))
+
+    def get_article(self, article_id):
+        data = self.get_article_bytes(article_id)
+        return json.loads(data) if data is not None else None
+
+    def get_image(self, rel_path):
+        """已归档图片的字节内容（rel_path 与文章 images 字段相同，如 full/xxx.jpg），未归档时返回 None"""
+        with self._lock:
+            self._reload()
+            location = self._images.get(Path(rel_path).as_posix())
+            return self._read(tuple(location)) if location else None
+
+
+def _stat_key(path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def read_article(article_id, data_dir=None, reader=None):
+    """读取文章 JSON：热数据 N_article.json 优先，否则从归档读取；都没有时返回 None"""
+    data_dir = Path(data_dir) if data_dir else get_data_dir()
+    article_file = data_dir / article_filename(article_id)
+    if article_file.exists():
+        with open(article_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if reader is not None:
+        return reader.get_article(article_id)
+    with ArchiveReader(data_dir) as reader:
+        return reader.get_article(article_id)
+
+
+def read_image(rel_path, data_dir=None, reader=None):
+    """读取图片字节：images/ 下的文件优先，否则从归档读取；都没有时返回 None"""
+    data_dir = Path(data_dir) if data_dir else get_data_dir()
+    image_file = data_dir / 'images' / rel_path
+    if image_file.exists():
+        return image_file.read_bytes()
+    if reader is not None:
+        return reader.get_image(rel_path)
+    with ArchiveReader(data_dir) as reader:
+        return reader.get_image(rel_path)
+
+
+def _article_images(article):
+    return {Path(p).as_posix() for p in (article or {}).get('images') or []}
+
+
+def _hot_images(store, cold_ids):
+    """热数据文章引用的图片（内容寻址，可能被多篇文章共用）"""
+    hot = set()
+    for article_id in store.article_ids() - cold_ids:
+        hot |= _article_images(store.get_article(article_id))
+    return hot
+
+
+def _load_indexes(archive_dir):
+    index_file = archive_dir / INDEX_FILE
+    index = bytearray(index_file.read_bytes() if index_file.exists() else INDEX_MAGIC)
+    images_file = archive_dir / IMAGES_INDEX_FILE
+    images = json.loads(images_file.read_text(encoding='utf-8')) if images_file.exists() else {}
+    return index, images
+
+
+def _unlink_unchanged(path, stat_key):
+    """文件自读取后没有被改写才删除（归档期间可能被复查更新重新写出）"""
+    stat = path.stat()
+    if (stat.st_mtime_ns, stat.st_size) == stat_key:
+        path.unlink()
+
+
+def compact(store, data_dir=None, older_than_days=DEFAULT_COLD_DAYS, now=None):
+    """把 scraped_at 早于 older_than_days 天、仍是散文件的文章（及只被它们引用的图片）打包成一个新段
+
+    返回 {'articles': 篇数, 'images': 张数, 'segment': 段文件名或 None, 'bytes_in': 原文件总字节, 'bytes_out': 段文件字节}
+    """
+    data_dir = Path(data_dir) if data_dir else get_data_dir()
+    archive_dir = data_dir / ARCHIVE_DIR
+    images_dir = data_dir / 'images'
+    cutoff = ((now or datetime.now()) - timedelta(days=older_than_days)).isoformat()
+
+    cold_ids = store.ids_scraped_before(cutoff)
+    cold = [(article_id, data_dir / article_filename(article_id)) for article_id in sorted(cold_ids)]
+    cold = [(article_id, path) for article_id, path in cold if path.exists()]
+    result = {'articles': 0, 'images': 0, 'segment': None, 'bytes_in': 0, 'bytes_out': 0}
+    if not cold:
+        return result
+
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    index, image_locations = _load_indexes(archive_dir)
+    existing = [int(p.stem.split('-')[1]) for p in archive_dir.glob('segment-*.seg')]
+    writer = SegmentWriter(archive_dir, max(existing, default=0) + 1)
+    locations = {}
+    packed_articles = {}
+    packed_images = {}
+    cold_images = set()
+    try:
+        for article_id, path in cold:
+            stat = path.stat()
+            raw = path.read_bytes()
+            locations[article_id] = writer.append(zlib.compress(raw, COMPRESS_LEVEL))
+            packed_articles[path] = (stat.st_mtime_ns, stat.st_size)
+            result['bytes_in'] += len(raw)
+            cold_images |= _article_images(json.loads(raw))
+
+        for rel_path in sorted(cold_images - _hot_images(store, cold_ids)):
+            image_file = images_dir / rel_path
+            if not image_file.exists():
+                continue
+            stat = image_file.stat()
+            data = image_file.read_bytes()
+            image_locations[rel_path] = list(writer.append(data))
+            packed_images[rel_path] = (stat.st_mtime_ns, stat.st_size)
+            result['bytes_in'] += len(data)
+        result['bytes_out'] = writer.offset
+        writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+
+    needed = len(INDEX_MAGIC) + (max(locations) + 1) * ENTRY.size
+    if len(index) < needed:
+        index.extend(bytes(needed - len(index)))
+    for article_id, location in locations.items():
+        ENTRY.pack_into(index, len(INDEX_MAGIC) + article_id * ENTRY.size, *location)
+    _write_atomic(archive_dir / INDEX_FILE, bytes(index))
+    _write_atomic(archive_dir / IMAGES_INDEX_FILE,
+                  json.dumps(image_locations, separators=(',', ':')).encode('utf-8'))
+
+    for path, stat_key in packed_articles.items():
+        _unlink_unchanged(path, stat_key)
+    # 归档期间新保存的文章可能引用了同一张图片
+    still_hot = _hot_images(store, store.ids_scraped_before(cutoff))
+    for rel_path, stat_key in packed_images.items():
+        if rel_path not in still_hot:
+            _unlink_unchanged(images_dir / rel_path, stat_key)
+
+    result.update(articles=len(locations), images=len(packed_images), segment=writer.path.name)
+    return result
+
+
+def main(argv=None):
+    from hku_scraper.store import open_store
+
+    argv = sys.argv[1:] if argv is None else argv
+    data_dir = get_data_dir()
+    if argv and argv[0] == 'compact':
+        days = float(argv[1]) if len(argv) > 1 else DEFAULT_COLD_DAYS
+        store = open_store(data_dir)
+        try:
+            result = compact(store, data_dir, days)
+        finally:
+            store.close()
+        if result['segment'] is None:
+            print(f'[Archive] 没有早于 {days:g} 天的散文件文章')
+        else:
+            print(f'[Archive] 已归档 {result["articles"]} 篇文章、{result["images"]} 张图片 -> '
+                  f'{result["segment"]}（{result["bytes_in"]} -> {result["bytes_out"]} 字节）')
+        return 0
+    if len(argv) == 2 and argv[0] == 'show':
+        article = read_article(int(argv[1]), data_dir)
+        if article is None:
+            print(f'[Archive] 文章 {argv[1]} 不存在')
+            return 1
+        print(json.dumps(article, ensure_ascii=False, indent=2))
+        return 0
+    print('用法: python -m hku_scraper.archive compact [天数]\n'
+          '      python -m hku_scraper.archive show <文章id>')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""
+多实例协调
+在多台主机上同时运行 runner（冗余部署）时，各实例通过共享的协调后端分工，避免重复抓取与重复推送：
+
+- 站点租约：每个实例按“站点总数 / 存活实例数”（向上取整）的份额租用站点，只抓取自己持有租约的站点；
+  持有者每次运行时续约，实例退出后租约到期（COORDINATION_LEASE_SECS）由其他实例接手；
+  新实例加入后份额变小，持有者续约时放弃超出份额的站点，实例越多每个实例负责的站点越少
+- 共享 URL 集合：详情页请求前先认领（claim_urls），已被其他实例认领或已保存的 URL 不再抓取；
+  保存后标记为 done。认领超过 COORDINATION_CLAIM_SECS 仍未完成（实例中途退出）的可被其他实例重新认领
+- 推送认领：同一篇文章（或同一次修改）只有先认领的实例推送，其他实例跳过
+
+后端可替换：open_coordinator 按 URL 的 scheme 从 BACKENDS 选择实现，新后端实现 Coordinator 的方法即可。
+目前提供 sqlite（sqlite:///共享卷/coordination.db）：
+
+- 共享卷（SMB/NFS）不支持 WAL 所需的共享内存，这里使用 rollback journal（journal_mode=DELETE）
+- 每个操作在 <数据库>.lock 的文件锁（fcntl / msvcrt）内以 BEGIN IMMEDIATE 事务执行，不依赖网络文件系统上
+  SQLite 自身的锁是否可靠；操作都很小（一页的 URL 一个事务），锁只持有几毫秒
+
+在 settings.py 中设置 COORDINATION_URL 即启用（各实例指向同一个文件），不设置时与单实例行为相同。
+"""
+
+import os
+import math
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+# 站点租约时长：应大于自适应调度的最长间隔加一次爬取的时间，持有者才能在到期前续约
+DEFAULT_LEASE_SECS = 6 * 3600
+# URL 认领多久未完成视为实例已退出
+DEFAULT_CLAIM_SECS = 3600
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS instances (
+    id TEXT PRIMARY KEY,
+    seen_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    resource TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_owner ON leases (owner, expires_at);
+CREATE TABLE IF NOT EXISTS seen_urls (
+    url TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'claimed',
+    claimed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    claimed_at REAL NOT NULL
+);
+'''
+
+
+class Coordinator:
+    """协调后端接口；instance_id 标识本实例（默认主机名），同一主机运行多个实例时需各自指定"""
+
+    def __init__(self, instance_id=None, lease_secs=DEFAULT_LEASE_SECS, claim_secs=DEFAULT_CLAIM_SECS):
+        self.instance_id = instance_id or socket.gethostname()
+        self.lease_secs = lease_secs
+        self.claim_secs = claim_secs
+
+    def acquire_sites(self, names, total):
+        """为本次运行租用站点，返回本实例负责的站点名列表
+
+        names 为本次要抓取的站点，total 为参与分工的站点总数（计算每个实例的份额）。
+        """
+        raise NotImplementedError
+
+    def release_sites(self, names):
+        """主动放弃站点租约（实例下线）"""
+        raise NotImplementedError
+
+    def claim_urls(self, urls):
+        """认领详情页 URL，返回本实例可以抓取的 URL 集合"""
+        raise NotImplementedError
+
+    def mark_done(self, urls):
+        """这些 URL 的文章已保存，任何实例都不再抓取"""
+        raise NotImplementedError
+
+    def claim_delivery(self, key):
+        """认领一次推送，返回本实例是否负责推送（本实例此前已认领的同样返回 True）"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileLock:
+    """跨进程、跨主机的排他文件锁（POSIX 记录锁，NFS 经 lockd 支持；Windows 使用 msvcrt）"""
+
+    def __init__(self, path):
+        self.file = open(path, 'a+b')
+
+    def __enter__(self):
+        if os.name == 'nt':
+            import msvcrt
+
+            self.file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK 自身重试 10 秒后才抛出 OSError
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            import fcntl
+
+            fcntl.lockf(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == 'nt':
+            import msvcrt
+
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.lockf(self.file.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteCoordinator(Coordinator):
+    """共享卷上的 SQLite 协调后端"""
+
+    def __init__(self, db_file, instance_id=None, lease_secs=DEFAULT_LEASE_SECS, claim_secs=DEFAULT_CLAIM_SECS,
+                 clock=time.time):
+        super().__init__(instance_id, lease_secs, claim_secs)
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._file_lock = FileLock(self.db_file.with_name(self.db_file.name + '.lock'))
+        self.conn = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        with self._lock, self._file_lock:
+            self.conn.execute('PRAGMA journal_mode=DELETE')
+            self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """线程锁 + 文件锁 + BEGIN IMMEDIATE，出错时回滚"""
+        with self._lock, self._file_lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+                self._file_lock.close()
+
+    def _live_instances(self, now):
+        """最近一个租约周期内运行过的实例数（至少为 1，即本实例）"""
+        row = self.conn.execute('SELECT COUNT(*) FROM instances WHERE seen_at > ? AND id != ?',
+                                (now - self.lease_secs, self.instance_id)).fetchone()
+        return row[0] + 1
+
+    def acquire_sites(self, names, total):
+        names = list(names)
+        acquired = []
+        with self._transaction():
+            now = self.clock()
+            self.conn.execute('INSERT OR REPLACE INTO instances (id, seen_at) VALUES (?, ?)',
+                              (self.instance_id, now))
+            share = math.ceil(max(total, len(names)) / self._live_instances(now))
+            held = {row['resource'] for row in self.conn.execute(
+                'SELECT resource FROM leases WHERE owner = ? AND expires_at > ?', (self.instance_id, now))}
+            for name in names:
+                resource = f'site:{name}'
+                row = self.conn.execute('SELECT owner, expires_at FROM leases WHERE resource = ?',
+                                        (resource,)).fetchone()
+                if row is not None and row['owner'] != self.instance_id and row['expires_at'] > now:
+                    continue
+                if resource in held and len(held) > share:
+                    # 份额变小（有新实例加入）：放弃超出份额的站点，留给其他实例
+                    self.conn.execute('DELETE FROM leases WHERE resource = ?', (resource,))
+                    held.discard(resource)
+                    continue
+                if resource not in held and len(held) >= share:
+                    continue
+                self.conn.execute('INSERT OR REPLACE INTO leases (resource, owner, expires_at) VALUES (?, ?, ?)',
+                                  (resource, self.instance_id, now + self.lease_secs))
+                held.add(resource)
+                acquired.append(name)
+        return acquired
+
+    def release_sites(self, names):
+        with self._transaction():
+            self.conn.executemany('DELETE FROM leases WHERE resource = ? AND owner = ?',
+                                  [(f'site:{name}', self.instance_id) for name in names])
+
+    def claim_urls(self, urls):
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return set()
+        with self._transaction():
+            now = self.clock()
+            # 新 URL 直接认领；本实例已认领的刷新时间；其他实例认领已过期的转给本实例
+            self.conn.executemany(
+                '''INSERT INTO seen_urls (url, owner, claimed_at) VALUES (?, ?, ?)
+                   ON CONFLICT (url) DO UPDATE SET owner = excluded.owner, claimed_at = excluded.claimed_at
+                   WHERE state = 'claimed' AND (owner = excluded.owner OR claimed_at < ?)''',
+                [(url, self.instance_id, now, now - self.claim_secs) for url in urls])
+            marks = ', '.join('?' * len(urls))
+            rows = self.conn.execute(
+                f"SELECT url FROM seen_urls WHERE url IN ({marks}) AND owner = ? AND state = 'claimed'",
+                (*urls, self.instance_id)).fetchall()
+        return {row['url'] for row in rows}
+
+    def mark_done(self, urls):
+        with self._transaction():
+            now = self.clock()
+            self.conn.executemany(
+                '''INSERT INTO seen_urls (url, owner, state, claimed_at) VALUES (?, ?, 'done', ?)
+                   ON CONFLICT (url) DO UPDATE SET state = 'done' ''',
+                [(url, self.instance_id, now) for url in urls])
+
+    def claim_delivery(self, key):
+        with self._transaction():
+            self.conn.execute('INSERT OR IGNORE INTO deliveries (key, owner, claimed_at) VALUES (?, ?, ?)',
+                              (key, self.instance_id, self.clock()))
+            row = self.conn.execute('SELECT owner FROM deliveries WHERE key = ?', (key,)).fetchone()
+        return row['owner'] == self.instance_id
+
+
+BACKENDS = {
+    'sqlite': SqliteCoordinator,
+}
+
+
+def open_coordinator(url, instance_id=None, lease_secs=DEFAULT_LEASE_SECS, claim_secs=DEFAULT_CLAIM_SECS):
+    """按 URL 打开协调后端，如 sqlite:///mnt/shared/coordination.db 或 sqlite:///Z:/shared/coordination.db
+
+    :// 之后的部分交给后端解释（sqlite 为文件路径）。
+    """
+    scheme, sep, location = url.partition('://')
+    if not sep or scheme not in BACKENDS:
+        raise ValueError(f'不支持的协调后端 {url!r}，可选: {", ".join(f"{s}://" for s in BACKENDS)}')
+    if len(location) > 2 and location[0] == '/' and location[2] == ':':
+        # Windows 盘符路径 /Z:/shared/...
+        location = location[1:]
+    return BACKENDS[scheme](location, instance_id=instance_id, lease_secs=lease_secs, claim_secs=claim_secs)
@@ -0,0 +1,483 @@
+"""
+企业微信机器人投递
+SaveJsonPipeline 只把消息写入磁盘上的发件箱（outbox.db），由后台线程负责发送，
+爬虫吞吐不再受 webhook 延迟影响；未发送成功的消息在重启后继续投递。
+
+- 后台线程使用 requests.Session（keep-alive 连接池）
+- 可配置多个机器人（config/wechat.json 的 webhookUrls）：同一条消息只序列化一次，按地址各写一份；
+  每个机器人单独令牌桶限速，默认 20 条/分钟（企业微信群机器人的限制），一个被限流不影响其他
+- 同一条消息发往多个机器人时，请求体（图片的 base64 编码）只构建一次
+- digest 模式下新文章先进入 digest_items，按爬取或时间窗口合并成摘要消息（hku_scraper.digest）再入队
+- 失败按指数退避重试，超过次数标记为 dead
+- 同一篇文章发往同一机器人的消息按顺序发送：前一条未成功前，后续消息不会发出
+- 入队按 dedupe_key 去重：中断后重复入队同一版本的文章不会产生第二份消息
+- 发送前先把消息标记为 sending；进程在请求途中退出时无法确认是否已送达，
+  下次打开发件箱时标记为 unknown 不再自动重发（宁可少发一条，也不重复推送）
+
+手动投递积压的消息（同时合并尚未发出的摘要）:
+    python -m hku_scraper.delivery flush
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hku_scraper.digest import pack_digest
+from hku_scraper.metrics import stage_timer
+from hku_scraper.utils import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = Path(__file__).parent.parent / 'config' / 'wechat.json'
+
+# 企业微信群机器人：每个机器人每分钟最多 20 条消息
+DEFAULT_RATE_PER_MINUTE = 20
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_MAX = 600.0
+# errcode 45009: 接口调用超过限制
+RATE_LIMITED_ERRCODE = 45009
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    article_key TEXT NOT NULL,
+    webhook TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_pending ON messages (status, article_key, id);
+CREATE TABLE IF NOT EXISTS digest_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedupe_key TEXT UNIQUE,
+    title TEXT,
+    url TEXT,
+    summary TEXT,
+    created_at REAL NOT NULL,
+    flushed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_digest_pending ON digest_items (flushed_at, id);
+'''
+
+# 旧版发件箱缺少的列，打开时补上
+EXTRA_COLUMNS = (
+    ('dedupe_key', 'TEXT'),
+    ('claimed_at', 'REAL'),
+)
+
+# sending 状态超过该秒数（远大于请求超时）仍未完成，视为发送进程已中断
+STALE_SENDING_SECS = 120
+
+# 投递线程缓存最近构建的请求体条数（图片消息的 base64 较大，只需覆盖一条消息的多个机器人）
+PAYLOAD_CACHE_SIZE = 4
+
+
+def load_webhook_urls():
+    """读取全部 webhook（去重、保持顺序）
+
+    优先 config/wechat.json 的 webhookUrl 与 webhookUrls（列表），其次环境变量 WECHAT_WEBHOOK（逗号分隔）。
+    """
+    urls = []
+    if CONFIG_FILE.exists():
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            urls = [config.get('webhookUrl'), *(config.get('webhookUrls') or [])]
+        except Exception as e:
+            logger.warning(f'[WeChat] 读取 {CONFIG_FILE} 失败: {e}')
+    urls = [url for url in urls if url]
+    if not urls:
+        urls = [url.strip() for url in os.getenv('WECHAT_WEBHOOK', '').split(',') if url.strip()]
+    return list(dict.fromkeys(urls))
+
+
+def build_payload(message):
+    """把发件箱中的消息转换成 webhook 请求体
+
+    图片消息只在发件箱中保存文件路径（和图片管道预先算好的 MD5），
+    发送时才读取并编码，避免数据库膨胀。
+    """
+    if message.get('msgtype') == 'image' and 'image_file' in message:
+        with open(message['image_file'], 'rb') as f:
+            img_data = f.read()
+        return {
+            'msgtype': 'image',
+            'image': {
+                'base64': base64.b64encode(img_data).decode('utf-8'),
+                'md5': message.get('md5') or hashlib.md5(img_data).hexdigest(),
+            },
+        }
+    return message
+
+
+class Outbox:
+    """磁盘发件箱（SQLite WAL），可被爬虫线程与投递线程同时使用"""
+
+    def __init__(self, db_file=None):
+        self.db_file = Path(db_file) if db_file else get_data_dir() / 'outbox.db'
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(messages)')}
+        for name, kind in EXTRA_COLUMNS:
+            if name not in columns:
+                self.conn.execute(f'ALTER TABLE messages ADD COLUMN {name} {kind}')
+        self.conn.execute('DROP INDEX IF EXISTS idx_messages_dedupe')
+        self.conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_webhook_dedupe '
+                          'ON messages (webhook, dedupe_key)')
+        self.conn.commit()
+        interrupted = self.recover_interrupted()
+        if interrupted:
+            logger.error(f'[WeChat] {interrupted} 条消息发送途中进程退出，无法确认是否送达，标记为 unknown 不再重发')
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def enqueue(self, article_key, webhook, messages, dedupe_key=None):
+        """在一个事务中写入一篇文章的全部消息，保持顺序，返回新写入的条数
+
+        webhook 为一个地址或地址列表，每条消息只序列化一次，按地址各写一份；
+        dedupe_key 标识文章的一个版本：同一 dedupe_key 已发往某个地址时不再写入。
+        """
+        with self._lock:
+            with self.conn:
+                return self._insert_messages(article_key, webhook, messages, dedupe_key)
+
+    def _insert_messages(self, article_key, webhook, messages, dedupe_key):
+        webhooks = [webhook] if isinstance(webhook, str) else list(webhook)
+        now = time.time()
+        payloads = [json.dumps(m, ensure_ascii=False) for m in messages]
+        keys = [None if dedupe_key is None else f'{dedupe_key}#{i}' for i in range(len(messages))]
+        before = self.conn.total_changes
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO messages (article_key, webhook, payload, created_at, dedupe_key) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(article_key, url, payload, now, key) for url in webhooks for payload, key in zip(payloads, keys)],
+        )
+        return self.conn.total_changes - before
+
+    def add_to_digest(self, title, url, summary, dedupe_key=None):
+        """把一篇文章加入待合并的摘要，返回是否新加入（同一 dedupe_key 只加入一次）"""
+        with self._lock:
+            with self.conn:
+                return self.conn.execute(
+                    'INSERT OR IGNORE INTO digest_items (dedupe_key, title, url, summary, created_at) '
+                    'VALUES (?, ?, ?, ?, ?)', (dedupe_key, title, url, summary, time.time())).rowcount == 1
+
+    def digest_pending(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM digest_items WHERE flushed_at IS NULL').fetchone()[0]
+
+    def flush_digest(self, webhooks, older_than=0, now=None):
+        """把待合并的文章打包成摘要消息发往 webhooks，返回合并的篇数
+
+        最早一篇加入不足 older_than 秒时不合并（时间窗口未到）。打包、入队与标记在同一个事务中完成，
+        已合并的条目保留 dedupe_key，中断后补做的文章不会再次进入摘要。
+        """
+        if not webhooks:
+            return 0
+        now = time.time() if now is None else now
+        with self._lock:
+            with self.conn:
+                # 多个爬虫进程共用发件箱：先取得写锁，同一批文章只会被一个进程合并
+                self.conn.execute('BEGIN IMMEDIATE')
+                rows = self.conn.execute(
+                    'SELECT id, title, url, summary, created_at FROM digest_items '
+                    'WHERE flushed_at IS NULL ORDER BY id').fetchall()
+                if not rows or rows[0]['created_at'] > now - older_than:
+                    return 0
+                key = f'digest:{rows[0]["id"]}-{rows[-1]["id"]}'
+                messages = [{'msgtype': 'markdown', 'markdown': {'content': content}}
+                            for content in pack_digest([dict(row) for row in rows])]
+                self._insert_messages(key, webhooks, messages, key)
+                self.conn.execute('UPDATE digest_items SET flushed_at = ? WHERE flushed_at IS NULL AND id <= ?',
+                                  (now, rows[-1]['id']))
+        logger.info(f'[WeChat] {len(rows)} 篇文章合并为 {len(messages)} 条摘要消息')
+        return len(rows)
+
+    def due(self, limit=20, now=None):
+        """取出可发送的消息：每篇文章发往每个地址只取最早一条未完成的消息"""
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self.conn.execute(
+                '''SELECT * FROM messages m
+                   WHERE m.status = 'pending' AND m.next_attempt_at <= ?
+                     AND NOT EXISTS (
+                         SELECT 1 FROM messages p
+                         WHERE p.article_key = m.article_key AND p.webhook = m.webhook
+                           AND p.status IN ('pending', 'sending') AND p.id < m.id)
+                   ORDER BY m.id LIMIT ?''',
+                (now, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def pending_count(self):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE status = 'pending'").fetchone()[0]
+
+    def next_wakeup(self):
+        """最早一条可发送消息的时间（只看每篇文章的第一条），没有待发送消息时返回 None"""
+        with self._lock:
+            row = self.conn.execute(
+                '''SELECT MIN(m.next_attempt_at) FROM messages m
+                   WHERE m.status = 'pending'
+                     AND NOT EXISTS (
+                         SELECT 1 FROM messages p
+                         WHERE p.article_key = m.article_key AND p.webhook = m.webhook
+                           AND p.status IN ('pending', 'sending') AND p.id < m.id)'''
+            ).fetchone()
+        return row[0]
+
+    def claim(self, message_id):
+        """发送前标记为 sending（提交后才发请求）"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute("UPDATE messages SET status = 'sending', claimed_at = ? WHERE id = ?",
+                                  (time.time(), message_id))
+
+    def recover_interrupted(self, stale_after=STALE_SENDING_SECS, now=None):
+        """长时间停在 sending 的消息（发送进程已退出）标记为 unknown，返回条数"""
+        now = time.time() if now is None else now
+        with self._lock:
+            with self.conn:
+                return self.conn.execute(
+                    "UPDATE messages SET status = 'unknown', last_error = 'interrupted while sending' "
+                    "WHERE status = 'sending' AND claimed_at < ?", (now - stale_after,)).rowcount
+
+    def mark_sent(self, message_id):
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "UPDATE messages SET status = 'sent', attempts = attempts + 1, last_error = NULL "
+                    "WHERE id = ?", (message_id,))
+
+    def mark_failed(self, message_id, error, retry_at=None):
+        """记录失败；retry_at 为 None 时标记为 dead 不再重试"""
+        with self._lock:
+            with self.conn:
+                if retry_at is None:
+                    self.conn.execute(
+                        "UPDATE messages SET status = 'dead', attempts = attempts + 1, last_error = ? "
+                        "WHERE id = ?", (error, message_id))
+                else:
+                    self.conn.execute(
+                        "UPDATE messages SET status = 'pending', attempts = attempts + 1, last_error = ?, "
+                        'next_attempt_at = ? WHERE id = ?', (error, retry_at, message_id))
+
+
+class TokenBucket:
+    """令牌桶限速（线程安全）"""
+
+    def __init__(self, rate_per_minute=DEFAULT_RATE_PER_MINUTE, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.clock = clock
+        self.tokens = float(self.capacity)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        """有令牌时取走并返回 0，否则返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def penalize(self):
+        """被服务端限流时清空令牌，下一条消息要等新令牌"""
+        with self._lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class DeliveryWorker(threading.Thread):
+    """后台投递线程：从发件箱取消息，限速发送，失败退避重试"""
+
+    def __init__(self, outbox, session=None, bucket=None, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX, timeout=10,
+                 metrics=None, rate_per_minute=DEFAULT_RATE_PER_MINUTE):
+        super().__init__(name='wechat-delivery', daemon=True)
+        self.outbox = outbox
+        self.session = session or self._make_session()
+        # 每个 webhook 一个令牌桶；传入 bucket 时所有地址共用它
+        self.bucket = bucket
+        self.rate_per_minute = rate_per_minute
+        self.buckets = {}
+        self._payloads = OrderedDict()
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        # hku_scraper.metrics.StageMetrics，记录 webhook 请求耗时与发送结果
+        self.metrics = metrics
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._drain_deadline = None
+
+    @staticmethod
+    def _make_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def notify(self):
+        """有新消息入队时唤醒线程"""
+        self._wakeup.set()
+
+    def stop(self, drain_timeout=0):
+        """停止线程；drain_timeout 秒内尽量把已到期的消息发完，剩余消息留在发件箱"""
+        self._drain_deadline = time.monotonic() + drain_timeout
+        self._stopping.set()
+        self._wakeup.set()
+        self.join()
+        self.session.close()
+
+    def bucket_for(self, webhook):
+        if self.bucket is not None:
+            return self.bucket
+        if webhook not in self.buckets:
+            self.buckets[webhook] = TokenBucket(self.rate_per_minute)
+        return self.buckets[webhook]
+
+    def _payload(self, message):
+        """构建请求体；同一条消息发往多个地址时复用刚构建的结果"""
+        key = message['payload']
+        if key in self._payloads:
+            self._payloads.move_to_end(key)
+            return self._payloads[key]
+        payload = build_payload(json.loads(key))
+        self._payloads[key] = payload
+        if len(self._payloads) > PAYLOAD_CACHE_SIZE:
+            self._payloads.popitem(last=False)
+        return payload
+
+    def _retry_at(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        return time.time() + delay * random.uniform(0.8, 1.2)
+
+    def send_one(self, message):
+        """发送一条消息并更新发件箱状态，返回是否成功"""
+        try:
+            payload = self._payload(message)
+        except OSError as e:
+            # 图片文件已不存在，重试也无意义
+            self.outbox.mark_failed(message['id'], f'payload: {e}')
+            logger.error(f'[WeChat] 消息 {message["id"]} 无法构建，放弃: {e}')
+            return False
+
+        error = None
+        self.outbox.claim(message['id'])
+        try:
+            with stage_timer(self.metrics, 'wechat_send'):
+                resp = self.session.post(message['webhook'], json=payload, timeout=self.timeout)
+                result = resp.json()
+            if result.get('errcode') == 0:
+                self.outbox.mark_sent(message['id'])
+                self._count('wechat_sent')
+                logger.info(f'[WeChat] 已发送消息 {message["id"]} ({message["article_key"]})')
+                return True
+            if result.get('errcode') == RATE_LIMITED_ERRCODE:
+                self.bucket_for(message['webhook']).penalize()
+            error = f'errcode={result.get("errcode")} {result.get("errmsg")}'
+        except Exception as e:
+            error = str(e)
+
+        self._count('wechat_failed')
+        attempts = message['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self.outbox.mark_failed(message['id'], error)
+            logger.error(f'[WeChat] 消息 {message["id"]} 重试 {attempts} 次仍失败，放弃: {error}')
+        else:
+            self.outbox.mark_failed(message['id'], error, self._retry_at(message['attempts']))
+            logger.warning(f'[WeChat] 消息 {message["id"]} 发送失败，稍后重试: {error}')
+        return False
+
+    def _count(self, name):
+        if self.metrics is not None:
+            self.metrics.count(name)
+
+    def _should_exit(self):
+        if not self._stopping.is_set():
+            return False
+        return time.monotonic() >= self._drain_deadline
+
+    def run(self):
+        while not self._should_exit():
+            batch = self.outbox.due()
+            if not batch:
+                if self._stopping.is_set():
+                    # 已到期的消息发完了，剩下的是退避中的消息，留给下次运行
+                    break
+                next_at = self.outbox.next_wakeup()
+                wait = 30.0 if next_at is None else max(0.0, min(30.0, next_at - time.time()))
+                self._wakeup.wait(wait)
+                self._wakeup.clear()
+                continue
+            # 没有令牌的地址先跳过，其他地址的消息照常发送
+            waits = []
+            for message in batch:
+                wait = self.bucket_for(message['webhook']).try_acquire()
+                if wait > 0:
+                    waits.append(wait)
+                    continue
+                self.send_one(message)
+                if self._should_exit():
+                    return
+            if len(waits) == len(batch):
+                time.sleep(min(min(waits), 1.0))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'flush':
+        print('用法: python -m hku_scraper.delivery flush [最长等待秒数]')
+        return 1
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    drain_timeout = float(argv[1]) if len(argv) > 1 else 300
+    outbox = Outbox()
+    try:
+        outbox.flush_digest(load_webhook_urls())
+        worker = DeliveryWorker(outbox)
+        worker.start()
+        worker.stop(drain_timeout=drain_timeout)
+        print(f'[Flush] 剩余待发送 {outbox.pending_count()} 条')
+    finally:
+        outbox.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+企业微信摘要消息（digest 模式）
+逐篇推送时每篇文章是若干条 markdown 正文加每张图片一条图片消息，一次出现多篇新文章时
+webhook 调用会成倍增加并触发限流。digest 模式把一次爬取（或一个时间窗口）内的新文章
+合并成尽量少的 markdown 消息：每篇只有序号、标题链接和一句摘要，不带正文与图片。
+
+- 摘要取正文开头，按 UTF-8 字节截断（SUMMARY_BYTES），过长的标题同样截断
+- 条目按原顺序依次装入消息，装不下才开始下一条，每条消息不超过 MAX_SEGMENT_BYTES 字节
+"""
+
+from hku_scraper.segmenter import MAX_SEGMENT_BYTES, char_boundary, utf8_len
+
+# 摘要约 80 个汉字
+SUMMARY_BYTES = 240
+TITLE_BYTES = 300
+
+ELLIPSIS = '…'
+ENTRY_SEPARATOR = '\n\n'
+
+
+def truncate_bytes(text, max_bytes):
+    """把文本截断到 max_bytes 字节以内（按字符边界），截断时以省略号结尾"""
+    data = text.encode('utf-8')
+    if len(data) <= max_bytes:
+        return text
+    cut = char_boundary(data, max(0, max_bytes - utf8_len(ELLIPSIS)))
+    return data[:cut].decode('utf-8').rstrip() + ELLIPSIS
+
+
+def summarize(text, max_bytes=SUMMARY_BYTES):
+    """正文开头的一句摘要（空白折叠成单个空格）"""
+    return truncate_bytes(' '.join((text or '').split()), max_bytes)
+
+
+def _header(count):
+    return f'**新闻速递（{count} 篇）**'
+
+
+def _entry(number, item):
+    title = truncate_bytes(item.get('title') or '（无标题）', TITLE_BYTES)
+    entry = f'**{number}.** [{title}]({item.get("url") or ""})'
+    if item.get('summary'):
+        entry += f'\n> {item["summary"]}'
+    return entry
+
+
+def pack_digest(items, max_bytes=MAX_SEGMENT_BYTES):
+    """把文章条目 [{'title', 'url', 'summary'}] 装进尽量少的 markdown 消息，返回消息内容列表
+
+    序号跨消息连续；每条消息以“新闻速递（N 篇）”开头，N 为该条消息中的篇数。
+    """
+    if not items:
+        return []
+    # 表头按总篇数预留字节，各条消息的篇数不会超过它
+    budget = max_bytes - utf8_len(_header(len(items)))
+    groups = []
+    used = budget + 1
+    for number, item in enumerate(items, 1):
+        entry = _entry(number, item)
+        size = utf8_len(ENTRY_SEPARATOR) + utf8_len(entry)
+        if size > budget:
+            entry = truncate_bytes(entry, budget - utf8_len(ENTRY_SEPARATOR))
+            size = budget
+        if used + size > budget:
+            groups.append([])
+            used = 0
+        groups[-1].append(entry)
+        used += size
+    return [_header(len(group)) + ENTRY_SEPARATOR + ENTRY_SEPARATOR.join(group) for group in groups]
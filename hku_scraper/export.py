@@ -0,0 +1,294 @@
+"""
+HKU 文章批量导出
+从 articles.db 流式读取文章，写成 JSONL / Parquet / Excel，供分析使用；不读取 news_index.json 与 N_article.json，
+也不打开 ArticleStore（后者会把全部 URL 与指纹载入内存）。
+
+- 按 id 分批读取（每批 BATCH_SIZE 篇，keyset 翻页），生成器逐篇交给写入器，内存占用与文章总数无关
+- JSONL 每行一篇完整文章 JSON（另加 id）；Parquet 按 ROW_GROUP_SIZE 篇一个行组写出（zstd 压缩）；
+  Excel 使用 openpyxl 的 write-only 模式逐行写出，超过工作表行数上限时续写到新工作表
+- 可按抓取时间范围（scraped_at）与站点筛选；站点按 config/sites.json 的名称，匹配文章的 site 字段或
+  allowed_domains（hku_arts_news 爬虫保存的文章没有 site 字段）
+- 增量导出：每个导出名称在 articles.db 的 export_watermarks 表中记录已导出的最大 changed_seq，
+  下次只导出之后新增或被复查更新的文章；文件完整写出（临时文件改名）之后才推进水位，中途失败下次重新导出
+
+Parquet 需要 pyarrow，Excel 需要 openpyxl（pip install pyarrow openpyxl），只在导出对应格式时导入。
+
+用法:
+    python -m hku_scraper.export <jsonl|parquet|xlsx> <输出文件> [--from 日期] [--to 日期] [--site 站点] [--incremental 名称]
+"""
+
+import os
+import sys
+import json
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+from hku_scraper.scheduler import site_matcher
+from hku_scraper.sites import load_sites
+from hku_scraper.store import connect
+from hku_scraper.utils import get_data_dir
+
+FORMATS = ('jsonl', 'parquet', 'xlsx')
+BATCH_SIZE = 500
+ROW_GROUP_SIZE = 2000
+
+# Parquet / Excel 的列；JSONL 保留文章 JSON 的全部字段
+COLUMNS = ('id', 'title', 'url', 'site', 'scraped_at', 'status', 'duplicate_of', 'text', 'images')
+
+# Excel 单元格最多 32767 个字符，每个工作表最多 1048576 行（含表头）
+XLSX_CELL_LIMIT = 32767
+XLSX_MAX_ROWS = 1048576
+
+WATERMARK_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS export_watermarks (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    exported_at TEXT,
+    rows INTEGER
+);
+'''
+
+
+def _end_bound(value):
+    """--to 的上界：只给日期时包含当天（取次日零点之前），带时间时按原值包含"""
+    if len(value) == 10:
+        return '<', (date.fromisoformat(value) + timedelta(days=1)).isoformat()
+    datetime.fromisoformat(value)
+    return '<=', value
+
+
+def _site_filter(sites):
+    """文章属于 sites（站点定义列表）之一：site 字段为站点名，或 URL 属于站点域名"""
+    names = {site['name'] for site in sites}
+    matchers = [site_matcher(site) for site in sites]
+
+    def matches(article):
+        if article.get('site') in names:
+            return True
+        url = article.get('url') or ''
+        return any(match(url) for match in matchers)
+    return matches
+
+
+def iter_articles(conn, start=None, end=None, sites=None, after_seq=0, upto_seq=None, batch_size=BATCH_SIZE):
+    """按 id 顺序逐篇产出文章 dict（正文 JSON + id），每次只从数据库取 batch_size 篇
+
+    start / end 为 ISO 日期或时间（按 scraped_at 筛选，end 为日期时包含当天）；
+    sites 为站点定义列表（load_sites 的返回值）；after_seq < changed_seq <= upto_seq 用于增量导出。
+    """
+    where = ['id > ?', 'changed_seq > ?']
+    params = [after_seq]
+    if upto_seq is not None:
+        where.append('changed_seq <= ?')
+        params.append(upto_seq)
+    if start:
+        datetime.fromisoformat(start)
+        where.append('scraped_at >= ?')
+        params.append(start)
+    if end:
+        op, bound = _end_bound(end)
+        where.append(f'scraped_at {op} ?')
+        params.append(bound)
+    sql = f'SELECT id, body FROM articles WHERE {" AND ".join(where)} ORDER BY id LIMIT ?'
+    matches = _site_filter(sites) if sites else None
+
+    last_id = 0
+    while True:
+        rows = conn.execute(sql, (last_id, *params, batch_size)).fetchall()
+        for row in rows:
+            article = json.loads(row['body']) if row['body'] else {}
+            if matches is not None and not matches(article):
+                continue
+            yield {'id': row['id'], **article}
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def _cell(article, column):
+    value = article.get(column)
+    if column == 'images':
+        return [str(p) for p in value or []]
+    return value
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8', newline='\n')
+
+    def write(self, article):
+        self.file.write(json.dumps(article, ensure_ascii=False))
+        self.file.write('\n')
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+class ParquetWriter:
+    """攒满 row_group_size 篇写出一个行组，内存中最多保留一个行组"""
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()), ('title', pa.string()), ('url', pa.string()), ('site', pa.string()),
+            ('scraped_at', pa.string()), ('status', pa.string()), ('duplicate_of', pa.int64()),
+            ('text', pa.string()), ('images', pa.list_(pa.string())),
+        ])
+        self.writer = pq.ParquetWriter(str(path), self.schema, compression='zstd')
+        self.row_group_size = max(1, row_group_size)
+        self.rows = {column: [] for column in COLUMNS}
+        self.pending = 0
+
+    def write(self, article):
+        for column in COLUMNS:
+            self.rows[column].append(_cell(article, column))
+        self.pending += 1
+        if self.pending >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.writer.write_table(self.pa.Table.from_pydict(self.rows, schema=self.schema))
+            self.rows = {column: [] for column in COLUMNS}
+            self.pending = 0
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+class XlsxWriter:
+    """openpyxl write-only 模式：行写出后不再保留在内存中"""
+
+    def __init__(self, path):
+        from openpyxl import Workbook
+        from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+        self.path = path
+        self.illegal = ILLEGAL_CHARACTERS_RE
+        self.workbook = Workbook(write_only=True)
+        self.sheets = 0
+        self._new_sheet()
+
+    def _new_sheet(self):
+        self.sheets += 1
+        self.sheet = self.workbook.create_sheet('articles' if self.sheets == 1 else f'articles_{self.sheets}')
+        self.sheet.append(list(COLUMNS))
+        self.sheet_rows = 1
+
+    def _value(self, value):
+        if isinstance(value, list):
+            value = '\n'.join(value)
+        if isinstance(value, str):
+            # 控制字符无法写入 xlsx；超长正文截断到单元格上限
+            value = self.illegal.sub('', value)[:XLSX_CELL_LIMIT]
+        return value
+
+    def write(self, article):
+        if self.sheet_rows >= XLSX_MAX_ROWS:
+            self._new_sheet()
+        self.sheet.append([self._value(_cell(article, column)) for column in COLUMNS])
+        self.sheet_rows += 1
+
+    def close(self):
+        self.workbook.save(str(self.path))
+
+
+def open_writer(fmt, path, row_group_size=ROW_GROUP_SIZE):
+    if fmt == 'jsonl':
+        return JsonlWriter(path)
+    if fmt == 'parquet':
+        return ParquetWriter(path, row_group_size)
+    if fmt == 'xlsx':
+        return XlsxWriter(path)
+    raise ValueError(f'未知的导出格式 {fmt!r}，可选: {", ".join(FORMATS)}')
+
+
+def get_watermark(conn, name):
+    conn.executescript(WATERMARK_SCHEMA)
+    row = conn.execute('SELECT seq FROM export_watermarks WHERE name = ?', (name,)).fetchone()
+    return row['seq'] if row else 0
+
+
+def export(fmt, output, data_dir=None, start=None, end=None, sites=None, incremental=None,
+           row_group_size=ROW_GROUP_SIZE, batch_size=BATCH_SIZE, sites_file=None):
+    """导出文章，返回 {'rows': 篇数, 'output': 文件路径, 'since': 起始水位, 'watermark': 本次水位}
+
+    sites 为站点名列表；incremental 为导出名称时只导出该名称上次水位之后变化的文章，成功后推进水位
+    （同一名称应使用相同的筛选条件）；没有变化时仍写出空文件。
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'未知的导出格式 {fmt!r}，可选: {", ".join(FORMATS)}')
+    site_defs = load_sites(sites_file, names=sites) if sites else None
+    data_dir = Path(data_dir) if data_dir else get_data_dir()
+    output = Path(output)
+    conn = connect(data_dir / 'articles.db')
+    try:
+        since = get_watermark(conn, incremental) if incremental else 0
+        # 导出开始时的最大序号；导出期间新保存的文章留给下一次
+        watermark = conn.execute('SELECT COALESCE(MAX(changed_seq), 0) FROM articles').fetchone()[0]
+
+        output.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = output.with_name(output.name + '.tmp')
+        rows = 0
+        writer = open_writer(fmt, tmp_file, row_group_size)
+        try:
+            for article in iter_articles(conn, start, end, site_defs, since, watermark, batch_size):
+                writer.write(article)
+                rows += 1
+            writer.close()
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_file, output)
+
+        if incremental:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO export_watermarks (name, seq, exported_at, rows) VALUES (?, ?, ?, ?)',
+                    (incremental, watermark, datetime.now().isoformat(), rows))
+    finally:
+        conn.close()
+    return {'rows': rows, 'output': output, 'since': since, 'watermark': watermark}
+
+
+USAGE = ('用法: python -m hku_scraper.export <jsonl|parquet|xlsx> <输出文件> '
+         '[--from 日期] [--to 日期] [--site 站点] [--incremental 名称]')
+OPTIONS = {'--from': 'start', '--to': 'end', '--site': 'sites', '--incremental': 'incremental'}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in FORMATS or len(argv) % 2:
+        print(USAGE)
+        return 1
+    fmt, output = argv[0], argv[1]
+    options = {'sites': []}
+    for flag, value in zip(argv[2::2], argv[3::2]):
+        if flag not in OPTIONS:
+            print(USAGE)
+            return 1
+        if flag == '--site':
+            options['sites'].extend(v for v in value.split(',') if v)
+        else:
+            options[OPTIONS[flag]] = value
+    try:
+        result = export(fmt, output, **options)
+    except ImportError as e:
+        print(f'[Export] 导出 {fmt} 需要安装 {e.name}: pip install {e.name}')
+        return 1
+    except ValueError as e:
+        print(f'[Export] {e}')
+        return 1
+    since = f'（序号 {result["since"]} 之后）' if options.get('incremental') else ''
+    print(f'[Export] 已导出 {result["rows"]} 篇文章{since} -> {result["output"]}，水位 {result["watermark"]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
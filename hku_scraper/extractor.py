@@ -0,0 +1,134 @@
+"""
+文章详情页提取
+对正文容器的 lxml 树只遍历一次，同时收集文本与图片链接：
+
+- 容器选择器（CSS）预编译为 XPath 并缓存，每个站点只编译一次
+- 跳过 script / style / noscript / template 等不可见内容，注释只保留其后的文本
+- 文本按空白切词后拼接（与旧版 ' '.join(...).split() 的结果一致），
+  文本达到上限且图片数达到上限后立即停止遍历，不再读取剩余节点
+
+prepare_article() 从 HTML 文本完成解析、提取与内容指纹，只依赖可 pickle 的参数，
+可以在进程池中执行（hku_scraper.offload）。
+"""
+
+import time
+from functools import lru_cache
+from urllib.parse import urljoin
+
+from cssselect import GenericTranslator
+from lxml import etree
+from parsel import Selector
+
+from hku_scraper.fingerprint import simhash
+
+DEFAULT_TEXT_LIMIT = 5000
+DEFAULT_IMAGE_LIMIT = 10
+
+SKIP_TAGS = frozenset({'script', 'style', 'noscript', 'template'})
+IMAGE_ATTRS = ('src', 'data-src')
+
+
+@lru_cache(maxsize=64)
+def compile_selector(css):
+    """CSS 选择器 -> 预编译的 lxml XPath"""
+    return etree.XPath(GenericTranslator().css_to_xpath(css))
+
+
+def _containers(root, css):
+    """匹配的容器；嵌套在另一个匹配容器内的不再单独遍历，避免文本重复"""
+    matches = compile_selector(css)(root)
+    seen = set(matches)
+    return [node for node in matches if not any(a in seen for a in node.iterancestors())]
+
+
+class _Collector:
+    """遍历过程中的累积状态"""
+
+    def __init__(self, base_url, text_limit, image_limit):
+        self.base_url = base_url
+        self.text_limit = text_limit
+        self.image_limit = image_limit
+        self.words = []
+        # 已收集文本拼接后的长度（含词间空格）
+        self.text_len = -1
+        self.images = []
+
+    @property
+    def text_full(self):
+        return self.text_len >= self.text_limit
+
+    @property
+    def done(self):
+        return self.text_full and len(self.images) >= self.image_limit
+
+    def add_text(self, text):
+        if self.text_full or not text:
+            return
+        for word in text.split():
+            self.words.append(word)
+            self.text_len += len(word) + 1
+            if self.text_full:
+                return
+
+    def add_image(self, element):
+        for attr in IMAGE_ATTRS:
+            if len(self.images) >= self.image_limit:
+                return
+            value = element.get(attr)
+            if value and value.strip():
+                self.images.append(urljoin(self.base_url, value.strip()))
+
+    def text(self):
+        return ' '.join(self.words)[:self.text_limit]
+
+
+def _walk(container, collector):
+    # 栈中放元素或待输出的 tail 文本，按文档顺序处理
+    stack = [container]
+    while stack and not collector.done:
+        node = stack.pop()
+        if isinstance(node, str):
+            collector.add_text(node)
+            continue
+        tag = node.tag
+        if node is not container and node.tail:
+            stack.append(node.tail)
+        if not isinstance(tag, str):
+            # 注释 / 处理指令：只保留 tail
+            continue
+        tag = tag.lower()
+        if tag in SKIP_TAGS:
+            continue
+        if tag == 'img':
+            collector.add_image(node)
+        collector.add_text(node.text)
+        stack.extend(reversed(node))
+
+
+def extract_article(root, base_url, container_css,
+                    text_limit=DEFAULT_TEXT_LIMIT, image_limit=DEFAULT_IMAGE_LIMIT):
+    """从详情页 lxml 根节点提取 (正文文本, 图片 URL 列表)
+
+    文本截断到 text_limit 字符，图片最多 image_limit 个（src 与 data-src 都算，按文档顺序）。
+    """
+    collector = _Collector(base_url, text_limit, image_limit)
+    for container in _containers(root, container_css):
+        _walk(container, collector)
+        if collector.done:
+            break
+    return collector.text(), collector.images
+
+
+def prepare_article(html, base_url, container_css,
+                    text_limit=DEFAULT_TEXT_LIMIT, image_limit=DEFAULT_IMAGE_LIMIT, encoding='utf-8'):
+    """解析详情页 HTML 并提取，返回 (正文文本, 图片 URL 列表, SimHash 指纹, 耗时秒数)
+
+    html 可以是原始响应字节（按 encoding 解码），爬虫不必先生成一份解码后的字符串副本。
+    """
+    started = time.perf_counter()
+    if isinstance(html, bytes):
+        root = Selector(body=html, encoding=encoding, type='html', base_url=base_url).root
+    else:
+        root = Selector(text=html, type='html', base_url=base_url).root
+    text, images = extract_article(root, base_url, container_css, text_limit, image_limit)
+    return text, images, simhash(text), time.perf_counter() - started
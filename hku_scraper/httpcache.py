@@ -0,0 +1,305 @@
+"""
+HKU HTTP 缓存：按页面类型区分的缓存策略 + 压缩、限容量的 SQLite 缓存存储
+
+策略（RevalidatingPolicy）:
+- 列表页（meta['httpcache_revalidate']）每次都带 If-None-Match / If-Modified-Since 回源验证，
+  304 时使用缓存内容，不会因为缓存过期时间与轮询间隔对不上而漏掉新闻
+- 详情页与图片发布后不再变化，命中缓存直接使用，不访问网络（文章修改由 --revalidate 的条件请求负责）
+- 只缓存 200 响应，Cache-Control: no-store 的响应不缓存；回源时服务器 5xx 或网络错误仍返回缓存内容
+
+存储（CompressedLRUStorage）:
+- 所有响应保存在 HTTPCACHE_DIR/responses.db（SQLite WAL）一张表中，文本类正文 zlib 压缩，
+  图片等已压缩的内容（或服务器已 gzip 的正文）原样保存
+- 按最近访问时间做 LRU：总大小超过 HTTPCACHE_MAX_BYTES 时在后台线程淘汰最久未访问的条目，
+  直到降到 HTTPCACHE_PRUNE_RATIO 倍，并用 incremental_vacuum 把空闲页还给文件系统
+- 读取时只在内存记录访问时间，写入/淘汰前批量落盘，命中缓存不产生额外写入
+
+查看与手动淘汰:
+    python -m hku_scraper.httpcache stats
+    python -m hku_scraper.httpcache prune [MB]
+"""
+
+import sys
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+
+from scrapy.extensions.httpcache import DummyPolicy, parse_cachecontrol
+from scrapy.http.headers import Headers
+from scrapy.utils.project import data_path
+from scrapy.utils.response import response_from_dict
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+logger = logging.getLogger(__name__)
+
+CACHE_DB = 'responses.db'
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 淘汰到上限的多少倍为止，避免每写入一条就淘汰一次
+PRUNE_RATIO = 0.8
+PRUNE_BATCH = 200
+COMPRESS_LEVEL = 6
+
+REVALIDATE_META = 'httpcache_revalidate'
+CACHEABLE_STATUS = (200,)
+COMPRESSIBLE_TYPES = (b'text/', b'application/json', b'application/xml', b'application/xhtml+xml',
+                      b'application/javascript', b'application/rss+xml', b'application/atom+xml')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL,
+    compressed INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at);
+'''
+
+
+class RevalidatingPolicy(DummyPolicy):
+    """列表页总是回源验证，其余（详情页、图片）视为不可变，命中即用"""
+
+    def should_cache_response(self, response, request):
+        if response.status not in CACHEABLE_STATUS or not super().should_cache_response(response, request):
+            return False
+        return b'no-store' not in parse_cachecontrol(response.headers.get(b'Cache-Control', b''))
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if not request.meta.get(REVALIDATE_META):
+            return True
+        if b'Last-Modified' in cachedresponse.headers:
+            request.headers[b'If-Modified-Since'] = cachedresponse.headers[b'Last-Modified']
+        if b'ETag' in cachedresponse.headers:
+            request.headers[b'If-None-Match'] = cachedresponse.headers[b'ETag']
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        # 304 未修改；服务器出错时宁可用旧列表也不要整轮失败
+        return response.status == 304 or response.status >= 500
+
+
+def _compressible(headers):
+    if headers.get(b'Content-Encoding'):
+        return False
+    content_type = (headers.get(b'Content-Type') or b'').lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def encode_body(body, headers, level=COMPRESS_LEVEL):
+    """返回 (保存的字节, 是否压缩)；压缩后不更小时原样保存"""
+    if body and _compressible(headers):
+        packed = zlib.compress(body, level)
+        if len(packed) < len(body):
+            return packed, True
+    return body, False
+
+
+class ResponseCache:
+    """responses.db 的读写与 LRU 淘汰，不依赖 Scrapy 爬虫对象，可单独使用"""
+
+    def __init__(self, db_file, max_bytes=DEFAULT_MAX_BYTES, prune_ratio=PRUNE_RATIO, expiration_secs=0):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.prune_ratio = prune_ratio
+        self.expiration_secs = expiration_secs
+        self.conn = self._connect()
+        self._lock = threading.Lock()
+        self._touched = {}
+        self._pruner = None
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False)
+        # 必须在建表前设置，之后 incremental_vacuum 才能缩小文件
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.commit()
+        return conn
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.wait()
+        self.flush()
+        if self.over_limit():
+            self.prune()
+        self.conn.close()
+        self.conn = None
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def get(self, fingerprint):
+        """返回 {url, status, headers, body, stored_at}，不存在或已过期时返回 None"""
+        row = self.conn.execute(
+            'SELECT url, status, headers, body, compressed, stored_at FROM responses WHERE fingerprint = ?',
+            (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, compressed, stored_at = row
+        now = time.time()
+        if 0 < self.expiration_secs < now - stored_at:
+            return None
+        self._touched[fingerprint] = now
+        return {'url': url, 'status': status, 'headers': headers_raw_to_dict(headers),
+                'body': zlib.decompress(body) if compressed else body, 'stored_at': stored_at}
+
+    def put(self, fingerprint, url, status, headers, body):
+        headers = Headers(headers)
+        raw_headers = headers_dict_to_raw(headers) or b''
+        stored, compressed = encode_body(body, headers)
+        size = len(raw_headers) + len(stored)
+        now = time.time()
+        with self._lock, self.conn:
+            self._flush_touched()
+            old = self.conn.execute('SELECT size FROM responses WHERE fingerprint = ?', (fingerprint,)).fetchone()
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses (fingerprint, url, status, headers, body, compressed, size,'
+                ' stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (fingerprint, url, status, raw_headers, stored, int(compressed), size, now, now))
+            self.total_bytes += size - (old[0] if old else 0)
+        if self.over_limit():
+            self.prune_in_background()
+
+    def flush(self):
+        """把内存中的访问时间写回数据库"""
+        with self._lock, self.conn:
+            self._flush_touched()
+
+    def _flush_touched(self):
+        if self._touched:
+            touched, self._touched = self._touched, {}
+            self.conn.executemany('UPDATE responses SET accessed_at = ? WHERE fingerprint = ?',
+                                  [(at, fp) for fp, at in touched.items()])
+
+    def over_limit(self):
+        return self.max_bytes > 0 and self.total_bytes > self.max_bytes
+
+    def prune_in_background(self):
+        """已有淘汰线程在运行时不再启动新的"""
+        if self._pruner is not None and self._pruner.is_alive():
+            return
+        self.flush()
+        self._pruner = threading.Thread(target=self._prune_logged, name='httpcache-prune', daemon=True)
+        self._pruner.start()
+
+    def wait(self):
+        if self._pruner is not None:
+            self._pruner.join()
+            self._pruner = None
+
+    def _prune_logged(self):
+        try:
+            self.prune()
+        except Exception as e:
+            logger.error(f'[HttpCache] 淘汰缓存失败: {e}')
+
+    def prune(self, max_bytes=None):
+        """按最近访问时间从旧到新淘汰，直到总大小不超过 max_bytes * prune_ratio；返回 (条数, 字节数)"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        target = int(max_bytes * self.prune_ratio)
+        # 淘汰线程用自己的连接，分批提交，爬虫线程的读写只在批次之间短暂等待
+        conn = sqlite3.connect(str(self.db_file), timeout=30)
+        removed = freed = 0
+        try:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            while total - freed > target:
+                batch = conn.execute('SELECT fingerprint, size FROM responses ORDER BY accessed_at LIMIT ?',
+                                     (PRUNE_BATCH,)).fetchall()
+                if not batch:
+                    break
+                victims = []
+                for fingerprint, size in batch:
+                    if total - freed <= target:
+                        break
+                    victims.append((fingerprint,))
+                    freed += size
+                with conn:
+                    conn.executemany('DELETE FROM responses WHERE fingerprint = ?', victims)
+                removed += len(victims)
+            if removed:
+                conn.execute('PRAGMA incremental_vacuum').fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            self.total_bytes -= freed
+        if removed:
+            logger.info(f'[HttpCache] 淘汰 {removed} 条最久未访问的缓存，释放 {freed / 1024 / 1024:.1f} MB，'
+                        f'剩余 {self.total_bytes / 1024 / 1024:.1f} MB')
+        return removed, freed
+
+
+class CompressedLRUStorage:
+    """Scrapy HTTPCACHE_STORAGE：以请求指纹为键保存在 ResponseCache 中"""
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_bytes = settings.getint('HTTPCACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+        self.prune_ratio = settings.getfloat('HTTPCACHE_PRUNE_RATIO', PRUNE_RATIO)
+        self.cache = None
+
+    def open_spider(self, spider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.cache = ResponseCache(Path(self.cachedir, CACHE_DB), self.max_bytes, self.prune_ratio,
+                                   self.expiration_secs)
+        logger.debug(f'[HttpCache] 缓存 {self.cache.db_file}: {len(self.cache)} 条，'
+                     f'{self.cache.total_bytes / 1024 / 1024:.1f} MB')
+        if self.cache.over_limit():
+            self.cache.prune_in_background()
+
+    def close_spider(self, spider):
+        self.cache.close()
+
+    def retrieve_response(self, spider, request):
+        entry = self.cache.get(self._fingerprinter.fingerprint(request).hex())
+        if entry is None:
+            return None
+        request.meta['cache_timestamp'] = entry.pop('stored_at')
+        return response_from_dict(entry)
+
+    def store_response(self, spider, request, response):
+        self.cache.put(self._fingerprinter.fingerprint(request).hex(), response.url, response.status,
+                       response.headers, response.body)
+
+
+def _project_cache():
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    return ResponseCache(Path(data_path(settings['HTTPCACHE_DIR'], createdir=True), CACHE_DB),
+                         settings.getint('HTTPCACHE_MAX_BYTES', DEFAULT_MAX_BYTES),
+                         settings.getfloat('HTTPCACHE_PRUNE_RATIO', PRUNE_RATIO))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in ('stats', 'prune'):
+        cache = _project_cache()
+        try:
+            if argv[0] == 'prune':
+                max_bytes = int(float(argv[1]) * 1024 * 1024) if len(argv) > 1 else cache.max_bytes
+                removed, freed = cache.prune(max_bytes)
+                print(f'[HttpCache] 淘汰 {removed} 条，释放 {freed / 1024 / 1024:.1f} MB')
+            print(f'[HttpCache] {cache.db_file}: {len(cache)} 条，{cache.total_bytes / 1024 / 1024:.1f} MB'
+                  f'（上限 {cache.max_bytes / 1024 / 1024:.0f} MB）')
+        finally:
+            cache.close()
+        return 0
+    print('用法: python -m hku_scraper.httpcache stats\n'
+          '      python -m hku_scraper.httpcache prune [MB]')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,233 @@
+"""
+HKU 图片缓存
+在 Scrapy ImagesPipeline 之上按内容寻址保存图片：
+
+- 文件名取原图内容的 SHA1，不同文章/不同 URL 的相同图片只存一份
+- image_index.db 记录 URL -> 文件，跨运行已下载过的 URL 不再重新下载
+- 超过企业微信 2MB 限制的图片保存前压缩成满足大小的 JPEG
+- 保存时记录 MD5 与 base64 长度，发送时不用再读文件计算
+- SHA1、解码/转 JPEG/压缩与 MD5 在 hku_scraper.offload 的线程池中计算，不阻塞 reactor
+- 只请求会被保存的图片：同一篇文章里重复的 URL 只下载一次，复查后内容未变化（SaveJsonPipeline 不会保存）
+  的文章不下载图片；图片请求只接受 image/ 类型，大小上限见 hku_scraper.limits
+"""
+
+import math
+import sqlite3
+import hashlib
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.http.request import NO_CALLBACK
+from scrapy.pipelines.files import FSFilesStore
+from scrapy.pipelines.images import ImagesPipeline
+from scrapy.utils.defer import ensure_awaitable, maybe_deferred_to_future
+
+from hku_scraper.fingerprint import DEFAULT_CHANGE_DISTANCE, unchanged
+from hku_scraper.metrics import stage_timer
+from hku_scraper.offload import get_pool
+
+# 企业微信群机器人图片消息上限 2MB（base64 编码前）
+DEFAULT_IMAGES_MAX_BYTES = 2 * 1024 * 1024
+
+# 依次尝试的 JPEG 质量，仍超限时再按比例缩小尺寸
+JPEG_QUALITIES = (85, 75, 65, 55, 45, 35)
+DOWNSCALE_RATIO = 0.75
+MIN_DIMENSION = 64
+
+# 图片请求可接受的响应类型（hku_scraper.limits 在响应头阶段检查）
+IMAGE_CONTENT_TYPES = ('image/',)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    url TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    checksum TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_images_path ON images (path);
+'''
+
+
+def b64_length(size):
+    """base64 编码后的长度"""
+    return 4 * math.ceil(size / 3)
+
+
+def shrink_jpeg(image, max_bytes):
+    """把图片压缩成不超过 max_bytes 的 JPEG：先降质量，再缩小尺寸"""
+    while True:
+        for quality in JPEG_QUALITIES:
+            buf = BytesIO()
+            image.save(buf, 'JPEG', quality=quality, optimize=True)
+            if buf.getbuffer().nbytes <= max_bytes:
+                return image, buf
+        width, height = image.size
+        if min(width, height) * DOWNSCALE_RATIO < MIN_DIMENSION:
+            # 已经很小了，返回最低质量的结果
+            return image, buf
+        image = image.resize((int(width * DOWNSCALE_RATIO), int(height * DOWNSCALE_RATIO)))
+
+
+class ImageIndex:
+    """图片索引：URL -> 内容寻址的文件路径 / MD5 / 字节数"""
+
+    def __init__(self, db_file):
+        self.db_file = Path(db_file)
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_file), timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def lookup(self, url):
+        row = self.conn.execute('SELECT * FROM images WHERE url = ?', (url,)).fetchone()
+        return dict(row) if row else None
+
+    def lookup_path(self, path):
+        """同一内容已被其它 URL 保存过时返回该记录"""
+        row = self.conn.execute('SELECT * FROM images WHERE path = ? LIMIT 1', (path,)).fetchone()
+        return dict(row) if row else None
+
+    def record(self, url, path, checksum, size):
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO images (url, path, checksum, size) VALUES (?, ?, ?, ?)',
+                (url, path, checksum, size))
+
+
+class CachedImagesPipeline(ImagesPipeline):
+    """内容寻址、跨运行去重、按大小压缩的图片管道
+
+    结果字段（item['images']）在 url/path/checksum/status 之外增加 size 与 b64_len。
+    只有本地文件存储（IMAGES_STORE 为目录）时启用缓存索引。
+    """
+
+    def __init__(self, store_uri, download_func=None, *, crawler):
+        super().__init__(store_uri, download_func, crawler=crawler)
+        self.max_bytes = crawler.settings.getint('IMAGES_MAX_BYTES', DEFAULT_IMAGES_MAX_BYTES)
+        self.change_distance = crawler.settings.getint('FINGERPRINT_CHANGE_DISTANCE', DEFAULT_CHANGE_DISTANCE)
+        self.metrics = getattr(crawler, 'stage_metrics', None)
+        self.pool = get_pool(crawler)
+        self.index = None
+        if isinstance(self.store, FSFilesStore):
+            self.index = ImageIndex(Path(self.store.basedir) / 'image_index.db')
+
+    async def process_item(self, item, spider=None):
+        with stage_timer(self.metrics, 'images'):
+            return await super().process_item(item, spider)
+
+    def close_spider(self, spider=None):
+        if self.index is not None:
+            self.index.close()
+
+    def _unchanged_revalidation(self, item):
+        """复查的文章指纹没有实质变化：SaveJsonPipeline 只更新校验头，图片不会被保存或推送"""
+        article_id = item.get('revalidate_of')
+        store = getattr(self.crawler.spider, 'store', None) if self.crawler else None
+        if article_id is None or store is None:
+            return False
+        return unchanged(store.get_fingerprint(article_id), item.get('fingerprint'), self.change_distance)
+
+    def get_media_requests(self, item, info):
+        adapter = ItemAdapter(item)
+        if self._unchanged_revalidation(adapter):
+            self.crawler.stats.inc_value('images/skipped_unchanged')
+            return []
+        urls = super().get_media_requests(item, info)
+        # 同一篇文章里重复的 URL 只请求一次
+        unique = dict.fromkeys(request.url for request in urls)
+        return [Request(url, callback=NO_CALLBACK, meta={'download_accept': IMAGE_CONTENT_TYPES})
+                for url in unique]
+
+    def _stored_file(self, path):
+        return Path(self.store.basedir) / path
+
+    def _cached_result(self, entry, url, status):
+        return {
+            'url': url,
+            'path': entry['path'],
+            'checksum': entry['checksum'],
+            'status': status,
+            'size': entry['size'],
+            'b64_len': b64_length(entry['size']),
+        }
+
+    def file_path(self, request, response=None, info=None, *, item=None):
+        if response is not None:
+            digest = hashlib.sha1(response.body).hexdigest()
+            return f'full/{digest}.jpg'
+        if self.index is not None:
+            entry = self.index.lookup(request.url)
+            if entry:
+                return entry['path']
+        return super().file_path(request, response=response, info=info, item=item)
+
+    def media_to_download(self, request, info, *, item=None):
+        """已下载过且文件仍在的 URL 直接返回缓存结果，不再发请求"""
+        if self.index is None:
+            return super().media_to_download(request, info, item=item)
+        entry = self.index.lookup(request.url)
+        if entry and self._stored_file(entry['path']).exists():
+            self.inc_stats('uptodate')
+            return self._cached_result(entry, request.url, 'uptodate')
+        return None
+
+    def get_images(self, response, request, info, *, item=None):
+        for path, image, buf in super().get_images(response, request, info, item=item):
+            if buf.getbuffer().nbytes > self.max_bytes:
+                image, buf = shrink_jpeg(image, self.max_bytes)
+            yield path, image, buf
+
+    def _convert(self, response, request, info, item):
+        """在 worker 线程中执行：解码、转 JPEG（必要时压缩）并计算 MD5，返回 ([(路径, 宽, 高, buf)], MD5, 字节数)"""
+        files = []
+        checksum = None
+        size = None
+        for image_path, image, buf in self.get_images(response, request, info, item=item):
+            if checksum is None:
+                buf.seek(0)
+                checksum = hashlib.md5(buf.getvalue()).hexdigest()
+                size = buf.getbuffer().nbytes
+            width, height = image.size
+            files.append((image_path, width, height, buf))
+        return files, checksum, size
+
+    async def image_downloaded(self, response, request, info, *, item=None):
+        path = await maybe_deferred_to_future(self.pool.submit_local(
+            partial(self.file_path, request, response=response, info=info, item=item)))
+        if self.index is not None:
+            existing = self.index.lookup_path(path)
+            if existing and self._stored_file(path).exists():
+                # 相同内容已保存过，只记录新 URL
+                self.index.record(request.url, path, existing['checksum'], existing['size'])
+                return existing['checksum']
+
+        files, checksum, size = await maybe_deferred_to_future(
+            self.pool.submit_local(self._convert, response, request, info, item))
+        for image_path, width, height, buf in files:
+            await ensure_awaitable(self.store.persist_file(
+                image_path, buf, info,
+                meta={'width': width, 'height': height},
+                headers={'Content-Type': 'image/jpeg'},
+            ))
+        if self.index is not None:
+            self.index.record(request.url, path, checksum, size)
+        return checksum
+
+    async def media_downloaded(self, response, request, info, *, item=None):
+        result = await super().media_downloaded(response, request, info, item=item)
+        if self.index is not None:
+            entry = self.index.lookup(request.url)
+            if entry:
+                result['size'] = entry['size']
+                result['b64_len'] = b64_length(entry['size'])
+        return result
@@ -0,0 +1,104 @@
+"""
+按内容类型限制下载大小
+站点偶尔发布超大的页面（整本内嵌图片的 HTML）、画廊原图或把视频/PDF 放在新闻链接里，
+这些响应会整个读进内存、写进 HTTP 缓存，再交给解析与图片管道。这里在收到响应头时就决定上限：
+
+- DOWNLOAD_SIZE_LIMITS 按 Content-Type 给出上限（精确类型 > 'image/*' 这样的大类 > '*'），
+  没有 Content-Type 时按 URL 扩展名猜测
+- Content-Length 已超过上限时立即断开连接，不下载正文
+- 否则把上限写进 request.meta['download_maxsize']：Scrapy 边收边计数，超过即中止（分块传输、没有长度的响应），
+  HttpCompressionMiddleware 解压时也以它为上限（防止压缩炸弹）
+- request.meta['download_accept'] 给出可接受的类型前缀（图片管道只接受 image/），类型不符同样在响应头阶段中止
+
+被中止的请求转为 IgnoreRequest（只记一条警告，不算爬虫错误），计入 download_limits/* 统计。
+"""
+
+import logging
+import mimetypes
+
+from scrapy import signals
+from scrapy.exceptions import DownloadCancelledError, IgnoreRequest, StopDownload
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+DEFAULT_SIZE_LIMITS = {
+    'text/html': 2 * MB,
+    'application/xhtml+xml': 2 * MB,
+    'image/*': 10 * MB,
+    '*': 1 * MB,
+}
+
+ABORTED_META = 'download_limit_aborted'
+# 本中间件写入的上限，边收边计数超限（DownloadCancelledError）时据此识别
+LIMIT_META = 'download_size_limit'
+
+
+def content_type_of(headers, url):
+    """响应的 MIME 类型（小写，不含参数）；没有 Content-Type 时按 URL 猜测，猜不出返回 None"""
+    raw = headers.get(b'Content-Type') if headers is not None else None
+    if raw:
+        return raw.decode('latin-1').split(';', 1)[0].strip().lower() or None
+    guessed, _ = mimetypes.guess_type(url)
+    return guessed
+
+
+def size_limit(limits, content_type):
+    """content_type 对应的字节上限；0 或 None 表示不限制"""
+    if content_type:
+        if content_type in limits:
+            return limits[content_type]
+        major = content_type.split('/', 1)[0] + '/*'
+        if major in limits:
+            return limits[major]
+    return limits.get('*')
+
+
+class DownloadSizeLimits:
+    """下载器中间件：在响应头阶段按内容类型确定下载上限，超限或类型不符时提前中止"""
+
+    def __init__(self, limits=None, stats=None):
+        self.limits = {**DEFAULT_SIZE_LIMITS, **(limits or {})}
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = cls(crawler.settings.getdict('DOWNLOAD_SIZE_LIMITS'), crawler.stats)
+        crawler.signals.connect(mw.headers_received, signal=signals.headers_received)
+        return mw
+
+    def headers_received(self, headers, body_length, request, spider=None):
+        content_type = content_type_of(headers, request.url)
+        accept = request.meta.get('download_accept')
+        if accept and content_type and not content_type.startswith(tuple(accept)):
+            self._abort(request, 'type', f'类型 {content_type} 不是 {"/".join(accept)}')
+
+        limit = size_limit(self.limits, content_type)
+        if not limit:
+            return
+        if isinstance(body_length, int) and body_length > limit:
+            self._abort(request, 'size', f'{content_type or "未知类型"} {body_length} 字节超过上限 {limit}')
+        current = request.meta.get('download_maxsize')
+        if not current or limit < current:
+            request.meta['download_maxsize'] = limit
+            request.meta[LIMIT_META] = f'{content_type or "未知类型"} 超过上限 {limit}'
+
+    def _abort(self, request, reason, message):
+        request.meta[ABORTED_META] = f'{reason}: {message}'
+        if self.stats is not None:
+            self.stats.inc_value(f'download_limits/{reason}')
+        logger.warning(f'[Limits] {message}，中止下载: {request.url}')
+        raise StopDownload(fail=True)
+
+    def process_exception(self, request, exception, spider=None):
+        reason = request.meta.get(ABORTED_META)
+        if reason is not None and isinstance(exception, StopDownload):
+            raise IgnoreRequest(reason)
+        reason = request.meta.get(LIMIT_META)
+        if reason is not None and isinstance(exception, DownloadCancelledError):
+            # 没有 Content-Length 的响应边收边超限，Scrapy 已记录警告
+            if self.stats is not None:
+                self.stats.inc_value('download_limits/size')
+            raise IgnoreRequest(f'size: {reason}')
+        return None
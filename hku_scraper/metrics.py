@@ -0,0 +1,345 @@
+"""
+爬取分阶段计时与指标
+每次运行结束时写出各阶段耗时与计数，便于定位变慢的环节，不必打开 DEBUG 日志：
+
+    download       下载耗时（Scrapy 记录的 download_latency）
+    parse          列表页回调
+    parse_article  详情页回调
+    images         图片管道（下载 + 压缩 + 写盘）
+    save_json      SaveJsonPipeline 写 articles.db / N_article.json / news_index.json
+    wechat_send    企业微信 webhook 请求（后台投递线程）
+
+输出（METRICS_DIR，默认 <数据目录>/metrics）:
+    last_run.json       本次运行的阶段统计与计数（响应字节数、item 数、重试次数等）
+    hku_scraper.prom    Prometheus node_exporter textfile 格式
+    history.jsonl       由 runner 追加的滚动历史（record_run），用于发现哪个阶段变慢
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from hku_scraper.utils import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('download', 'parse', 'parse_article', 'extract', 'images', 'save_json', 'search_index', 'wechat_send')
+
+LAST_RUN_FILE = 'last_run.json'
+PROM_FILE = 'hku_scraper.prom'
+HISTORY_FILE = 'history.jsonl'
+
+# 保留最近多少次运行（每小时一次约一周）
+DEFAULT_HISTORY_RUNS = 168
+# 阶段平均耗时超过历史中位数的倍数时视为变慢
+REGRESSION_FACTOR = 1.5
+REGRESSION_MIN_RUNS = 3
+
+# Scrapy stats -> 计数字段
+STAT_COUNTERS = {
+    'requests': 'downloader/request_count',
+    'responses': 'downloader/response_count',
+    'response_bytes': 'downloader/response_bytes',
+    'items': 'item_scraped_count',
+    'items_dropped': 'item_dropped_count',
+    'retries': 'retry/count',
+    'cache_hits': 'httpcache/hit',
+    'cache_revalidated': 'httpcache/revalidate',
+    'oversize_aborted': 'download_limits/size',
+    'errors': 'log_count/ERROR',
+}
+
+
+def get_metrics_dir(settings=None):
+    metrics_dir = settings.get('METRICS_DIR') if settings is not None else None
+    return Path(metrics_dir) if metrics_dir else get_data_dir() / 'metrics'
+
+
+def percentile(values, q):
+    """最近秩百分位数，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def stage_timer(metrics, stage):
+    """metrics 为 None（未启用）时返回空的上下文管理器"""
+    return metrics.timer(stage) if metrics is not None else nullcontext()
+
+
+def _write_atomic(path, text):
+    tmp_file = Path(str(path) + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_file, path)
+
+
+def summarize(samples):
+    """一个阶段的耗时样本（秒）汇总"""
+    if not samples:
+        return {'count': 0, 'total_s': 0.0, 'mean_ms': None, 'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'total_s': round(total, 4),
+        'mean_ms': round(total / len(samples) * 1000, 3),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def _prom_escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(report):
+    """把运行报告转换成 Prometheus textfile 格式"""
+    spider = _prom_escape(report['spider'])
+    lines = []
+
+    def metric(name, help_text, rows):
+        lines.append(f'# HELP hku_scraper_{name} {help_text}')
+        lines.append(f'# TYPE hku_scraper_{name} gauge')
+        for labels, value in rows:
+            label_text = ','.join([f'spider="{spider}"'] + [f'{k}="{_prom_escape(v)}"' for k, v in labels])
+            lines.append(f'hku_scraper_{name}{{{label_text}}} {value}')
+
+    stages = report['stages']
+    metric('stage_seconds_total', 'Seconds spent in each stage during the last run',
+           [((('stage', s),), stages[s]['total_s']) for s in stages])
+    metric('stage_count', 'Number of timed operations per stage during the last run',
+           [((('stage', s),), stages[s]['count']) for s in stages])
+    for q in ('p50', 'p99'):
+        metric(f'stage_{q}_seconds', f'{q} duration per stage during the last run',
+               [((('stage', s),), round(stages[s][f'{q}_ms'] / 1000, 6)) for s in stages if stages[s]['count']])
+    metric('run_counter', 'Counters of the last run (bytes, items, retries, ...)',
+           [((('name', k),), v) for k, v in sorted(report['counters'].items())])
+    metric('run_duration_seconds', 'Wall time of the last run', [((), report['duration_s'])])
+    metric('run_finished_timestamp_seconds', 'Unix time when the last run finished',
+           [((), report['finished_ts'])])
+    return '\n'.join(lines) + '\n'
+
+
+class StageMetrics:
+    """阶段耗时与计数的收集器（线程安全：企业微信投递在后台线程记录）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {stage: [] for stage in STAGES}
+        self.counters = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def stage_summary(self):
+        with self._lock:
+            return {stage: summarize(samples) for stage, samples in self.samples.items()}
+
+
+class CrawlMetrics(StageMetrics):
+    """Scrapy 扩展：收集各阶段耗时，爬虫结束时写出 last_run.json 与 Prometheus textfile
+
+    管道与下载线程通过 crawler.stage_metrics 取得同一个实例。
+    """
+
+    def __init__(self, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        super().__init__()
+        self.crawler = crawler
+        self.metrics_dir = get_metrics_dir(crawler.settings)
+        self.started = None
+        crawler.stage_metrics = self
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.started = time.time()
+
+    def response_downloaded(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.observe('download', latency)
+
+    def build_report(self, spider, reason):
+        finished = time.time()
+        started = self.started or finished
+        stats = self.crawler.stats.get_stats()
+        counters = {name: stats.get(key, 0) for name, key in STAT_COUNTERS.items()}
+        with self._lock:
+            counters.update(self.counters)
+        return {
+            'spider': spider.name,
+            'finish_reason': reason,
+            'started_at': datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+            'finished_at': datetime.fromtimestamp(finished).isoformat(timespec='seconds'),
+            'finished_ts': round(finished, 3),
+            'duration_s': round(finished - started, 3),
+            'counters': counters,
+            'stages': self.stage_summary(),
+        }
+
+    def spider_closed(self, spider, reason):
+        report = self.build_report(spider, reason)
+        try:
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+            _write_atomic(self.metrics_dir / LAST_RUN_FILE, json.dumps(report, ensure_ascii=False, indent=2))
+            _write_atomic(self.metrics_dir / PROM_FILE, to_prometheus(report))
+        except OSError as e:
+            logger.warning(f'[Metrics] 写入 {self.metrics_dir} 失败: {e}')
+            return
+        logger.info(f'[Metrics] {format_summary(report)}')
+
+
+class CallbackTimingMiddleware:
+    """Spider 中间件：统计 parse / parse_article 等回调的执行耗时（只计生成器自身的运行时间）"""
+
+    def __init__(self, crawler):
+        self.metrics = getattr(crawler, 'stage_metrics', None)
+        if self.metrics is None:
+            raise NotConfigured
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    @staticmethod
+    def _stage(response):
+        request = response.request
+        callback = request.callback if request is not None else None
+        return getattr(callback, '__name__', None) or 'parse'
+
+    def process_spider_output(self, response, result):
+        if response is None:
+            yield from result
+            return
+        stage = self._stage(response)
+        elapsed = 0.0
+        iterator = iter(result)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield output
+        finally:
+            self.metrics.observe(stage, elapsed)
+
+    async def process_spider_output_async(self, response, result):
+        if response is None:
+            async for output in result:
+                yield output
+            return
+        stage = self._stage(response)
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    output = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield output
+        finally:
+            self.metrics.observe(stage, elapsed)
+
+
+def format_summary(report):
+    """一行摘要：各阶段总耗时 + 主要计数"""
+    parts = [f'{stage} {s["total_s"]:.2f}s/{s["count"]}'
+             for stage, s in report['stages'].items() if s['count']]
+    counters = report['counters']
+    return (f'{report["spider"]} {report["duration_s"]:.1f}s, items {counters.get("items", 0)}, '
+            f'bytes {counters.get("response_bytes", 0)}, retries {counters.get("retries", 0)} | '
+            + ', '.join(parts))
+
+
+def load_history(history_file):
+    history_file = Path(history_file)
+    if not history_file.exists():
+        return []
+    runs = []
+    with open(history_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue
+    return runs
+
+
+def find_regressions(report, history, factor=REGRESSION_FACTOR, min_runs=REGRESSION_MIN_RUNS):
+    """与历史中位数相比平均耗时变慢超过 factor 倍的阶段，返回 [(stage, 当前 ms, 历史中位 ms)]"""
+    regressions = []
+    for stage, current in report['stages'].items():
+        if not current['count']:
+            continue
+        past = [run['stages'][stage]['mean_ms'] for run in history
+                if run.get('stages', {}).get(stage, {}).get('count')]
+        if len(past) < min_runs:
+            continue
+        baseline = percentile(past, 50)
+        if baseline and current['mean_ms'] > baseline * factor:
+            regressions.append((stage, current['mean_ms'], baseline))
+    return regressions
+
+
+def record_run(metrics_dir=None, since=None, keep=DEFAULT_HISTORY_RUNS):
+    """runner 在每轮爬取后调用：把 last_run.json 追加到 history.jsonl（只保留最近 keep 次）
+
+    since 为本轮开始的 Unix 时间，last_run.json 早于它时说明本轮没有写出指标，返回 None。
+    返回 (report, regressions)。
+    """
+    metrics_dir = Path(metrics_dir) if metrics_dir else get_metrics_dir()
+    last_run = metrics_dir / LAST_RUN_FILE
+    if not last_run.exists():
+        return None
+    with open(last_run, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    if since is not None and report.get('finished_ts', 0) < since:
+        return None
+
+    history_file = metrics_dir / HISTORY_FILE
+    history = load_history(history_file)
+    regressions = find_regressions(report, history)
+    history = (history + [report])[-keep:]
+    _write_atomic(history_file, ''.join(json.dumps(run, ensure_ascii=False) + '\n' for run in history))
+    return report, regressions
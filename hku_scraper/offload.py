@@ -0,0 +1,205 @@
+"""
+把 CPU 密集的 item 后处理移出 Twisted reactor 线程
+大量详情页同时到达时，正文提取、SimHash、图片哈希与重新编码、JSON 序列化与分词都在 reactor 线程执行，
+下载会排在这些计算后面。这里提供一个按爬虫共用的 WorkerPool：
+
+- OFFLOAD_POOL = 'thread' | 'process'，OFFLOAD_WORKERS 个 worker（None 时为 CPU 核数 - 1，最多 MAX_AUTO_WORKERS；
+  0 时直接在 reactor 线程执行，单核机器上自动如此）
+- submit() 在池中执行模块级函数（进程池时参数与返回值需可 pickle），返回 Deferred，
+  结果经 reactor.callFromThread 回到 reactor 线程；管道中用 maybe_deferred_to_future 等待
+- submit_local() 在本进程的线程中执行绑定方法/闭包；serial=True 时在单个线程中按提交顺序执行
+- 同时在途的任务不超过 OFFLOAD_MAX_PENDING 个，多出的在 reactor 中排队；process_item 等待结果时
+  未完成时 Scrapy 的 scraper 槽位不会释放，下载随之放慢（背压）
+
+使用方:
+- OffloadPipeline（图片管道之前）：爬虫只把详情页 HTML 放进 item['_extract']，
+  解析、提取与指纹在池中计算；item 按进入本阶段的顺序离开
+- CachedImagesPipeline：图片 SHA1、解码/转 JPEG/压缩与 MD5 在线程中计算（Pillow 与 hashlib 计算时释放 GIL）
+- SaveJsonPipeline：保存（JSON 序列化、分词写索引、构建推送消息）在单线程中顺序执行，
+  文章 id 与推送顺序与 item 到达顺序一致
+"""
+
+import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from hku_scraper.extractor import prepare_article
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('thread', 'process')
+DEFAULT_KIND = 'thread'
+# OFFLOAD_WORKERS 为 None 时最多使用的 worker 数
+MAX_AUTO_WORKERS = 4
+DEFAULT_MAX_PENDING = 32
+
+PIPELINE_PATH = 'hku_scraper.offload.OffloadPipeline'
+
+
+def default_workers():
+    """给 reactor 留一个核；单核时在 reactor 线程直接执行，避免进程间传递的开销"""
+    return max(0, min(MAX_AUTO_WORKERS, (os.cpu_count() or 1) - 1))
+
+
+def _fire(d, future):
+    error = future.exception()
+    if error is not None:
+        d.errback(Failure(error))
+    else:
+        d.callback(future.result())
+
+
+class WorkerPool:
+    """线程池或进程池，任务结果以 Deferred 返回 reactor 线程"""
+
+    def __init__(self, kind=DEFAULT_KIND, workers=None, max_pending=DEFAULT_MAX_PENDING, reactor=None):
+        if kind not in KINDS:
+            raise ValueError(f'未知的 OFFLOAD_POOL {kind!r}，可选: {", ".join(KINDS)}')
+        self.kind = kind
+        self.workers = default_workers() if workers is None else int(workers)
+        self.reactor = reactor
+        self._slots = defer.DeferredSemaphore(max(1, max_pending))
+        self._executor = None
+        self._threads = None
+        self._serial = None
+
+    @property
+    def inline(self):
+        return self.workers <= 0
+
+    def _get_reactor(self):
+        if self.reactor is None:
+            from twisted.internet import reactor
+            self.reactor = reactor
+        return self.reactor
+
+    def _pool(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                # spawn：不复制 reactor 与后台线程的状态，Windows 与 Linux 行为一致
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = self._local_threads()
+        return self._executor
+
+    def _local_threads(self):
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.workers, thread_name_prefix='offload')
+        return self._threads
+
+    def _serial_thread(self):
+        if self._serial is None:
+            self._serial = ThreadPoolExecutor(1, thread_name_prefix='offload-serial')
+        return self._serial
+
+    def submit(self, func, *args):
+        """在池中执行 func(*args)；进程池时 func 必须是模块级函数"""
+        if self.inline:
+            return defer.maybeDeferred(func, *args)
+        return self._slots.run(self._dispatch, self._pool, func, args)
+
+    def submit_local(self, func, *args, serial=False):
+        """在本进程的线程中执行 func(*args)；serial=True 时所有任务在同一线程中按提交顺序执行"""
+        if self.inline:
+            return defer.maybeDeferred(func, *args)
+        return self._slots.run(self._dispatch, self._serial_thread if serial else self._local_threads, func, args)
+
+    def _dispatch(self, get_executor, func, args):
+        reactor = self._get_reactor()
+        d = defer.Deferred()
+        future = get_executor().submit(func, *args)
+        future.add_done_callback(lambda f: reactor.callFromThread(_fire, d, f))
+        return d
+
+    def close(self):
+        for executor in (self._executor, self._threads, self._serial):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._threads = self._serial = None
+
+
+def get_pool(crawler):
+    """同一个 crawler 的管道共用一个 WorkerPool，爬虫关闭时关闭"""
+    pool = getattr(crawler, 'offload_pool', None)
+    if pool is None:
+        settings = crawler.settings
+        pool = WorkerPool(settings.get('OFFLOAD_POOL') or DEFAULT_KIND,
+                          settings.get('OFFLOAD_WORKERS', 0),
+                          settings.getint('OFFLOAD_MAX_PENDING', DEFAULT_MAX_PENDING))
+        crawler.offload_pool = pool
+        crawler.signals.connect(pool.close, signal=signals.spider_closed)
+        if not pool.inline:
+            logger.info(f'[Offload] {pool.kind} pool, {pool.workers} workers')
+    return pool
+
+
+def offload_enabled(settings):
+    """ITEM_PIPELINES 中启用了 OffloadPipeline 时，爬虫把正文提取交给它"""
+    if settings is None:
+        return False
+    return settings.getwithbase('ITEM_PIPELINES').get(PIPELINE_PATH) is not None
+
+
+class Sequencer:
+    """让并行完成的 Deferred 按 wrap() 的调用顺序交出结果"""
+
+    def __init__(self):
+        self._tail = defer.succeed(None)
+
+    def wrap(self, d):
+        out = defer.Deferred()
+        turn = defer.Deferred()
+        previous, self._tail = self._tail, turn
+
+        def hand_over(_, result):
+            # 先交出本结果（下游回调此时已挂在 out 上），再放行下一个
+            if isinstance(result, Failure):
+                out.errback(result)
+            else:
+                out.callback(result)
+            turn.callback(None)
+
+        def finished(result):
+            previous.addCallback(hand_over, result)
+
+        d.addBoth(finished)
+        return out
+
+
+class OffloadPipeline:
+    """在 WorkerPool 中完成详情页解析、正文/图片提取与内容指纹（爬虫放在 item['_extract'] 中的 HTML）"""
+
+    def __init__(self, pool, metrics=None):
+        self.pool = pool
+        self.metrics = metrics
+        self.sequencer = Sequencer()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(get_pool(crawler), getattr(crawler, 'stage_metrics', None))
+
+    async def process_item(self, item, spider=None):
+        job = item.pop('_extract', None)
+        if job is None:
+            d = defer.succeed(item)
+        else:
+            d = self.pool.submit(prepare_article, job['html'], job['url'], job['detail'],
+                                 job['text_limit'], job['image_limit'], job.get('encoding', 'utf-8'))
+            d.addCallback(self._fill, item)
+        return await maybe_deferred_to_future(self.sequencer.wrap(d))
+
+    def _fill(self, result, item):
+        text, image_urls, fingerprint, elapsed = result
+        if self.metrics is not None:
+            self.metrics.observe('extract', elapsed)
+        item['text'] = text
+        item['image_urls'] = image_urls
+        item['fingerprint'] = fingerprint
+        logger.info(f'[Offload] {item.get("title")}: 文本 {len(text)} 字符，图片 {len(image_urls)} 张')
+        return item
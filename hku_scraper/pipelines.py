@@ -1,220 +1,314 @@
-import json
-import os
 from pathlib import Path
-import requests
-import hashlib
-import time
+
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import threads
+
+from hku_scraper.delivery import DEFAULT_RATE_PER_MINUTE, DeliveryWorker, Outbox, load_webhook_urls
+from hku_scraper.digest import summarize
+from hku_scraper.fingerprint import (
+    DEFAULT_CHANGE_DISTANCE, DEFAULT_DUPLICATE_DISTANCE, hamming, simhash, to_hex, unchanged,
+)
+from hku_scraper.metrics import stage_timer
+from hku_scraper.offload import get_pool
+from hku_scraper.images import DEFAULT_IMAGES_MAX_BYTES as IMAGE_MAX_BYTES
+from hku_scraper.search import open_index
+from hku_scraper.segmenter import split_markdown
+from hku_scraper.store import POST_SAVE_NOTIFY, POST_SAVE_SILENT, POST_SAVE_UPDATE, open_store
+from hku_scraper.utils import get_data_dir
 
 class SaveJsonPipeline:
     """Save item JSON after images are downloaded by ImagesPipeline.
     This pipeline expects item to contain fields: title, url, text, images (list from ImagesPipeline), scraped_at
-    It will save a file like `N_article.json` into Desktop/hku_news_data and update news_index.json.
+    Each article is committed to the ArticleStore (articles.db), which assigns a stable id,
+    then written as `<id>_article.json` into Desktop/hku_news_data.
+    news_index.json is exported once when the spider closes.
+
+    Items re-fetched by the spider's revalidation pass carry `revalidate_of`; they are only
+    re-saved and re-sent when the SimHash fingerprint moved more than FINGERPRINT_CHANGE_DISTANCE
+    bits. New articles within FINGERPRINT_DUPLICATE_DISTANCE of a stored one are flagged with
+    `duplicate_of` and not sent again.
+
+    Every saved or changed article is also (re)indexed in the full-text search index
+    (hku_scraper.search, search.db) unless SEARCH_ENABLED is off.
+
+    With a worker pool (hku_scraper.offload) each save runs on the pool's serial thread, so JSON
+    serialization, tokenizing and SQLite writes stay off the reactor while ids and WeChat messages
+    keep the order in which items arrived. Without one, items are saved inline.
+
+    The store row is committed together with a `post_save` marker (what is still to do: notify,
+    notify as update, or nothing). Writing the JSON file, indexing and enqueueing are idempotent,
+    so after a crash open_spider redoes them for every marked article and clears the marker;
+    the outbox dedupes messages by URL + scraped_at, so nothing is sent twice.
+
+    Messages fan out to every configured webhook (WECHAT_WEBHOOK_URL or config/wechat.json).
+    With WECHAT_DIGEST on, articles are buffered in the outbox instead and coalesced into
+    title/summary/link digests when the spider closes, or once the oldest buffered article is
+    WECHAT_DIGEST_WINDOW seconds old.
+
+    When several instances share a coordinator (spider.coordinator, hku_scraper.coordination),
+    saved URLs are marked done in the shared set and each notification is claimed first, so only
+    one instance sends it.
     """
 
+    def __init__(self, settings=None, metrics=None, pool=None):
+        settings = settings or {}
+        # per-stage timings (hku_scraper.metrics.CrawlMetrics), None when metrics are disabled
+        self.metrics = metrics
+        self.pool = pool
+        webhooks = settings.get('WECHAT_WEBHOOK_URL') or load_webhook_urls()
+        self.webhook_urls = [webhooks] if isinstance(webhooks, str) else list(webhooks)
+        self.rate_per_minute = settings.get('WECHAT_RATE_PER_MINUTE', DEFAULT_RATE_PER_MINUTE)
+        self.drain_timeout = settings.get('WECHAT_DRAIN_TIMEOUT', 60)
+        self.digest = settings.get('WECHAT_DIGEST', False)
+        self.digest_window = float(settings.get('WECHAT_DIGEST_WINDOW', 0) or 0)
+        self.change_distance = settings.get('FINGERPRINT_CHANGE_DISTANCE', DEFAULT_CHANGE_DISTANCE)
+        self.duplicate_distance = settings.get('FINGERPRINT_DUPLICATE_DISTANCE', DEFAULT_DUPLICATE_DISTANCE)
+        self.search_enabled = settings.get('SEARCH_ENABLED', True)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, getattr(crawler, 'stage_metrics', None), get_pool(crawler))
+
     def open_spider(self, spider):
-        self.data_dir = Path(os.getenv('USERPROFILE') or os.getenv('HOME') or '.') / 'Desktop' / 'hku_news_data'
+        self.data_dir = get_data_dir()
         self.data_dir.mkdir(parents=True, exist_ok=True)
         self.index_file = self.data_dir / 'news_index.json'
-        # load index
-        if self.index_file.exists():
-            try:
-                with open(self.index_file, 'r', encoding='utf-8') as f:
-                    self.index = json.load(f)
-            except Exception:
-                self.index = {}
-        else:
-            self.index = {}
+        # share the spider's store so "seen URL" lookups and writes use the same set
+        self.store = getattr(spider, 'store', None)
+        self.owns_store = self.store is None
+        if self.owns_store:
+            self.store = open_store(self.data_dir)
+        # articles saved before the index existed (or while it was disabled) are caught up here
+        self.search_index = None
+        if self.search_enabled:
+            with stage_timer(self.metrics, 'search_index'):
+                self.search_index = open_index(self.data_dir, self.store)
+        self.saved_count = 0
+        # WeChat delivery runs on a background thread fed by the on-disk outbox;
+        # messages left over from a previous run are picked up here as well
+        self.outbox = None
+        self.delivery = None
+        if self.webhook_urls:
+            self.outbox = Outbox(self.data_dir / 'outbox.db')
+            self.delivery = DeliveryWorker(self.outbox, rate_per_minute=self.rate_per_minute,
+                                           metrics=self.metrics)
+            self.delivery.start()
+        self._resume_unfinished(spider)
+
+    def _resume_unfinished(self, spider):
+        """补做上次中断时已提交文章的后续步骤（写文件、索引、入队）"""
+        unfinished = self.store.unfinished_saves()
+        for article_id, post_save, article in unfinished:
+            self.store.write_article_file(self.data_dir, article_id, article)
+            self._index(article_id, article)
+            if article.get('duplicate_of') is not None:
+                self.store.mark_duplicate(article_id, article['duplicate_of'])
+            self._notify(article, post_save, spider)
+            self.store.finish_post_save(article_id)
+        if unfinished:
+            self.saved_count += len(unfinished)
+            spider.logger.info(f'[SaveJsonPipeline] resumed {len(unfinished)} articles interrupted after commit')
+
+    def close_spider(self, spider):
+        if self.saved_count:
+            with stage_timer(self.metrics, 'save_json'):
+                self.store.export_index(self.index_file)
+            spider.logger.info(f'[SaveJsonPipeline] exported {self.index_file} ({len(self.store)} articles)')
+        if self.search_index is not None:
+            self.search_index.close()
+        if self.owns_store:
+            self.store.close()
+        if self.delivery is not None:
+            if self.digest:
+                self._flush_digest(spider, self.digest_window)
+            # drain what is due without blocking the reactor; the rest stays in the outbox
+            d = threads.deferToThread(self.delivery.stop, self.drain_timeout)
+            d.addBoth(lambda _: self._close_outbox(spider))
+            return d
+
+    def _close_outbox(self, spider):
+        pending = self.outbox.pending_count()
+        if pending:
+            spider.logger.info(f'[WeChat] {pending} messages left in outbox for the next run')
+        self.outbox.close()
 
     def process_item(self, item, spider):
+        if self.pool is None:
+            return self.save_item(item, spider)
+        return self._save_offloaded(item, spider)
+
+    async def _save_offloaded(self, item, spider):
+        return await maybe_deferred_to_future(self.pool.submit_local(self.save_item, item, spider, serial=True))
+
+    def save_item(self, item, spider):
         # images field from ImagesPipeline contains dicts with 'path'
         images_meta = item.get('images', [])
         local_image_paths = []
+        image_meta = []
         for im in images_meta:
             # path is relative to IMAGES_STORE
             if 'path' in im:
-                local_image_paths.append(str(Path(im['path']).as_posix()))
+                path = str(Path(im['path']).as_posix())
+                local_image_paths.append(path)
+                # digests precomputed by CachedImagesPipeline, so sending needs no re-hash
+                image_meta.append({
+                    'path': path,
+                    'checksum': im.get('checksum'),
+                    'size': im.get('size'),
+                    'b64_len': im.get('b64_len'),
+                })
 
         out = {
             'title': item.get('title'),
             'url': item.get('url'),
+            'site': item.get('site'),
             'text': item.get('text'),
             'images': local_image_paths,
+            'image_meta': image_meta,
             'scraped_at': item.get('scraped_at'),
             'status': item.get('status', 'completed')
         }
 
-        # generate filename index
-        idx = len(self.index) + 1
-        filename = f"{idx}_article.json"
-        outfile = self.data_dir / filename
-        with open(outfile, 'w', encoding='utf-8') as f:
-            json.dump(out, f, ensure_ascii=False, indent=2)
+        fingerprint = item.get('fingerprint')
+        validators = {'etag': item.get('etag'), 'last_modified': item.get('last_modified')}
+        if item.get('revalidate_of') is not None:
+            return self._process_revalidated(item, out, fingerprint, validators, spider)
 
-        # update index (keyed by url)
-        url = item.get('url')
-        self.index[url] = {
-            'title': item.get('title'),
-            'file': filename,
-            'scraped_at': item.get('scraped_at')
-        }
-        with open(self.index_file, 'w', encoding='utf-8') as f:
-            json.dump(self.index, f, ensure_ascii=False, indent=2)
+        duplicate_of = self.store.find_near_duplicate(fingerprint, self.duplicate_distance)
+        if duplicate_of is not None:
+            out['duplicate_of'] = duplicate_of
+        post_save = POST_SAVE_NOTIFY if duplicate_of is None else POST_SAVE_SILENT
+
+        # the store assigns the id inside a transaction, so file names never collide
+        with stage_timer(self.metrics, 'save_json'):
+            article_id, created = self.store.add_article(out, fingerprint, post_save=post_save, **validators)
+            if created:
+                outfile = self.store.write_article_file(self.data_dir, article_id, out)
+        if not created:
+            spider.logger.info(f'[SaveJsonPipeline] already saved as {article_id}, skip: {out["url"]}')
+            return item
+        coordinator = getattr(spider, 'coordinator', None)
+        if coordinator is not None:
+            coordinator.mark_done([out['url']])
+        self.saved_count += 1
+        self._index(article_id, out)
 
         spider.logger.info(f'[SaveJsonPipeline] saved {outfile}')
-        
+
+        if duplicate_of is not None:
+            self.store.mark_duplicate(article_id, duplicate_of)
+            spider.logger.info(f'[SaveJsonPipeline] near-duplicate of {duplicate_of}, not sent: {out["url"]}')
+
         # 发送到企业微信
-        self.send_to_wechat(out, spider)
-        
+        self._notify(out, post_save, spider)
+        self.store.finish_post_save(article_id)
         return item
-    
+
+    def _process_revalidated(self, item, out, fingerprint, validators, spider):
+        """复查已抓取的文章：指纹变化超过阈值才覆盖保存并再次推送"""
+        article_id = item['revalidate_of']
+        old = self.store.get_fingerprint(article_id)
+        if unchanged(old, fingerprint, self.change_distance):
+            with stage_timer(self.metrics, 'save_json'):
+                self.store.update_validators(article_id, **validators)
+            spider.logger.info(f'[SaveJsonPipeline] unchanged ({hamming(old, fingerprint)} bits): {out["url"]}')
+            return item
+
+        # 旧数据没有指纹，这次只建立基线，不当作修改推送
+        post_save = POST_SAVE_SILENT if old is None else POST_SAVE_UPDATE
+        with stage_timer(self.metrics, 'save_json'):
+            self.store.update_article(article_id, out, fingerprint, post_save=post_save, **validators)
+            outfile = self.store.write_article_file(self.data_dir, article_id, out)
+        self.saved_count += 1
+        self._index(article_id, out)
+        if old is None:
+            spider.logger.info(f'[SaveJsonPipeline] fingerprint baseline saved {outfile}')
+        else:
+            spider.logger.info(f'[SaveJsonPipeline] article changed, updated {outfile}')
+        self._notify(out, post_save, spider)
+        self.store.finish_post_save(article_id)
+        return item
+
+    def _notify(self, article, post_save, spider):
+        if post_save not in (POST_SAVE_NOTIFY, POST_SAVE_UPDATE):
+            return
+        coordinator = getattr(spider, 'coordinator', None)
+        if coordinator is not None and self.webhook_urls:
+            # 新文章按 URL、修改按新正文的指纹认领，各实例抓取时间不同也能识别为同一次推送
+            key = article['url']
+            if post_save == POST_SAVE_UPDATE:
+                key += f'#{to_hex(simhash(article.get("text") or ""))}'
+            if not coordinator.claim_delivery(key):
+                spider.logger.info(f'[Coordination] 其他实例已推送，跳过: {article["url"]}')
+                return
+        if post_save == POST_SAVE_NOTIFY:
+            self.send_to_wechat(article, spider)
+        elif post_save == POST_SAVE_UPDATE:
+            self.send_to_wechat({**article, 'title': f'【更新】{article["title"]}'}, spider)
+
+    def _index(self, article_id, article):
+        if self.search_index is not None:
+            with stage_timer(self.metrics, 'search_index'):
+                self.search_index.index_article(article_id, article)
+
     def send_to_wechat(self, article_data, spider):
-        """发送文章到企业微信机器人"""
+        """把文章消息写入发件箱，由后台 DeliveryWorker 发送（不阻塞 reactor）"""
+        if not self.webhook_urls:
+            spider.logger.info('[WeChat] 未配置 webhook，跳过发送')
+            return
+        url = article_data.get('url', '')
+        # 同一篇文章的同一次抓取只入队一次（中断后补做时不会重复推送）
+        dedupe_key = f'{url}@{article_data.get("scraped_at", "")}'
         try:
-            # 读取 webhook 配置
-            webhook_url = None
-            config_file = Path(__file__).parent.parent / 'config' / 'wechat.json'
-            if config_file.exists():
-                with open(config_file, 'r', encoding='utf-8') as f:
-                    cfg = json.load(f)
-                    webhook_url = cfg.get('webhookUrl')
-            
-            if not webhook_url:
-                webhook_url = os.getenv('WECHAT_WEBHOOK')
-            
-            if not webhook_url:
-                spider.logger.info('[WeChat] 未配置 webhook，跳过发送')
+            if self.digest:
+                if self.outbox.add_to_digest(article_data.get('title'), url,
+                                             summarize(article_data.get('text')), dedupe_key):
+                    spider.logger.info(f'[WeChat] 已加入摘要，待合并发送: {url}')
+                if self.digest_window:
+                    self._flush_digest(spider, self.digest_window)
                 return
-            
-            # 构建文本消息
-            title = article_data.get('title', '（无标题）')
-            text = article_data.get('text', '')
-            url = article_data.get('url', '')
-            scraped_at = article_data.get('scraped_at', '')
-            
-            # 企业微信 markdown 消息长度限制是 4096 字节（不是字符！）
-            plain_text = text.replace('\n', ' ').strip()
-            
-            # 构建 markdown 模板（不含正文）
-            md_template_prefix = f"**{title}**\n\n"
-            md_template_suffix = f"\n\n[阅读原文]({url})\n\n_抓取时间: {scraped_at}_"
-            
-            # 先构建完整消息，检查字节数
-            full_content = md_template_prefix + plain_text + md_template_suffix
-            full_bytes = len(full_content.encode('utf-8'))
-            
-            # 企业微信限制 4096 字节，需要分段发送长文本
-            # 每段最大字节数（接近限制值，最大化利用空间）
-            max_segment_bytes = 4050
-            
-            if full_bytes > 4050:
-                # 需要分段发送
-                segments = []
-                remaining_text = plain_text
-                segment_num = 1
-                
-                while remaining_text:
-                    # 计算当前段的头部字节数（第一段用标题模板，续段用"续N"格式）
-                    if segment_num == 1:
-                        segment_header = md_template_prefix
-                    else:
-                        segment_header = f"**{title}（续{segment_num}）**\n\n"
-                    
-                    # 直接基于字节硬截断，不用字符估算
-                    header_bytes = len(segment_header.encode('utf-8'))
-                    suffix_continue = "\n\n_（内容较长，续见下条）_"
-                    suffix_continue_bytes = len(suffix_continue.encode('utf-8'))
-                    suffix_final_bytes = len(md_template_suffix.encode('utf-8'))
-                    
-                    # 先假设用续段后缀，计算可用字节
-                    available_bytes = max_segment_bytes - header_bytes - suffix_continue_bytes
-                    
-                    # 从剩余文本开始，逐字节截取直到不超限
-                    low, high = 0, len(remaining_text)
-                    best_chars = 0
-                    
-                    # 二分查找最大可容纳字符数
-                    while low <= high:
-                        mid = (low + high) // 2
-                        test_segment = remaining_text[:mid]
-                        test_bytes = len(test_segment.encode('utf-8'))
-                        
-                        if test_bytes <= available_bytes:
-                            best_chars = mid
-                            low = mid + 1
-                        else:
-                            high = mid - 1
-                    
-                    segment_text = remaining_text[:best_chars]
-                    
-                    # 判断是否是最后一段
-                    remaining_after = remaining_text[best_chars:].strip()
-                    is_last = len(remaining_after) < 100
-                    
-                    # 如果是最后一段，用完整后缀并重新验证
-                    if is_last:
-                        full_segment = segment_header + segment_text + md_template_suffix
-                        if len(full_segment.encode('utf-8')) > max_segment_bytes:
-                            # 最后一段超限，重新计算
-                            available_bytes_final = max_segment_bytes - header_bytes - suffix_final_bytes
-                            low, high = 0, len(remaining_text)
-                            best_chars = 0
-                            while low <= high:
-                                mid = (low + high) // 2
-                                test_segment = remaining_text[:mid]
-                                if len(test_segment.encode('utf-8')) <= available_bytes_final:
-                                    best_chars = mid
-                                    low = mid + 1
-                                else:
-                                    high = mid - 1
-                            segment_text = remaining_text[:best_chars]
-                        segment_md = segment_header + segment_text + md_template_suffix
-                    else:
-                        segment_md = segment_header + segment_text + suffix_continue
-                    
-                    test_bytes = len(segment_md.encode('utf-8'))
-                    
-                    segments.append((segment_md, test_bytes, len(segment_text)))
-                    remaining_text = remaining_text[len(segment_text):].strip()
-                    segment_num += 1
-                
-                spider.logger.info(f'[WeChat] 文章过长，分{len(segments)}段发送: 原文{full_bytes}字节')
-                for idx, (segment_md, segment_bytes, segment_chars) in enumerate(segments, 1):
-                    payload = {'msgtype': 'markdown', 'markdown': {'content': segment_md}}
-                    resp = requests.post(webhook_url, json=payload, timeout=10)
-                    spider.logger.info(f'[WeChat] 已发送第{idx}/{len(segments)}段: {segment_bytes}字节 ({segment_chars}字符) - {resp.json()}')
-                    if idx < len(segments):
-                        time.sleep(0.5)
-            else:
-                spider.logger.info(f'[WeChat] 文章长度适中: {len(plain_text)}字符, {full_bytes}字节，单条发送')
-                payload = {'msgtype': 'markdown', 'markdown': {'content': full_content}}
-                resp = requests.post(webhook_url, json=payload, timeout=10)
-                spider.logger.info(f'[WeChat] 已发送文本消息: {resp.json()}')
-            
-            spider.logger.info(f'[WeChat] 已发送文本消息: {resp.json()}')
-            
-            # 发送图片
-            images = article_data.get('images', [])
-            if images:
-                images_dir = self.data_dir / 'images'
-                for img_rel_path in images:
-                    img_path = images_dir / img_rel_path
-                    if img_path.exists():
-                        try:
-                            with open(img_path, 'rb') as f:
-                                img_data = f.read()
-                            
-                            import base64
-                            b64 = base64.b64encode(img_data).decode('utf-8')
-                            md5 = hashlib.md5(img_data).hexdigest()
-                            
-                            img_payload = {
-                                'msgtype': 'image',
-                                'image': {'base64': b64, 'md5': md5}
-                            }
-                            
-                            img_resp = requests.post(webhook_url, json=img_payload, timeout=10)
-                            spider.logger.info(f'[WeChat] 已发送图片: {img_rel_path} - {img_resp.json()}')
-                        except Exception as e:
-                            spider.logger.error(f'[WeChat] 发送图片失败 {img_rel_path}: {e}')
+            messages = self.build_wechat_messages(article_data, spider)
+            added = self.outbox.enqueue(url, self.webhook_urls, messages, dedupe_key=dedupe_key)
+            if not added:
+                spider.logger.info(f'[WeChat] 已在发件箱中，跳过: {url}')
+                return
+            self.delivery.notify()
+            spider.logger.info(f'[WeChat] 已加入发件箱: {added} 条消息（{len(self.webhook_urls)} 个机器人）')
+        except Exception as e:
+            spider.logger.error(f'[WeChat] 加入发件箱失败: {e}')
+
+    def _flush_digest(self, spider, older_than):
+        """最早一篇待合并的文章已等待 older_than 秒时，打包成摘要消息入队"""
+        try:
+            if self.outbox.flush_digest(self.webhook_urls, older_than):
+                self.delivery.notify()
         except Exception as e:
-            spider.logger.error(f'[WeChat] 发送失败: {e}')
+            spider.logger.error(f'[WeChat] 合并摘要失败: {e}')
+
+    def build_wechat_messages(self, article_data, spider):
+        """构建一篇文章的全部消息：markdown 正文（必要时分段）+ 图片"""
+        messages = []
+        title = article_data.get('title', '（无标题）')
+        segments = split_markdown(title, article_data.get('text', ''),
+                                  article_data.get('url', ''), article_data.get('scraped_at', ''))
+        if len(segments) > 1:
+            spider.logger.info(f'[WeChat] 文章过长，分{len(segments)}段发送')
+        for segment_md in segments:
+            messages.append({'msgtype': 'markdown', 'markdown': {'content': segment_md}})
+
+        # 图片只记录文件路径和预先算好的 MD5，发送时再读取编码
+        images_dir = self.data_dir / 'images'
+        meta_by_path = {m['path']: m for m in article_data.get('image_meta', [])}
+        for img_rel_path in article_data.get('images', []):
+            img_path = images_dir / img_rel_path
+            if not img_path.exists():
+                continue
+            meta = meta_by_path.get(img_rel_path, {})
+            if meta.get('size') and meta['size'] > IMAGE_MAX_BYTES:
+                spider.logger.warning(f'[WeChat] 图片超过 2MB，跳过: {img_rel_path}')
+                continue
+            message = {'msgtype': 'image', 'image_file': str(img_path)}
+            if meta.get('checksum'):
+                message['md5'] = meta['checksum']
+            messages.append(message)
+        return messages
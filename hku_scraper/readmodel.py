@@ -0,0 +1,246 @@
+"""
+文章读模型服务
+/api/hku-news 每次请求都重新读取、解析整个 news_index.json 和 N_article.json。这里提供一个常驻的只读视图，
+由本地 HTTP 服务对外提供，响应结构与 Node.js 接口相同：
+
+- 启动时从 articles.db 读一次全部文章的摘要列（不读正文），按抓取时间倒序排好；
+  分页只对排好序的列表切片，耗时只与每页条数有关，与文章总数无关
+- 详情按主键从 articles.db 读取正文，序列化好的响应体放进按字节数限制的 LRU，命中时不再查库、不再序列化
+- 增量失效：SaveJsonPipeline 每次新增或覆盖正文时 ArticleStore 都会分配新的 changed_seq。每个请求先查看
+  PRAGMA data_version（只有其他连接提交过才会变化），变化时只取 changed_seq 大于已知水位的文章，
+  调整它们在列表中的位置，并从 LRU 中淘汰对应的正文
+- ETag：列表为 W/"水位-页码-每页条数"，详情为 "id-changed_seq"；请求带 If-None-Match 且未变化时返回 304
+
+接口（默认只监听 127.0.0.1）:
+    GET /api/hku-news?page=1&page_size=20
+    GET /api/hku-news/<id>
+
+用法:
+    python -m hku_scraper.readmodel serve [端口]
+"""
+
+import sys
+import json
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from hku_scraper.store import article_filename, connect
+from hku_scraper.utils import get_data_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# 详情响应体缓存的字节上限
+DEFAULT_CACHE_BYTES = 32 * 1024 * 1024
+
+SUMMARY_SQL = ("SELECT id, url, title, scraped_at, json_extract(body, '$.site') AS site, changed_seq "
+               'FROM articles')
+
+
+class ReadModel:
+    """articles.db 之上的只读视图：排好序的文章摘要 + 详情响应体 LRU（线程安全）"""
+
+    def __init__(self, data_dir=None, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.data_dir = Path(data_dir) if data_dir else get_data_dir()
+        self.conn = connect(self.data_dir / 'articles.db')
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        # id -> 摘要 dict；_order 按 (scraped_at, id) 升序排列，分页时从尾部倒着取
+        self._summaries = {}
+        self._order = []
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self.watermark = 0
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._apply(self.conn.execute(SUMMARY_SQL).fetchall())
+            self._data_version = self._current_data_version()
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __len__(self):
+        return len(self._order)
+
+    def _current_data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    @staticmethod
+    def _key(summary):
+        return (summary['scraped_at'] or '', summary['id'])
+
+    def _apply(self, rows):
+        """把新增或变化的文章并入列表，淘汰它们的缓存正文"""
+        for row in rows:
+            summary = dict(row)
+            old = self._summaries.get(summary['id'])
+            if old is not None:
+                key = self._key(old)
+                del self._order[bisect.bisect_left(self._order, key)]
+                self._evict(summary['id'])
+            summary['file'] = article_filename(summary['id'])
+            self._summaries[summary['id']] = summary
+            bisect.insort(self._order, self._key(summary))
+            self.watermark = max(self.watermark, summary['changed_seq'] or 0)
+
+    def refresh(self):
+        """其他连接（爬虫）提交过时，增量读取 changed_seq 超过水位的文章，返回变化的篇数"""
+        with self._lock:
+            version = self._current_data_version()
+            if version == self._data_version:
+                return 0
+            self._data_version = version
+            rows = self.conn.execute(f'{SUMMARY_SQL} WHERE changed_seq > ?', (self.watermark,)).fetchall()
+            self._apply(rows)
+        if rows:
+            logger.info(f'[ReadModel] {len(rows)} 篇文章新增或更新，水位 {self.watermark}')
+        return len(rows)
+
+    def page(self, page=1, page_size=DEFAULT_PAGE_SIZE):
+        """按抓取时间倒序的第 page 页（从 1 开始），返回 (ETag, 响应 dict)"""
+        self.refresh()
+        with self._lock:
+            total = len(self._order)
+            end = max(total - (page - 1) * page_size, 0)
+            start = max(end - page_size, 0)
+            data = [self._summaries[article_id] for _, article_id in reversed(self._order[start:end])]
+            etag = f'W/"{self.watermark}-{page}-{page_size}"'
+        return etag, {'success': True, 'data': [_public(s) for s in data], 'total': total,
+                      'page': page, 'page_size': page_size}
+
+    def detail(self, article_id):
+        """文章详情，返回 (ETag, 序列化好的响应体)；文章不存在时返回 (None, None)"""
+        self.refresh()
+        with self._lock:
+            cached = self._cache.get(article_id)
+            if cached is not None:
+                self._cache.move_to_end(article_id)
+                self.hits += 1
+                return cached
+            summary = self._summaries.get(article_id)
+            if summary is None:
+                return None, None
+            row = self.conn.execute('SELECT body FROM articles WHERE id = ?', (article_id,)).fetchone()
+            self.misses += 1
+            body = f'{{"success": true, "data": {row["body"]}}}'.encode('utf-8')
+            entry = (f'"{article_id}-{summary["changed_seq"]}"', body)
+            self._cache[article_id] = entry
+            self._cached_bytes += len(body)
+            while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+            return entry
+
+    def _evict(self, article_id):
+        entry = self._cache.pop(article_id, None)
+        if entry is not None:
+            self._cached_bytes -= len(entry[1])
+
+
+def _public(summary):
+    return {key: summary[key] for key in ('id', 'title', 'url', 'site', 'scraped_at', 'file')}
+
+
+def _json(payload):
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+class ReadModelHandler(BaseHTTPRequestHandler):
+    """GET /api/hku-news 与 /api/hku-news/<id>；self.server.model 为 ReadModel"""
+
+    server_version = 'HKUReadModel/1.0'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip('/')
+        if path == '/api/hku-news':
+            query = parse_qs(parts.query)
+            try:
+                page = int(query.get('page', ['1'])[0])
+                page_size = int(query.get('page_size', [str(DEFAULT_PAGE_SIZE)])[0])
+            except ValueError:
+                return self._send(400, _json({'success': False, 'error': 'page / page_size 必须是整数'}))
+            if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+                return self._send(400, _json({'success': False,
+                                              'error': f'page >= 1，page_size 取 1~{MAX_PAGE_SIZE}'}))
+            etag, payload = self.server.model.page(page, page_size)
+            if self._not_modified(etag):
+                return None
+            return self._send(200, _json(payload), etag)
+
+        if path.startswith('/api/hku-news/'):
+            article_id = path.rsplit('/', 1)[1]
+            etag, body = self.server.model.detail(int(article_id)) if article_id.isdigit() else (None, None)
+            if body is None:
+                return self._send(404, _json({'success': False, 'error': '新闻不存在'}))
+            if self._not_modified(etag):
+                return None
+            return self._send(200, body, etag)
+        return self._send(404, _json({'success': False, 'error': 'not found'}))
+
+    def _not_modified(self, etag):
+        if etag and etag in (self.headers.get('If-None-Match') or ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return True
+        return False
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+            # 允许缓存，但每次都要带 If-None-Match 回来验证
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f'[ReadModel] {self.address_string()} {format % args}')
+
+
+def make_server(model, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """创建 HTTP 服务（port 为 0 时由系统分配），调用 serve_forever() 开始服务"""
+    server = ThreadingHTTPServer((host, port), ReadModelHandler)
+    server.daemon_threads = True
+    server.model = model
+    return server
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'serve' or (len(argv) > 1 and not argv[1].isdigit()):
+        print('用法: python -m hku_scraper.readmodel serve [端口]')
+        return 1
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s')
+    port = int(argv[1]) if len(argv) > 1 else DEFAULT_PORT
+    model = ReadModel()
+    server = make_server(model, port=port)
+    print(f'[ReadModel] 已加载 {len(model)} 篇文章，监听 http://{DEFAULT_HOST}:{server.server_port}/api/hku-news')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        model.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
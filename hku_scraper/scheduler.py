@@ -0,0 +1,229 @@
+"""
+自适应轮询调度
+代替固定间隔轮询：按每个站点的发文规律分配轮询次数，活跃时段轮询更频繁，深夜/周末少轮询。
+
+- 发文规律：articles.db 中近 HISTORY_WEEKS 周的 scraped_at 按“星期几 × 小时”（一周 168 个时段）统计
+  新文章到达率，相邻时段平滑，并混入一周均匀分布的先验，没有历史的站点也有合理的初始间隔
+- 轮询次数：每周总预算 polls_per_week 按到达率的平方根分配到各时段
+  （固定请求数下使平均发现延迟最小），下次轮询时间沿时间轴累计到 1 次为止，
+  安静时段结束、活跃时段开始时会提前醒来
+- 退避：连续没有新文章时间隔按 IDLE_BACKOFF 倍增（最多 MAX_IDLE_FACTOR 倍），
+  出错时按 ERROR_BACKOFF 指数退避；间隔限制在 [min_interval, max_interval]，再加 ±JITTER 随机抖动
+- 多个目标（站点）共用一个有界线程池，同时运行的爬虫不超过 workers 个
+"""
+
+import math
+import time
+import heapq
+import random
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+WEEK_HOURS = 7 * 24
+
+HISTORY_WEEKS = 8
+# 相邻时段平滑权重（前一小时, 本小时, 后一小时）
+SMOOTHING = (0.25, 0.5, 0.25)
+# 没有任何历史时假定的每周文章数
+PRIOR_ARTICLES_PER_WEEK = 7
+
+DEFAULT_MIN_INTERVAL = 10 * 60
+DEFAULT_MAX_INTERVAL = 4 * HOUR
+# 每个目标每周的轮询预算（固定每小时一次为 168 次）
+DEFAULT_POLLS_PER_WEEK = 120
+DEFAULT_WORKERS = 2
+
+IDLE_BACKOFF = 1.25
+MAX_IDLE_FACTOR = 4
+ERROR_BACKOFF = 2.0
+JITTER = 0.1
+
+
+def hour_of_week(when):
+    return when.weekday() * 24 + when.hour
+
+
+class PublicationRhythm:
+    """一周 168 个时段的新文章到达率（篇/小时）"""
+
+    def __init__(self, timestamps=(), now=None, weeks=HISTORY_WEEKS):
+        now = now or datetime.now()
+        window_start = now - timedelta(weeks=weeks)
+        counts = [0.0] * WEEK_HOURS
+        earliest = None
+        for ts in timestamps:
+            when = _parse_time(ts)
+            if when is None or not window_start <= when <= now:
+                continue
+            counts[hour_of_week(when)] += 1
+            earliest = when if earliest is None or when < earliest else earliest
+        self.total = int(sum(counts))
+        span_weeks = 1.0
+        if earliest is not None:
+            span_weeks = min(max((now - earliest) / timedelta(weeks=1), 1.0), weeks)
+
+        before, center, after = SMOOTHING
+        smoothed = [before * counts[h - 1] + center * counts[h] + after * counts[(h + 1) % WEEK_HOURS]
+                    for h in range(WEEK_HOURS)]
+        # 一周的均匀先验：按观测到的平均每周文章数（没有历史时用 PRIOR_ARTICLES_PER_WEEK）
+        per_week = self.total / span_weeks if self.total else PRIOR_ARTICLES_PER_WEEK
+        prior = per_week / WEEK_HOURS
+        self.rates = [(count + prior) / (span_weeks + 1) for count in smoothed]
+
+    def rate(self, when):
+        return self.rates[hour_of_week(when)]
+
+
+class PollPolicy:
+    """根据发文规律、连续空轮询次数与连续错误次数计算下次轮询的等待秒数"""
+
+    def __init__(self, min_interval=DEFAULT_MIN_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 polls_per_week=DEFAULT_POLLS_PER_WEEK, jitter=JITTER, rng=None):
+        if not 0 < min_interval <= max_interval:
+            raise ValueError(f'轮询间隔范围无效: {min_interval} ~ {max_interval}')
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.polls_per_week = polls_per_week
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def polls_per_hour(self, rhythm):
+        """各时段每小时的轮询次数：按到达率平方根分配每周预算"""
+        weights = [math.sqrt(rate) for rate in rhythm.rates]
+        total = sum(weights)
+        return [self.polls_per_week * w / total for w in weights]
+
+    def rhythm_delay(self, rhythm, now):
+        """从 now 起沿时间轴累计轮询次数，累计到 1 次的时刻即下次轮询（不含退避与抖动）"""
+        per_hour = self.polls_per_hour(rhythm)
+        elapsed = 0.0
+        mass = 0.0
+        cursor = now
+        while elapsed < self.max_interval:
+            into_hour = cursor.minute * 60 + cursor.second + cursor.microsecond / 1e6
+            span = min(HOUR - into_hour, self.max_interval - elapsed)
+            per_second = per_hour[hour_of_week(cursor)] / HOUR
+            if per_second > 0 and mass + per_second * span >= 1:
+                elapsed += (1 - mass) / per_second
+                break
+            mass += per_second * span
+            elapsed += span
+            cursor += timedelta(seconds=span)
+        return min(max(elapsed, self.min_interval), self.max_interval)
+
+    def next_delay(self, rhythm, now=None, idle_polls=0, errors=0):
+        now = now or datetime.now()
+        delay = self.rhythm_delay(rhythm, now) * min(IDLE_BACKOFF ** idle_polls, MAX_IDLE_FACTOR)
+        if errors:
+            delay = max(delay, self.min_interval * ERROR_BACKOFF ** errors)
+        delay = min(delay, self.max_interval)
+        return delay * (1 + self.rng.uniform(-self.jitter, self.jitter))
+
+
+class PollTarget:
+    """一个轮询目标（通常是一个站点）
+
+    poll() 执行一次抓取并返回新文章数，失败时抛出异常；
+    history() 返回该目标已保存文章的 scraped_at 列表，用于学习发文规律。
+    """
+
+    def __init__(self, name, poll, history=None):
+        self.name = name
+        self.poll = poll
+        self.history = history or (lambda: [])
+        self.idle_polls = 0
+        self.errors = 0
+        self.next_due = 0.0
+
+
+class AdaptiveScheduler:
+    """在有界线程池中按各目标的自适应间隔反复运行 poll()"""
+
+    def __init__(self, targets, policy=None, workers=DEFAULT_WORKERS, clock=time.time, sleep=time.sleep):
+        self.targets = list(targets)
+        self.policy = policy or PollPolicy()
+        self.workers = max(1, workers)
+        self.clock = clock
+        self.sleep = sleep
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def record(self, target, new_articles=0, error=None):
+        """记录一次轮询结果，返回下次轮询前的等待秒数"""
+        if error is not None:
+            target.errors += 1
+        else:
+            target.errors = 0
+            target.idle_polls = 0 if new_articles else target.idle_polls + 1
+        now = self.clock()
+        rhythm = PublicationRhythm(target.history(), now=datetime.fromtimestamp(now))
+        delay = self.policy.next_delay(rhythm, datetime.fromtimestamp(now),
+                                       idle_polls=target.idle_polls, errors=target.errors)
+        target.next_due = now + delay
+        logger.info(f'[Scheduler] {target.name}: 新文章 {new_articles}，'
+                    f'连续空轮询 {target.idle_polls}，连续错误 {target.errors}，'
+                    f'{delay / 60:.1f} 分钟后再次检测')
+        return delay
+
+    def run(self, max_polls=None):
+        """运行直到 stop() 或完成 max_polls 次轮询；所有目标启动时立即检测一次"""
+        queue = [(self.clock(), i, target) for i, target in enumerate(self.targets)]
+        heapq.heapify(queue)
+        running = {}
+        completed = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='poll') as pool:
+            while not self._stopped and (max_polls is None or completed < max_polls):
+                now = self.clock()
+                while queue and queue[0][0] <= now and len(running) < self.workers:
+                    _, order, target = heapq.heappop(queue)
+                    running[pool.submit(target.poll)] = (order, target)
+                if not running and not queue:
+                    break
+                timeout = max(queue[0][0] - now, 0) if queue and len(running) < self.workers else None
+                if not running:
+                    # 分段睡眠，stop() 最多一分钟内生效
+                    self.sleep(min(timeout, 60))
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    order, target = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        logger.error(f'[Scheduler] {target.name} 抓取失败: {error}')
+                        self.record(target, error=error)
+                    else:
+                        self.record(target, future.result() or 0)
+                    heapq.heappush(queue, (target.next_due, order, target))
+                    completed += 1
+        return completed
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def site_matcher(site):
+    """返回判断 URL 是否属于该站点（allowed_domains 及其子域名）的函数"""
+    domains = tuple(site['allowed_domains'])
+
+    def matches(url):
+        host = urlparse(url).hostname or ''
+        return any(host == d or host.endswith('.' + d) for d in domains)
+    return matches
+
+
+def site_history(store, site, weeks=HISTORY_WEEKS, now=None):
+    """某站点近 weeks 周保存的文章的 scraped_at 列表"""
+    since = ((now or datetime.now()) - timedelta(weeks=weeks)).isoformat()
+    matches = site_matcher(site)
+    return [scraped_at for url, scraped_at in store.scraped_since(since) if matches(url)]
@@ -0,0 +1,227 @@
+"""
+HKU 文章全文检索
+倒排索引保存在数据目录下的 search.db（SQLite WAL），与 articles.db 分开：
+
+- 分词在 Python 中完成：连续的中日韩文字按相邻两字切分（单字成词），其余字母数字整体作为一个词（小写），
+  分好的词以空格连接写入 SQLite FTS5 表（ascii 分词器只按空格切开，不再二次分词）
+- 排序：FTS5 内置 BM25，标题列权重 TITLE_WEIGHT，正文列权重 1
+- 增量更新：SaveJsonPipeline 每保存/更新一篇文章就重新索引该篇；FTS5 自动合并索引段，
+  数万篇文章时单篇写入与查询都在毫秒级
+- 查询只读索引与 docs 摘要表，不读取文章正文或 N_article.json
+
+查询与重建:
+    python -m hku_scraper.search query 关键词 [条数]
+    python -m hku_scraper.search rebuild [数据目录]
+"""
+
+import re
+import sys
+import sqlite3
+import threading
+from pathlib import Path
+
+from hku_scraper.utils import get_data_dir
+
+SEARCH_DB = 'search.db'
+
+# 标题命中的 BM25 分数按几倍计
+TITLE_WEIGHT = 2.0
+DEFAULT_LIMIT = 10
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    url TEXT,
+    site TEXT,
+    scraped_at TEXT
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(title, body, tokenize = 'ascii');
+INSERT OR IGNORE INTO docs_fts (docs_fts, rank) VALUES ('rank', 'bm25({TITLE_WEIGHT}, 1.0)');
+'''
+
+# 中日韩文字（含扩展 A、兼容汉字、假名、韩文音节）
+_CJK = '぀-ヿ㐀-䶿一-鿿豈-﫿가-힯'
+TOKEN_RE = re.compile(rf'([{_CJK}]+)|([^\W_{_CJK}]+)', re.UNICODE)
+
+# 先在 FTS5 内按 rank 取前 N 条，再关联摘要表
+SEARCH_SQL = '''
+SELECT d.id, d.title, d.url, d.site, d.scraped_at, -hits.rank AS score
+FROM (SELECT rowid, rank FROM docs_fts WHERE docs_fts MATCH ? ORDER BY rank LIMIT ?) AS hits
+JOIN docs d ON d.id = hits.rowid
+ORDER BY hits.rank
+'''
+
+
+def tokenize(text):
+    """中日韩文字取相邻两字（连续只有一个字时取单字），其余字母数字整体作为一个词"""
+    tokens = []
+    for cjk, word in TOKEN_RE.findall((text or '').lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def match_expression(terms):
+    """查询词 -> FTS5 MATCH 表达式（任一词命中即可，按 BM25 排序）"""
+    return ' OR '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+class SearchIndex:
+    """文章倒排索引：按文章 id 增量更新，BM25 查询"""
+
+    def __init__(self, db_file=None):
+        self.db_file = Path(db_file) if db_file else get_data_dir() / SEARCH_DB
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(str(self.db_file), timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        # 每个词出现在多少篇文章中（FTS5 自带的统计，只对本连接可见）
+        self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS temp.docs_vocab USING fts5vocab(main, docs_fts, row)')
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+
+    def doc_ids(self):
+        with self._lock:
+            return {row[0] for row in self.conn.execute('SELECT id FROM docs')}
+
+    def _write(self, article_id, article):
+        self.conn.execute('DELETE FROM docs_fts WHERE rowid = ?', (article_id,))
+        self.conn.execute(
+            'INSERT OR REPLACE INTO docs (id, title, url, site, scraped_at) VALUES (?, ?, ?, ?, ?)',
+            (article_id, article.get('title'), article.get('url'),
+             article.get('site'), article.get('scraped_at')))
+        self.conn.execute(
+            'INSERT INTO docs_fts (rowid, title, body) VALUES (?, ?, ?)',
+            (article_id, ' '.join(tokenize(article.get('title'))), ' '.join(tokenize(article.get('text')))))
+
+    def index_article(self, article_id, article):
+        """索引（或重新索引）一篇文章；同一 id 再次索引时替换旧内容"""
+        with self._lock:
+            with self.conn:
+                self._write(article_id, article)
+
+    def remove_article(self, article_id):
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM docs_fts WHERE rowid = ?', (article_id,))
+                self.conn.execute('DELETE FROM docs WHERE id = ?', (article_id,))
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """按 BM25 返回最相关的 limit 篇文章：[{id, title, url, site, scraped_at, score}]
+
+        查询词按与正文相同的规则分词，任一词命中即参与排序，score 越大越相关。
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+        with self._lock:
+            terms = self._selective_terms(terms)
+            if not terms:
+                return []
+            rows = self.conn.execute(SEARCH_SQL, (match_expression(terms), limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def _selective_terms(self, terms):
+        """去掉索引中不存在的词；还有其它词时再去掉出现在一半以上文章中的词
+
+        BM25 对这类词的 idf 接近 0，对排序几乎没有影响，却要遍历几乎全部文章的倒排项。
+        """
+        placeholders = ','.join('?' * len(terms))
+        dfs = dict(self.conn.execute(
+            f'SELECT term, doc FROM temp.docs_vocab WHERE term IN ({placeholders})', terms).fetchall())
+        half = len(self) / 2
+        selective = [term for term in terms if 0 < dfs.get(term, 0) <= half]
+        return selective or [term for term in terms if dfs.get(term)]
+
+    def sync(self, store, batch_size=500):
+        """补索引 articles.db 中还没有进入索引的文章（首次启用或上次中途退出），返回补上的篇数
+
+        每 batch_size 篇一个事务，数万篇的首次建索引不必逐篇提交。
+        """
+        missing = sorted(store.article_ids() - self.doc_ids())
+        for start in range(0, len(missing), batch_size):
+            with self._lock:
+                with self.conn:
+                    for article_id in missing[start:start + batch_size]:
+                        article = store.get_article(article_id)
+                        if article is not None:
+                            self._write(article_id, article)
+        if missing:
+            with self._lock:
+                with self.conn:
+                    self.conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('optimize')")
+        return len(missing)
+
+    def rebuild(self, store):
+        """清空后按 articles.db 重建整个索引，返回索引的篇数"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM docs_fts')
+                self.conn.execute('DELETE FROM docs')
+        return self.sync(store)
+
+
+def open_index(data_dir=None, store=None):
+    """打开数据目录下的 search.db；传入 store 时补索引尚未进入索引的文章"""
+    data_dir = Path(data_dir) if data_dir else get_data_dir()
+    index = SearchIndex(data_dir / SEARCH_DB)
+    if store is not None:
+        index.sync(store)
+    return index
+
+
+def search(query, limit=DEFAULT_LIMIT, data_dir=None):
+    """查询数据目录下的索引（只读文章摘要，不读取正文）"""
+    index = SearchIndex((Path(data_dir) if data_dir else get_data_dir()) / SEARCH_DB)
+    try:
+        return index.search(query, limit)
+    finally:
+        index.close()
+
+
+def main(argv=None):
+    from hku_scraper.store import open_store
+
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) >= 2 and argv[0] == 'query':
+        limit = int(argv[2]) if len(argv) > 2 else DEFAULT_LIMIT
+        results = search(argv[1], limit)
+        for rank, hit in enumerate(results, 1):
+            print(f'{rank:>3}. [{hit["score"]:.2f}] #{hit["id"]} {hit["title"]}  {hit["url"]}')
+        print(f'[Search] 共 {len(results)} 条结果')
+        return 0
+    if argv and argv[0] == 'rebuild':
+        data_dir = Path(argv[1]) if len(argv) > 1 else get_data_dir()
+        store = open_store(data_dir)
+        index = SearchIndex(data_dir / SEARCH_DB)
+        try:
+            indexed = index.rebuild(store)
+            print(f'[Search] 已索引 {indexed} 篇文章 -> {index.db_file}')
+        finally:
+            index.close()
+            store.close()
+        return 0
+    print('用法: python -m hku_scraper.search query 关键词 [条数]\n'
+          '      python -m hku_scraper.search rebuild [数据目录]')
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
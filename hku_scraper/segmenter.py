@@ -0,0 +1,96 @@
+"""
+企业微信 markdown 消息分段
+企业微信 markdown 消息限制 4096 字节（UTF-8 字节，不是字符）。
+
+正文只编码一次：每段直接在字节偏移上计算上限位置，回退到 UTF-8 字符边界，
+再用 rfind 找到上限前最近的句末标点（。！？. 等）断开；
+整体为线性时间，不会反复编码或切片剩余文本。
+"""
+
+# 企业微信限制 4096 字节，保留少量余量
+MAX_SEGMENT_BYTES = 4050
+
+CONTINUE_SUFFIX = '\n\n_（内容较长，续见下条）_'
+
+# 句末标点：优先在这些字符之后断开（英文句点要求后面跟空格，避免拆开 3.5、URL 等）
+SENTENCE_ENDINGS = tuple(p.encode('utf-8') for p in ('。', '！', '？', '；', '…', '!', '?', ';', '. '))
+# 次选断点：逗号、顿号、冒号、空格
+SOFT_BREAKS = tuple(p.encode('utf-8') for p in ('，', '、', '：', ',', ':', ' '))
+
+# 一段正文至少要占满可用字节的这个比例，才会回退到标点处断开，避免切出很短的段
+MIN_FILL_RATIO = 0.5
+
+
+def utf8_len(s):
+    return len(s.encode('utf-8'))
+
+
+def char_boundary(data, pos):
+    """把字节位置回退到 UTF-8 字符边界（最多回退 3 字节）"""
+    while 0 < pos < len(data) and (data[pos] & 0xC0) == 0x80:
+        pos -= 1
+    return pos
+
+
+def last_break(data, low, high, marks):
+    """data[low:high] 中最后一个断点之后的位置，没有则返回 None
+
+    英文句点的标记是 b'. '，断在句点之后、空格之前。
+    """
+    best = -1
+    for mark in marks:
+        found = data.rfind(mark, low, high)
+        if found >= 0:
+            cut = found + (1 if mark == b'. ' else len(mark))
+            if cut > best:
+                best = cut
+    return best if best > low else None
+
+
+def split_markdown(title, text, url, scraped_at, max_bytes=MAX_SEGMENT_BYTES):
+    """把文章构建成一条或多条 markdown 消息，每条不超过 max_bytes 字节
+
+    第一段以 **标题** 开头，后续段为 **标题（续N）**；
+    除最后一段外以“内容较长，续见下条”结尾，最后一段附原文链接和抓取时间。
+    """
+    plain_text = text.replace('\n', ' ').strip()
+    prefix = f'**{title}**\n\n'
+    final_suffix = f'\n\n[阅读原文]({url})\n\n_抓取时间: {scraped_at}_'
+
+    full_content = prefix + plain_text + final_suffix
+    if utf8_len(full_content) <= max_bytes:
+        return [full_content]
+
+    data = plain_text.encode('utf-8')
+    n = len(data)
+    continue_bytes = utf8_len(CONTINUE_SUFFIX)
+    final_bytes = utf8_len(final_suffix)
+
+    segments = []
+    start = 0
+    segment_num = 1
+    while True:
+        header = prefix if segment_num == 1 else f'**{title}（续{segment_num}）**\n\n'
+        header_bytes = utf8_len(header)
+
+        # 剩余正文连同最终后缀放得下，就是最后一段
+        if header_bytes + n - start + final_bytes <= max_bytes:
+            segments.append(header + data[start:].decode('utf-8') + final_suffix)
+            return segments
+
+        budget = max_bytes - header_bytes - continue_bytes
+        # 至少留一个字符给最后一段，保证最后一段带正文
+        end = char_boundary(data, min(start + budget, char_boundary(data, n - 1)))
+        if end <= start:
+            raise ValueError(f'标题过长，无法在 {max_bytes} 字节内分段: {title[:50]}')
+
+        min_cut = start + int((end - start) * MIN_FILL_RATIO)
+        cut = (last_break(data, min_cut, end, SENTENCE_ENDINGS)
+               or last_break(data, min_cut, end, SOFT_BREAKS)
+               or end)
+
+        segments.append(header + data[start:cut].decode('utf-8').rstrip() + CONTINUE_SUFFIX)
+        start = cut
+        while start < n - 1 and data[start] in b' \t\r':
+            start += 1
+        segment_num += 1
@@ -10,14 +10,56 @@ NEWSPIDER_MODULE = 'hku_scraper.spiders'
 # Obey robots.txt rules
 ROBOTSTXT_OBEY = False
 
-# Configure maximum concurrent requests per domain
-CONCURRENT_REQUESTS = 4
+# Site definitions for the news_sites spider (list/detail selectors, pagination, politeness)
+# Defaults to config/sites.json
+SITES_FILE = None
 
-# Configure a delay for requests for the same website
-DOWNLOAD_DELAY = 2
+# Global cap across all sites; each domain gets its own slot from the site's politeness budget
+# (DOWNLOAD_SLOTS is generated by NewsSitesSpider), so total time follows the slowest site
+CONCURRENT_REQUESTS = 32
 
-# The download delay setting will honor only one of:
-CONCURRENT_REQUESTS_PER_DOMAIN = 4
+# Fallback for domains that are not in the site definitions
+CONCURRENT_REQUESTS_PER_DOMAIN = 2
+DOWNLOAD_DELAY = 0.5
+
+# AutoThrottle adapts each slot's delay to the server latency; SiteAutoThrottle keeps
+# every slot at or above its site's configured delay instead of the global DOWNLOAD_DELAY
+AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_START_DELAY = 1
+AUTOTHROTTLE_MAX_DELAY = 30
+AUTOTHROTTLE_TARGET_CONCURRENCY = 2.0
+
+EXTENSIONS = {
+    'scrapy.extensions.throttle.AutoThrottle': None,
+    'hku_scraper.throttle.SiteAutoThrottle': 0,
+    'hku_scraper.metrics.CrawlMetrics': 500,
+}
+
+# Per-stage timings (download, parse, parse_article, extract, images, save_json, search_index, wechat_send) and counters,
+# written after every run as last_run.json + a Prometheus textfile (hku_scraper.metrics)
+METRICS_ENABLED = True
+# Defaults to <data dir>/metrics
+METRICS_DIR = None
+
+SPIDER_MIDDLEWARES = {
+    'hku_scraper.metrics.CallbackTimingMiddleware': 990,
+}
+
+# Per-content-type download caps (hku_scraper.limits), checked when the response headers arrive:
+# a Content-Length over the cap aborts before the body is read, otherwise the cap becomes the
+# request's download_maxsize (streamed bodies and decompression stop there). Image requests only
+# accept image/* responses. Keys: exact MIME type, 'major/*' or '*'; 0 = no cap
+DOWNLOADER_MIDDLEWARES = {
+    'hku_scraper.limits.DownloadSizeLimits': 950,
+}
+DOWNLOAD_SIZE_LIMITS = {
+    'text/html': 2 * 1024 * 1024,
+    'application/xhtml+xml': 2 * 1024 * 1024,
+    'image/*': 10 * 1024 * 1024,
+    '*': 1 * 1024 * 1024,
+}
+# Hard cap for anything the per-type caps do not cover
+DOWNLOAD_MAXSIZE = 16 * 1024 * 1024
 
 # Disable cookies
 COOKIES_ENABLED = True
@@ -41,15 +83,70 @@ DEFAULT_REQUEST_HEADERS = {
 }
 
 # Configure item pipelines
-import os
-IMAGES_STORE = os.path.join(os.getenv('USERPROFILE') or os.getenv('HOME') or '.', 'Desktop', 'hku_news_data', 'images')
+from hku_scraper.utils import get_data_dir
+IMAGES_STORE = str(get_data_dir() / 'images')
+
+# Images larger than this are recompressed to JPEG before storing (WeChat robot limit: 2 MB)
+IMAGES_MAX_BYTES = 2 * 1024 * 1024
 
 ITEM_PIPELINES = {
-    'scrapy.pipelines.images.ImagesPipeline': 100,
+    'hku_scraper.offload.OffloadPipeline': 50,
+    'hku_scraper.images.CachedImagesPipeline': 100,
     'hku_scraper.pipelines.SaveJsonPipeline': 200,
 }
 
-# Enable and configure HTTP caching
+# CPU-heavy item work (hku_scraper.offload) runs off the reactor: article extraction + fingerprint
+# (OffloadPipeline), image hashing/re-encoding and SaveJsonPipeline saves.
+# OFFLOAD_POOL 'process' spreads extraction over several cores; 'thread' avoids process start-up.
+# OFFLOAD_WORKERS None = CPU count - 1 (at most 4; inline on single-core machines), 0 = run inline on the reactor thread.
+# At most OFFLOAD_MAX_PENDING tasks are in flight; further items wait (and slow the downloader down)
+OFFLOAD_POOL = 'process'
+OFFLOAD_WORKERS = None
+OFFLOAD_MAX_PENDING = 32
+
+# HTTP cache (hku_scraper.httpcache): list pages always revalidate with ETag/Last-Modified,
+# detail pages and images are immutable and served from cache without expiry.
+# Entries are compressed in .scrapy/httpcache/responses.db; least recently used ones are pruned
+# in the background once the cache exceeds HTTPCACHE_MAX_BYTES (down to HTTPCACHE_PRUNE_RATIO of it)
 HTTPCACHE_ENABLED = True
-HTTPCACHE_EXPIRATION_SECS = 3600
+HTTPCACHE_POLICY = 'hku_scraper.httpcache.RevalidatingPolicy'
+HTTPCACHE_STORAGE = 'hku_scraper.httpcache.CompressedLRUStorage'
+HTTPCACHE_EXPIRATION_SECS = 0
 HTTPCACHE_DIR = 'httpcache'
+HTTPCACHE_MAX_BYTES = 256 * 1024 * 1024
+HTTPCACHE_PRUNE_RATIO = 0.8
+
+# WeChat robot delivery (hku_scraper.delivery)
+# One webhook or a list; defaults to webhookUrl/webhookUrls in config/wechat.json,
+# then the WECHAT_WEBHOOK env var (comma separated). Every message goes to each of them
+WECHAT_WEBHOOK_URL = None
+# Group robots accept at most 20 messages per minute (limited per webhook)
+WECHAT_RATE_PER_MINUTE = 20
+# Seconds to keep delivering due messages when the spider closes; the rest stay in outbox.db
+WECHAT_DRAIN_TIMEOUT = 60
+# Digest mode (hku_scraper.digest): send new articles as packed title/summary/link messages
+# instead of full text and images. With WECHAT_DIGEST_WINDOW = 0 each crawl sends one digest
+# when it closes; otherwise articles are held until the oldest has waited that many seconds
+# (possibly across runs, e.g. 3600 for an hourly digest)
+WECHAT_DIGEST = False
+WECHAT_DIGEST_WINDOW = 0
+
+# Multi-instance coordination (hku_scraper.coordination). Point every runner instance at the
+# same database on a shared volume, e.g. 'sqlite:///mnt/shared/hku/coordination.db' or
+# 'sqlite:///Z:/hku/coordination.db'; None runs standalone. Instances split sites via leases
+# (COORDINATION_LEASE_SECS, longer than the adaptive max interval), share the set of claimed
+# detail URLs (claims expire after COORDINATION_CLAIM_SECS) and claim each notification once.
+# COORDINATION_INSTANCE defaults to the host name; set it when one host runs several instances
+COORDINATION_URL = None
+COORDINATION_INSTANCE = None
+COORDINATION_LEASE_SECS = 6 * 3600
+COORDINATION_CLAIM_SECS = 3600
+
+# Content fingerprints (hku_scraper.fingerprint): SimHash distance in bits.
+# Revalidated articles are re-saved and re-sent only beyond FINGERPRINT_CHANGE_DISTANCE;
+# new articles within FINGERPRINT_DUPLICATE_DISTANCE of a stored one are flagged as duplicates
+FINGERPRINT_CHANGE_DISTANCE = 3
+FINGERPRINT_DUPLICATE_DISTANCE = 3
+
+# Full-text search index (hku_scraper.search): <data dir>/search.db, updated by SaveJsonPipeline
+SEARCH_ENABLED = True
@@ -0,0 +1,94 @@
+"""
+新闻站点定义
+从 config/sites.json 读取每个站点的列表/详情选择器和礼貌抓取预算，供 NewsSitesSpider 使用。
+
+站点字段:
+    name             站点名（唯一）
+    start_urls       列表页入口
+    allowed_domains  允许抓取的域名，默认取 start_urls 的域名
+    list_selector    列表项 CSS 选择器
+    link_selector    列表项内链接（默认 a::attr(href)）
+    title_selector   列表项内标题（默认 a::text）
+    detail_selector  详情页正文容器 CSS 选择器
+    text_limit       正文最多保留字符数（默认 5000）
+    image_limit      最多保留图片数（默认 10）
+    politeness       {"concurrency": 每域名并发, "delay": 最小请求间隔秒数}
+    pagination       可选，{"next_selector": 下一页链接} 或 {"url_template": "/news?page={page}"}，
+                     max_pages 为增量模式最多翻的页数（默认 10）
+"""
+
+import json
+from copy import deepcopy
+from pathlib import Path
+from urllib.parse import urlparse
+
+DEFAULT_SITES_FILE = Path(__file__).parent.parent / 'config' / 'sites.json'
+
+REQUIRED_FIELDS = ('name', 'start_urls', 'list_selector', 'detail_selector')
+
+SITE_DEFAULTS = {
+    'link_selector': 'a::attr(href)',
+    'title_selector': 'a::text',
+    'text_limit': 5000,
+    'image_limit': 10,
+    'politeness': {'concurrency': 2, 'delay': 1.0},
+}
+
+PAGINATION_DEFAULTS = {'max_pages': 10}
+
+
+def _normalize(raw):
+    missing = [field for field in REQUIRED_FIELDS if not raw.get(field)]
+    if missing:
+        raise ValueError(f'站点定义缺少字段 {missing}: {raw.get("name") or raw}')
+    site = deepcopy(SITE_DEFAULTS)
+    site.update(deepcopy(raw))
+    site['politeness'] = {**SITE_DEFAULTS['politeness'], **raw.get('politeness', {})}
+    if site.get('pagination'):
+        pagination = {**PAGINATION_DEFAULTS, **site['pagination']}
+        if not (pagination.get('next_selector') or pagination.get('url_template')):
+            raise ValueError(f'站点 {site["name"]} 的 pagination 需要 next_selector 或 url_template')
+        site['pagination'] = pagination
+    if not site.get('allowed_domains'):
+        site['allowed_domains'] = sorted({urlparse(u).hostname for u in site['start_urls']})
+    return site
+
+
+def load_sites(sites_file=None, names=None):
+    """读取站点定义；names 不为空时只返回这些站点（按文件顺序）"""
+    sites_file = Path(sites_file) if sites_file else DEFAULT_SITES_FILE
+    with open(sites_file, 'r', encoding='utf-8') as f:
+        raw_sites = json.load(f).get('sites', [])
+
+    sites = [_normalize(raw) for raw in raw_sites]
+    seen = set()
+    for site in sites:
+        if site['name'] in seen:
+            raise ValueError(f'站点名重复: {site["name"]}')
+        seen.add(site['name'])
+
+    if names:
+        unknown = set(names) - seen
+        if unknown:
+            raise ValueError(f'未定义的站点: {sorted(unknown)}')
+        sites = [site for site in sites if site['name'] in names]
+    return sites
+
+
+def download_slots(sites):
+    """按域名生成 Scrapy DOWNLOAD_SLOTS：每个域名独立的并发数与最小间隔
+
+    多个站点共用一个域名时取更保守的预算（并发取小、间隔取大）。
+    """
+    slots = {}
+    for site in sites:
+        budget = site['politeness']
+        for domain in site['allowed_domains']:
+            slot = slots.get(domain)
+            if slot is None:
+                slots[domain] = {'concurrency': int(budget['concurrency']),
+                                 'delay': float(budget['delay'])}
+            else:
+                slot['concurrency'] = min(slot['concurrency'], int(budget['concurrency']))
+                slot['delay'] = max(slot['delay'], float(budget['delay']))
+    return slots
@@ -0,0 +1,371 @@
+"""
+多站点新闻爬虫
+按 config/sites.json 中的站点定义抓取各院系/高校新闻列表与详情页（文字+图片），
+所有站点在同一个进程内并发抓取，每个域名使用独立的下载槽（并发数与最小间隔见 DOWNLOAD_SLOTS），
+总耗时取决于最慢的站点，而不是所有站点之和。
+
+两种模式:
+    incremental（默认）沿列表分页向后翻，某一页全部是已抓取的 URL 时立即停止，
+        平时只需 1~2 页，两次运行之间新闻再多也不会漏；
+    backfill 一次性回填整个归档，忽略提前停止与 max_pages，以请求预算（budget）为上限。
+
+revalidate=N 时额外对最近 N 篇已抓取文章发送条件请求（If-None-Match / If-Modified-Since），
+304 直接跳过；内容指纹变化超过阈值才由 SaveJsonPipeline 重新保存并再次推送。
+
+断点续爬：列表页发现的新详情页先记入 articles.db 的 frontier 表再发出请求，文章保存时移出。
+上次运行中断留下的详情页在下次启动时最先请求（详情页在 HTTP 缓存中时不会重新下载），
+连续 FRONTIER_MAX_ATTEMPTS 次运行仍未保存的放弃。
+
+多实例部署（settings.py 设置 COORDINATION_URL，见 hku_scraper.coordination）时只抓取本实例租到的站点，
+详情页请求前在共享 URL 集合中认领，其他实例认领过或已保存的不再抓取。
+
+用法:
+    scrapy crawl news_sites                       # 抓取全部站点
+    scrapy crawl news_sites -a sites=hku_arts     # 只抓取指定站点（逗号分隔）
+    scrapy crawl news_sites -a mode=backfill -a budget=500
+    scrapy crawl news_sites -a revalidate=20
+"""
+
+import scrapy
+from datetime import datetime
+from urllib.parse import urljoin, urlparse
+
+from hku_scraper.coordination import DEFAULT_CLAIM_SECS, DEFAULT_LEASE_SECS, open_coordinator
+from hku_scraper.extractor import extract_article
+from hku_scraper.fingerprint import simhash
+from hku_scraper.offload import offload_enabled
+from hku_scraper.sites import load_sites, download_slots
+from hku_scraper.store import FRONTIER_MAX_ATTEMPTS, open_store
+from hku_scraper.utils import get_data_dir
+
+
+class NewsSitesSpider(scrapy.Spider):
+    """配置驱动的多站点新闻爬虫"""
+
+    name = 'news_sites'
+
+    # 子类可以固定只抓取部分站点
+    site_names = None
+
+    MODES = ('incremental', 'backfill')
+    # 回填模式默认最多发出的请求数（列表页 + 详情页）
+    DEFAULT_BACKFILL_BUDGET = 500
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        # 每个站点的礼貌预算转换为按域名的下载槽；settings.py 中手写的槽优先
+        slots = download_slots(load_sites(settings.get('SITES_FILE')))
+        slots.update(settings.getdict('DOWNLOAD_SLOTS'))
+        settings.set('DOWNLOAD_SLOTS', slots, priority='spider')
+
+    def __init__(self, *args, store=None, sites=None, sites_file=None,
+                 mode='incremental', budget=None, revalidate=0, coordinator=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if mode not in self.MODES:
+            raise ValueError(f'未知模式 {mode!r}，可选: {", ".join(self.MODES)}')
+        self.mode = mode
+        if budget is None and mode == 'backfill':
+            budget = self.DEFAULT_BACKFILL_BUDGET
+        # 剩余请求预算，None 表示不限
+        self.budget = int(budget) if budget is not None else None
+        self.revalidate = int(revalidate or 0)
+
+        # 初始化数据存储路径
+        self.data_dir = get_data_dir()
+        self.data_dir.mkdir(parents=True, exist_ok=True)
+
+        if isinstance(sites, str):
+            # 命令行 -a sites=a,b
+            sites = [name.strip() for name in sites.split(',') if name.strip()]
+        self.sites = {site['name']: site
+                      for site in load_sites(sites_file, names=sites or self.site_names)}
+        # 多实例分工时参与分配的站点总数（计算每个实例的份额）
+        self.total_sites = len(load_sites(sites_file, names=self.site_names))
+        self.allowed_domains = sorted({domain for site in self.sites.values()
+                                       for domain in site['allowed_domains']})
+        # 复查已抓取文章时按域名找回所属站点
+        self.site_by_domain = {}
+        for site in self.sites.values():
+            for domain in site['allowed_domains']:
+                self.site_by_domain.setdefault(domain, site)
+
+        # 文章存储（spider 判重与 SaveJsonPipeline 写入共用同一个实例）；
+        # 守护进程模式下由 runner 传入常驻内存的 store，避免每轮重新加载
+        self.owns_store = store is None
+        self.store = open_store(self.data_dir) if self.owns_store else store
+        # 多实例协调后端；未传入时按 COORDINATION_URL 在首次使用时打开
+        self._coordinator = coordinator
+        self.owns_coordinator = False
+
+        self.logger.info(f'[News Spider] 初始化完成，模式: {self.mode}，站点: {", ".join(self.sites)}，'
+                         f'数据目录: {self.data_dir}')
+
+    def closed(self, reason):
+        if self.owns_store:
+            self.store.close()
+        if self._coordinator is not None:
+            if reason != 'finished':
+                # 被中断（如 Ctrl-C）：立即交出租约，其他实例不必等到期
+                self._coordinator.release_sites(self.sites)
+            if self.owns_coordinator:
+                self._coordinator.close()
+
+    @property
+    def coordinator(self):
+        """多实例协调后端，单实例运行（未设置 COORDINATION_URL）时为 None"""
+        if self._coordinator is None:
+            settings = getattr(self, 'settings', None)
+            url = settings.get('COORDINATION_URL') if settings is not None else None
+            if url:
+                self._coordinator = open_coordinator(
+                    url, settings.get('COORDINATION_INSTANCE'),
+                    settings.getint('COORDINATION_LEASE_SECS', DEFAULT_LEASE_SECS),
+                    settings.getint('COORDINATION_CLAIM_SECS', DEFAULT_CLAIM_SECS))
+                self.owns_coordinator = True
+        return self._coordinator
+
+    def _lease_sites(self):
+        """多实例时只保留本实例租到的站点"""
+        if self.coordinator is None:
+            return
+        leased = set(self.coordinator.acquire_sites(self.sites, self.total_sites))
+        skipped = [name for name in self.sites if name not in leased]
+        if skipped:
+            self.logger.info(f'[Coordination] 由其他实例负责，跳过: {", ".join(skipped)}')
+        self.sites = {name: site for name, site in self.sites.items() if name in leased}
+        self.site_by_domain = {domain: site for domain, site in self.site_by_domain.items()
+                               if site['name'] in leased}
+
+    def _claim(self, urls):
+        """在共享 URL 集合中认领，返回本实例可以抓取的 URL"""
+        if self.coordinator is None:
+            return set(urls)
+        return self.coordinator.claim_urls(urls)
+
+    def _spend(self):
+        """消耗一次请求预算，预算用完时返回 False"""
+        if self.budget is None:
+            return True
+        if self.budget <= 0:
+            return False
+        self.budget -= 1
+        return True
+
+    async def start(self):
+        # Scrapy 2.13+ 只调用 start()，不再回退到 start_requests()
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        """列表页请求每次都回源验证（hku_scraper.httpcache），未变化时服务器只返回 304"""
+        self._lease_sites()
+        yield from self.resume_requests()
+        for site in self.sites.values():
+            for url in site['start_urls']:
+                if not self._spend():
+                    self.logger.warning('[Budget] 请求预算已用完，停止')
+                    return
+                yield scrapy.Request(url, callback=self.parse, dont_filter=True,
+                                     meta={'httpcache_revalidate': True, 'site': site['name'], 'page': 1})
+        if self.revalidate:
+            yield from self.revalidation_requests()
+
+    def resume_requests(self):
+        """上次运行中断时已发现、尚未保存的详情页"""
+        pending, dropped = self.store.resume_frontier(self.sites, FRONTIER_MAX_ATTEMPTS)
+        if dropped:
+            self.logger.warning(f'[Resume] {dropped} 个详情页连续 {FRONTIER_MAX_ATTEMPTS} 次未能保存，放弃')
+        if pending:
+            claimed = self._claim(entry['url'] for entry in pending)
+            pending = [entry for entry in pending if entry['url'] in claimed]
+            self.logger.info(f'[Resume] 续抓上次未完成的 {len(pending)} 个详情页')
+        for entry in pending:
+            if not self._spend():
+                self.logger.warning('[Budget] 请求预算已用完，其余详情页留待下次')
+                return
+            yield scrapy.Request(
+                entry['url'],
+                callback=self.parse_article,
+                meta={'title': entry['title'], 'url': entry['url'], 'site': entry['site']},
+            )
+
+    def revalidation_requests(self):
+        """对最近 N 篇已抓取文章发送条件请求，只复查属于本次站点的文章"""
+        for article in self.store.recent_articles(self.revalidate):
+            site = self.site_by_domain.get(urlparse(article['url']).hostname)
+            if site is None:
+                continue
+            if not self._spend():
+                self.logger.warning('[Budget] 请求预算已用完，停止复查')
+                return
+            headers = {}
+            if article['etag']:
+                headers['If-None-Match'] = article['etag']
+            if article['last_modified']:
+                headers['If-Modified-Since'] = article['last_modified']
+            yield scrapy.Request(
+                article['url'],
+                callback=self.parse_article,
+                headers=headers,
+                dont_filter=True,
+                meta={'title': article['title'], 'url': article['url'], 'site': site['name'],
+                      'revalidate_of': article['id'], 'dont_cache': True,
+                      'handle_httpstatus_list': [304]},
+            )
+
+    def _site(self, response):
+        """请求所属站点；直接调用 parse（没有 meta）且只配置了一个站点时取该站点"""
+        name = response.meta.get('site') if response.request is not None else None
+        if name is None and len(self.sites) == 1:
+            return next(iter(self.sites.values()))
+        return self.sites[name]
+
+    def parse(self, response):
+        """解析列表页，提取新闻链接；配置了分页时继续翻页"""
+        site = self._site(response)
+        page = response.meta.get('page', 1) if response.request is not None else 1
+        self.logger.info(f'[Parse List] {site["name"]} 第 {page} 页: {response.url}')
+
+        news_items = response.css(site['list_selector'])
+        self.logger.info(f'[News Found] 发现 {len(news_items)} 条新闻项')
+
+        new_news_count = 0
+        detail_requests = []
+        candidates = []
+
+        for idx, item in enumerate(news_items):
+            # 提取新闻链接和标题
+            news_link = item.css(site['link_selector']).get()
+            news_title = item.css(site['title_selector']).get()
+
+            if not news_link or not news_title:
+                continue
+
+            # 规范化链接
+            full_url = urljoin(response.url, news_link.strip())
+            news_key = full_url  # 以 URL 为唯一键
+            news_title = news_title.strip()
+
+            self.logger.info(f'[News Item {idx+1}] {news_title[:50]}... | {full_url}')
+
+            # 检查是否已抓取过
+            if self.store.has_url(news_key):
+                self.logger.info(f'  → 已存在，跳过')
+                continue
+            candidates.append((full_url, news_title))
+
+        # 多实例时整页一次认领，其他实例已认领或已保存的跳过
+        claimed = self._claim(url for url, _ in candidates)
+        for full_url, news_title in candidates:
+            if full_url not in claimed:
+                self.logger.info(f'[Coordination] 其他实例已认领，跳过: {full_url}')
+                continue
+
+            # 新闻未抓取，标记为新增并爬取详情页
+            self.logger.info(f'  → 新增！准备爬取详情页: {full_url}')
+            new_news_count += 1
+            if not self._spend():
+                self.logger.warning(f'[Budget] 请求预算已用完，{full_url} 留待下次')
+                continue
+
+            detail_requests.append(scrapy.Request(
+                full_url,
+                callback=self.parse_article,
+                meta={'title': news_title, 'url': full_url, 'site': site['name']}
+            ))
+
+        # 先把本页的详情页记入 frontier（一个事务），中断后下次从这里续抓
+        self.store.add_to_frontier([{'url': r.meta['url'], 'title': r.meta['title'], 'site': site['name']}
+                                    for r in detail_requests])
+        yield from detail_requests
+
+        self.logger.info(f'[Summary] {site["name"]} 第 {page} 页发现 {new_news_count} 条新增新闻')
+
+        if self.mode == 'incremental' and new_news_count == 0:
+            # 整页都是已抓取的 URL，更早的页面也已抓取过
+            self.logger.info(f'[Early Stop] {site["name"]} 第 {page} 页没有新增新闻，停止翻页')
+            return
+
+        next_request = self.next_page(response, site, page)
+        if next_request is not None:
+            if self._spend():
+                yield next_request
+            else:
+                self.logger.warning(f'[Budget] 请求预算已用完，{site["name"]} 停在第 {page} 页')
+
+    def next_page(self, response, site, page):
+        """按站点的 pagination 规则构造下一页请求，没有下一页时返回 None
+
+        pagination 支持 next_selector（下一页链接）或 url_template（如 "/news?page={page}"）；
+        增量模式下最多翻 max_pages 页，回填模式只受请求预算限制。
+        """
+        pagination = site.get('pagination')
+        if not pagination:
+            return None
+        if self.mode == 'incremental' and page >= pagination['max_pages']:
+            self.logger.warning(f'[Pagination] {site["name"]} 已翻到 max_pages={page}，仍有新增新闻，'
+                                f'可能需要 backfill')
+            return None
+        if pagination.get('url_template'):
+            next_link = pagination['url_template'].format(page=page + 1)
+        else:
+            next_link = response.css(pagination['next_selector']).get()
+        if not next_link:
+            return None
+        return scrapy.Request(
+            urljoin(response.url, next_link.strip()),
+            callback=self.parse,
+            meta={'httpcache_revalidate': True, 'site': site['name'], 'page': page + 1},
+        )
+
+    def _offload_extraction(self):
+        """由爬虫进程运行（有 settings）且启用了 OffloadPipeline 时，正文提取交给它"""
+        if not hasattr(self, '_offload'):
+            self._offload = offload_enabled(getattr(self, 'settings', None))
+        return self._offload
+
+    def parse_article(self, response):
+        """解析文章详情页，抓取文字和图片"""
+        site = self._site(response)
+        title = response.meta['title']
+        url = response.meta['url']
+        detail = site['detail_selector']
+
+        if response.status == 304:
+            self.logger.info(f'[Revalidate] 未修改 (304): {url}')
+            return
+
+        self.logger.info(f'[Parsing Article] {title}')
+
+        # 构造 item 并交给 pipeline（OffloadPipeline + ImagesPipeline + SaveJsonPipeline）处理
+        item = {
+            'title': title,
+            'url': url,
+            'site': site['name'],
+            'scraped_at': datetime.now().isoformat(),
+            'status': 'completed',
+            # 以下字段只供 SaveJsonPipeline 判断修改/重复，不写入文章 JSON
+            'etag': response.headers.get('ETag', b'').decode('latin-1') or None,
+            'last_modified': response.headers.get('Last-Modified', b'').decode('latin-1') or None,
+        }
+        if self._offload_extraction():
+            # 解析 HTML、提取正文/图片与计算指纹由 OffloadPipeline 在 worker 中完成，不占用 reactor 线程；
+            # 传原始响应字节（与 response 共用，不再解码出一份字符串副本），提取后即从 item 中移除
+            item['_extract'] = {'html': response.body, 'encoding': response.encoding, 'url': response.url,
+                                'detail': detail, 'text_limit': site['text_limit'],
+                                'image_limit': site['image_limit']}
+        else:
+            # 一次遍历正文容器，同时取文本与图片，达到上限即停止
+            article_text, image_urls = extract_article(
+                response.selector.root, response.url, detail,
+                text_limit=site['text_limit'], image_limit=site['image_limit'])
+            self.logger.info(f'  文本长度: {len(article_text)} 字符')
+            self.logger.info(f'  图片数量: {len(image_urls)}')
+            item['text'] = article_text
+            item['image_urls'] = image_urls  # Scrapy ImagesPipeline 使用字段名 image_urls
+            item['fingerprint'] = simhash(article_text)
+        if 'revalidate_of' in response.meta:
+            item['revalidate_of'] = response.meta['revalidate_of']
+
+        yield item
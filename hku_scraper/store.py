@@ -0,0 +1,398 @@
+"""
+HKU 文章存储
+基于 SQLite（WAL 模式）保存新闻索引与文章正文，替代每条都全量重写 news_index.json 的做法
+
+- 文章 id 由 SQLite 自增主键分配，多进程/崩溃重启也不会重复或覆盖 N_article.json
+- 已抓取 URL 常驻内存集合，spider 与 pipeline 共用，查询为 O(1)
+- news_index.json 只在爬虫结束时导出一次，供 Node.js 接口与 runner 预检继续使用
+- 每篇文章记录内容指纹（SimHash）与 ETag/Last-Modified，用于复查已抓取文章是否被修改、标记近似重复
+- 每次新增或覆盖正文时分配递增的 changed_seq，增量导出据此只取上次导出之后变化的文章
+- 断点续爬：frontier 表记录已发现、尚未保存的详情页；保存文章时在同一事务中移除。
+  post_save 列记录提交之后尚未完成的步骤（写 JSON 文件、更新检索索引、推送入队），
+  这些步骤都是幂等的，中断后由 SaveJsonPipeline 在下次打开时补做
+
+一次性迁移旧数据:
+    python -m hku_scraper.store migrate [数据目录]
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+
+from hku_scraper.fingerprint import DEFAULT_DUPLICATE_DISTANCE, from_hex, hamming, to_hex
+from hku_scraper.utils import get_data_dir
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS articles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    file TEXT,
+    scraped_at TEXT,
+    status TEXT,
+    body TEXT
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    site TEXT,
+    title TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    added_at TEXT
+);
+'''
+
+# 旧版数据库缺少的列，打开时补上
+EXTRA_COLUMNS = (
+    ('fingerprint', 'TEXT'),
+    ('etag', 'TEXT'),
+    ('last_modified', 'TEXT'),
+    ('duplicate_of', 'INTEGER'),
+    ('changed_seq', 'INTEGER'),
+    ('post_save', 'TEXT'),
+)
+
+# post_save 的取值：保存后要推送新文章 / 推送“【更新】” / 不推送（近似重复、建立指纹基线）
+POST_SAVE_NOTIFY = 'notify'
+POST_SAVE_UPDATE = 'update'
+POST_SAVE_SILENT = 'silent'
+
+# frontier 中的详情页最多在几次运行中续抓，仍未保存（如一直 404）则放弃
+FRONTIER_MAX_ATTEMPTS = 3
+
+# 新增/覆盖正文时的变更序号（写事务内取最大值 + 1，多进程也不会重复）
+NEXT_SEQ = '(SELECT COALESCE(MAX(changed_seq), 0) + 1 FROM articles)'
+
+ARTICLE_FILE_RE = re.compile(r'^(\d+)_article\.json$')
+
+
+def article_filename(article_id):
+    """文章 id 对应的 JSON 文件名（与旧版命名保持一致）"""
+    return f'{article_id}_article.json'
+
+
+def _write_json_atomic(path, data):
+    """先写临时文件再替换，避免中途崩溃留下半个文件"""
+    tmp_file = Path(str(path) + '.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
+
+def connect(db_file):
+    """打开 articles.db（WAL），建表并补齐旧版数据库缺少的列；导出等只读大批量场景直接使用连接"""
+    db_file = Path(db_file)
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_file), timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(articles)')}
+    for name, kind in EXTRA_COLUMNS:
+        if name not in columns:
+            conn.execute(f'ALTER TABLE articles ADD COLUMN {name} {kind}')
+    # 加列之前保存的文章按 id 顺序补上变更序号
+    conn.execute('UPDATE articles SET changed_seq = id WHERE changed_seq IS NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_articles_changed_seq ON articles (changed_seq)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_articles_post_save ON articles (post_save) '
+                 'WHERE post_save IS NOT NULL')
+    conn.commit()
+    return conn
+
+
+class ArticleStore:
+    """文章存储：索引 + 正文 + 已抓取 URL 集合"""
+
+    def __init__(self, db_file=None):
+        self.db_file = Path(db_file) if db_file else get_data_dir() / 'articles.db'
+        self._lock = threading.RLock()
+        self.conn = connect(self.db_file)
+        self._seen = {row[0] for row in self.conn.execute('SELECT url FROM articles')}
+        # id -> 指纹，近似重复查找在内存中进行
+        self._fingerprints = {
+            row['id']: from_hex(row['fingerprint']) for row in self.conn.execute(
+                'SELECT id, fingerprint FROM articles WHERE fingerprint IS NOT NULL')}
+
+    def close(self):
+        with self._lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, url):
+        return url in self._seen
+
+    def has_url(self, url):
+        """URL 是否已保存过"""
+        return url in self._seen
+
+    def add_article(self, article, fingerprint=None, etag=None, last_modified=None, post_save=None):
+        """保存一篇文章，返回 (id, created)
+
+        URL 已存在时不覆盖，直接返回已有 id，created 为 False。同一事务中把该 URL 移出 frontier；
+        post_save 不为 None 时记录待完成的后续步骤，完成后调用 finish_post_save()。
+        """
+        url = article['url']
+        with self._lock:
+            with self.conn:
+                cur = self.conn.execute(
+                    'INSERT OR IGNORE INTO articles (url, title, scraped_at, status, body, fingerprint, '
+                    f'etag, last_modified, post_save, changed_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, {NEXT_SEQ})',
+                    (url, article.get('title'), article.get('scraped_at'),
+                     article.get('status', 'completed'),
+                     json.dumps(article, ensure_ascii=False),
+                     to_hex(fingerprint), etag, last_modified, post_save),
+                )
+                self.conn.execute('DELETE FROM frontier WHERE url = ?', (url,))
+                if cur.rowcount == 0:
+                    row = self.conn.execute('SELECT id FROM articles WHERE url = ?', (url,)).fetchone()
+                    self._seen.add(url)
+                    return row['id'], False
+                article_id = cur.lastrowid
+                self.conn.execute('UPDATE articles SET file = ? WHERE id = ?',
+                                  (article_filename(article_id), article_id))
+            if fingerprint is not None:
+                self._fingerprints[article_id] = fingerprint
+        self._seen.add(url)
+        return article_id, True
+
+    def update_article(self, article_id, article, fingerprint=None, etag=None, last_modified=None,
+                       post_save=None):
+        """文章内容已修改：覆盖正文、指纹和校验头（id 与文件名不变）"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    'UPDATE articles SET title = ?, scraped_at = ?, status = ?, body = ?, fingerprint = ?, '
+                    f'etag = ?, last_modified = ?, post_save = ?, changed_seq = {NEXT_SEQ} WHERE id = ?',
+                    (article.get('title'), article.get('scraped_at'),
+                     article.get('status', 'completed'),
+                     json.dumps(article, ensure_ascii=False),
+                     to_hex(fingerprint), etag, last_modified, post_save, article_id),
+                )
+            if fingerprint is not None:
+                self._fingerprints[article_id] = fingerprint
+
+    def update_validators(self, article_id, etag=None, last_modified=None):
+        """内容未变化时只更新 ETag / Last-Modified"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute('UPDATE articles SET etag = ?, last_modified = ? WHERE id = ?',
+                                  (etag, last_modified, article_id))
+
+    def get_fingerprint(self, article_id):
+        return self._fingerprints.get(article_id)
+
+    def recent_articles(self, limit):
+        """最近保存的 limit 篇文章（id 倒序），用于复查是否被修改"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT id, url, title, etag, last_modified FROM articles ORDER BY id DESC LIMIT ?',
+                (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_near_duplicate(self, fingerprint, max_distance=DEFAULT_DUPLICATE_DISTANCE, exclude_id=None):
+        """返回与指纹汉明距离不超过 max_distance 的最早一篇文章 id，没有则返回 None"""
+        if fingerprint is None:
+            return None
+        with self._lock:
+            for article_id in sorted(self._fingerprints):
+                if article_id == exclude_id:
+                    continue
+                if hamming(fingerprint, self._fingerprints[article_id]) <= max_distance:
+                    return article_id
+        return None
+
+    def mark_duplicate(self, article_id, original_id):
+        with self._lock:
+            with self.conn:
+                self.conn.execute('UPDATE articles SET duplicate_of = ? WHERE id = ?',
+                                  (original_id, article_id))
+
+    def finish_post_save(self, article_id):
+        """保存后的步骤已全部完成"""
+        with self._lock:
+            with self.conn:
+                self.conn.execute('UPDATE articles SET post_save = NULL WHERE id = ?', (article_id,))
+
+    def unfinished_saves(self):
+        """已提交但后续步骤没有完成（进程中断）的文章 [(id, post_save, 正文)]，按 id 顺序"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT id, post_save, body FROM articles WHERE post_save IS NOT NULL ORDER BY id').fetchall()
+        return [(row['id'], row['post_save'], json.loads(row['body'])) for row in rows]
+
+    def add_to_frontier(self, entries):
+        """记录即将请求的详情页 [{'url', 'site', 'title'}]（一个事务）；已在 frontier 中的保持不变"""
+        if not entries:
+            return
+        now = datetime.now().isoformat()
+        with self._lock:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO frontier (url, site, title, added_at) VALUES (?, ?, ?, ?)',
+                    [(e['url'], e.get('site'), e.get('title'), now) for e in entries])
+
+    def resume_frontier(self, sites, max_attempts=FRONTIER_MAX_ATTEMPTS):
+        """取出这些站点上次未完成的详情页并把续抓次数加一；已续抓 max_attempts 次的放弃
+
+        返回 (待续抓 [{'url', 'site', 'title', 'attempts'}], 放弃的条数)。
+        """
+        sites = list(sites)
+        marks = ', '.join('?' * len(sites))
+        with self._lock:
+            with self.conn:
+                dropped = self.conn.execute(
+                    f'DELETE FROM frontier WHERE site IN ({marks}) AND attempts >= ?',
+                    (*sites, max_attempts)).rowcount
+                self.conn.execute(f'UPDATE frontier SET attempts = attempts + 1 WHERE site IN ({marks})', sites)
+                rows = self.conn.execute(
+                    f'SELECT url, site, title, attempts FROM frontier WHERE site IN ({marks}) ORDER BY added_at, url',
+                    sites).fetchall()
+        pending = [dict(row) for row in rows if row['url'] not in self._seen]
+        return pending, dropped
+
+    def frontier_size(self):
+        with self._lock:
+            return self.conn.execute('SELECT COUNT(*) FROM frontier').fetchone()[0]
+
+    def get_article(self, article_id):
+        """按 id 读取文章正文，不存在时返回 None"""
+        with self._lock:
+            row = self.conn.execute('SELECT body FROM articles WHERE id = ?', (article_id,)).fetchone()
+        if row is None or row['body'] is None:
+            return None
+        return json.loads(row['body'])
+
+    def article_ids(self):
+        """全部文章 id"""
+        with self._lock:
+            return {row[0] for row in self.conn.execute('SELECT id FROM articles')}
+
+    def ids_scraped_before(self, cutoff):
+        """scraped_at 早于 cutoff（ISO 时间字符串）或缺失的文章 id"""
+        with self._lock:
+            return {row[0] for row in self.conn.execute(
+                'SELECT id FROM articles WHERE scraped_at IS NULL OR scraped_at < ?', (cutoff,))}
+
+    def scraped_since(self, since):
+        """scraped_at 不早于 since（ISO 时间字符串）的文章 [(url, scraped_at)]，供调度器学习发文规律"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT url, scraped_at FROM articles WHERE scraped_at >= ? ORDER BY scraped_at',
+                (since,)).fetchall()
+        return [(row['url'], row['scraped_at']) for row in rows]
+
+    def get_id(self, url):
+        with self._lock:
+            row = self.conn.execute('SELECT id FROM articles WHERE url = ?', (url,)).fetchone()
+        return row['id'] if row else None
+
+    def index(self):
+        """与旧版 news_index.json 相同结构的索引（按 id 顺序）"""
+        with self._lock:
+            rows = self.conn.execute(
+                'SELECT url, title, file, scraped_at FROM articles ORDER BY id').fetchall()
+        return {row['url']: {'title': row['title'], 'file': row['file'], 'scraped_at': row['scraped_at']}
+                for row in rows}
+
+    def export_index(self, index_file):
+        """导出 news_index.json（整个爬虫过程只写一次）"""
+        _write_json_atomic(index_file, self.index())
+
+    def write_article_file(self, data_dir, article_id, article=None):
+        """把文章写成 N_article.json，供 Node.js 接口读取"""
+        if article is None:
+            article = self.get_article(article_id)
+        outfile = Path(data_dir) / article_filename(article_id)
+        _write_json_atomic(outfile, article)
+        return outfile
+
+    def migrate_from_json(self, data_dir):
+        """从旧版 news_index.json + N_article.json 一次性导入，保留原文件编号作为 id
+
+        可重复执行，已导入的 URL 会被跳过。返回新导入的条数。
+        """
+        data_dir = Path(data_dir)
+        index_file = data_dir / 'news_index.json'
+        if not index_file.exists():
+            return 0
+        with open(index_file, 'r', encoding='utf-8') as f:
+            old_index = json.load(f)
+
+        imported = 0
+        renumbered = []
+        with self._lock:
+            with self.conn:
+                for url, entry in old_index.items():
+                    if url in self._seen:
+                        continue
+                    filename = entry.get('file') or ''
+                    match = ARTICLE_FILE_RE.match(filename)
+                    body = None
+                    article_file = data_dir / filename if filename else None
+                    if article_file and article_file.exists():
+                        with open(article_file, 'r', encoding='utf-8') as f:
+                            body = json.load(f)
+                        if body.get('url') != url:
+                            # 旧版按 len(index)+1 编号，文件可能已被另一篇文章覆盖
+                            body = None
+                    if body is None:
+                        body = {'title': entry.get('title'), 'url': url,
+                                'scraped_at': entry.get('scraped_at'), 'status': 'completed'}
+                    article_id = int(match.group(1)) if match else None
+                    if article_id is not None and self.conn.execute(
+                            'SELECT 1 FROM articles WHERE id = ?', (article_id,)).fetchone():
+                        # 旧版编号已冲突（len(index)+1 重复），改用新 id
+                        article_id = None
+                    cur = self.conn.execute(
+                        'INSERT INTO articles (id, url, title, file, scraped_at, status, body, changed_seq) '
+                        f'VALUES (?, ?, ?, ?, ?, ?, ?, {NEXT_SEQ})',
+                        (article_id, url, entry.get('title'), filename or None,
+                         entry.get('scraped_at'), body.get('status', 'completed'),
+                         json.dumps(body, ensure_ascii=False)),
+                    )
+                    if not match or article_id is None:
+                        self.conn.execute('UPDATE articles SET file = ? WHERE id = ?',
+                                          (article_filename(cur.lastrowid), cur.lastrowid))
+                        renumbered.append((cur.lastrowid, body))
+                    self._seen.add(url)
+                    imported += 1
+        for article_id, body in renumbered:
+            self.write_article_file(data_dir, article_id, body)
+        return imported
+
+
+def open_store(data_dir=None):
+    """打开数据目录下的 articles.db；首次创建且存在旧版 JSON 时自动迁移"""
+    data_dir = Path(data_dir) if data_dir else get_data_dir()
+    store = ArticleStore(data_dir / 'articles.db')
+    if len(store) == 0 and (data_dir / 'news_index.json').exists():
+        store.migrate_from_json(data_dir)
+    return store
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'migrate':
+        print('用法: python -m hku_scraper.store migrate [数据目录]')
+        return 1
+    data_dir = Path(argv[1]) if len(argv) > 1 else get_data_dir()
+    store = ArticleStore(data_dir / 'articles.db')
+    try:
+        imported = store.migrate_from_json(data_dir)
+        print(f'[Migrate] 已导入 {imported} 篇文章，共 {len(store)} 篇 -> {store.db_file}')
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""
+按站点礼貌预算限速的 AutoThrottle
+Scrapy 自带的 AutoThrottle 以全局 DOWNLOAD_DELAY 为下限，会把慢站点之外的域名也压到同一个下限；
+这里改为以 DOWNLOAD_SLOTS 中每个域名配置的 delay 为下限，快站点可以更快，慢站点不会被压得更紧。
+"""
+
+from scrapy.extensions.throttle import AutoThrottle
+
+
+class SiteAutoThrottle(AutoThrottle):
+    """AutoThrottle，延迟下限取该请求所在下载槽的 delay 配置"""
+
+    def _adjust_delay(self, slot, latency, response):
+        super()._adjust_delay(slot, latency, response)
+        request = response.request
+        key = request.meta.get('download_slot') if request is not None else None
+        floor = self.crawler.settings.getdict('DOWNLOAD_SLOTS').get(key, {}).get('delay')
+        if floor is not None:
+            slot.delay = max(slot.delay, float(floor))
@@ -0,0 +1,25 @@
+"""
+HKU 爬虫公共工具：数据目录与新闻索引读取
+runner、spider、pipeline 共用，避免各处路径逻辑不一致
+"""
+
+import os
+import json
+from pathlib import Path
+
+
+def get_data_dir():
+    """数据目录：%USERPROFILE%（或 $HOME）/Desktop/hku_news_data"""
+    return Path(os.getenv('USERPROFILE') or os.getenv('HOME') or '.') / 'Desktop' / 'hku_news_data'
+
+
+def load_news_index(index_file=None):
+    """读取新闻索引文件，不存在或损坏时返回空字典"""
+    index_file = Path(index_file) if index_file else get_data_dir() / 'news_index.json'
+    if index_file.exists():
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
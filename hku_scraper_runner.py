@@ -1,15 +1,40 @@
 """
 HKU 爬虫定时运行器
-每 60 分钟检测一次 HKU 文学院新闻，有更新则爬取
+按各站点的发文规律自适应安排检测（hku_scraper.scheduler），有更新则爬取
+
+用法:
+    python hku_scraper_runner.py            # 自适应间隔，每轮启动一个 scrapy 子进程
+    python hku_scraper_runner.py --schedule fixed --interval 3600  # 固定间隔
+    python hku_scraper_runner.py --daemon   # 常驻进程，复用同一个 reactor
+    python hku_scraper_runner.py --all-sites  # 抓取 config/sites.json 中的全部站点
+    python hku_scraper_runner.py --revalidate 20  # 每轮复查最近 20 篇文章是否被修改
 """
 
+import os
+import argparse
 import time
+import json
+import hashlib
 import subprocess
 import sys
 import logging
 from pathlib import Path
 from datetime import datetime
 
+import requests
+from urllib.parse import urljoin
+from parsel import Selector
+
+from hku_scraper import metrics
+from hku_scraper.scheduler import (
+    DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, DEFAULT_POLLS_PER_WEEK, DEFAULT_WORKERS,
+    AdaptiveScheduler, PollPolicy, PollTarget, site_history, site_matcher,
+)
+from hku_scraper.settings import METRICS_DIR as METRICS_DIR_SETTING, USER_AGENT
+from hku_scraper.sites import load_sites
+from hku_scraper.store import open_store
+from hku_scraper.utils import get_data_dir, load_news_index
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -17,42 +42,401 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 预检配置：只请求主页并比对新闻列表指纹，未变化且列表中链接都已抓取则跳过整轮爬取
+HOMEPAGE_URL = 'https://arts.hku.hk/'
+NEWS_LIST_SELECTOR = 'div.inner-box ul.news li'
+DATA_DIR = get_data_dir()
+PROBE_STATE_FILE = DATA_DIR / 'probe_state.json'
+# 爬虫每轮写出的阶段耗时（hku_scraper.metrics），runner 追加到滚动历史
+METRICS_DIR = Path(METRICS_DIR_SETTING) if METRICS_DIR_SETTING else DATA_DIR / 'metrics'
+PROBE_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+}
+
+
+def _load_probe_state():
+    """读取上一次预检保存的 ETag / Last-Modified / 指纹 / 链接列表"""
+    if PROBE_STATE_FILE.exists():
+        try:
+            with open(PROBE_STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+    return {}
+
+
+def _save_probe_state(state):
+    """保存预检状态（先写临时文件再替换，避免中途崩溃写坏）"""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_file = PROBE_STATE_FILE.with_suffix('.tmp')
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, PROBE_STATE_FILE)
+
+
+def news_list_links(html, base_url=HOMEPAGE_URL):
+    """提取新闻列表中的链接（与 spider 一样用 urljoin 规范化），去重排序"""
+    links = set()
+    for item in Selector(text=html).css(NEWS_LIST_SELECTOR):
+        href = item.css('a::attr(href)').get()
+        if href:
+            links.add(urljoin(base_url, href.strip()))
+    return sorted(links)
+
+
+def news_list_fingerprint(html):
+    """只对新闻列表的链接集合计算指纹，忽略页面其它部分的变化"""
+    links = news_list_links(html)
+    if not links:
+        return None
+    return hashlib.sha1('\n'.join(links).encode('utf-8')).hexdigest()
+
+
+def probe_homepage(index=None):
+    """条件请求主页，判断本轮是否需要爬取
+
+    只有主页 304 或列表指纹未变化，且列表中每个链接都已在索引中时才跳过；
+    上一轮详情页抓取失败的链接不在索引里，本轮会照常重试。
+
+    返回 (changed, new_state)：changed 为 False 时可跳过本轮爬取；
+    new_state 需在爬虫成功后再保存。
+    """
+    if index is None:
+        index = load_news_index(DATA_DIR / 'news_index.json')
+    state = _load_probe_state()
+    headers = dict(PROBE_HEADERS)
+    if state.get('etag'):
+        headers['If-None-Match'] = state['etag']
+    if state.get('last_modified'):
+        headers['If-Modified-Since'] = state['last_modified']
 
-def run_spider():
-    """运行 Scrapy 爬虫"""
+    try:
+        resp = requests.get(HOMEPAGE_URL, headers=headers, timeout=15)
+    except Exception as e:
+        logger.warning(f'[Probe] 主页预检失败，照常爬取: {e}')
+        return True, None
+
+    if resp.status_code == 304:
+        links = state.get('links') or []
+        pending = [link for link in links if link not in index]
+        if links and not pending:
+            logger.info('[Probe] 主页未修改 (304)')
+            return False, None
+        logger.info(f'[Probe] 主页未修改 (304)，但有 {len(pending)} 条未抓取，照常爬取')
+        return True, None
+    if resp.status_code != 200:
+        logger.warning(f'[Probe] 主页返回 {resp.status_code}，照常爬取')
+        return True, None
+
+    links = news_list_links(resp.text, resp.url or HOMEPAGE_URL)
+    if not links:
+        # 选择器没匹配到任何新闻，可能是页面改版，交给爬虫处理
+        logger.warning('[Probe] 未找到新闻列表，照常爬取')
+        return True, None
+
+    fingerprint = hashlib.sha1('\n'.join(links).encode('utf-8')).hexdigest()
+    new_state = {
+        'etag': resp.headers.get('ETag'),
+        'last_modified': resp.headers.get('Last-Modified'),
+        'fingerprint': fingerprint,
+        'links': links,
+        'checked_at': datetime.now().isoformat(),
+    }
+    pending = [link for link in links if link not in index]
+    if fingerprint == state.get('fingerprint') and not pending:
+        logger.info('[Probe] 新闻列表指纹未变化')
+        # 指纹相同但校验头可能更新了，直接保存
+        _save_probe_state(new_state)
+        return False, None
+
+    logger.info(f'[Probe] 需要爬取: 指纹 {fingerprint[:12]}，未抓取 {len(pending)} 条')
+    return True, new_state
+
+
+def record_metrics(since, metrics_dir=None):
+    """把本轮的阶段耗时追加到 history.jsonl，并提示比历史中位数明显变慢的阶段"""
+    try:
+        recorded = metrics.record_run(metrics_dir or METRICS_DIR, since=since)
+    except Exception as e:
+        logger.warning(f'[Metrics] 记录运行历史失败: {e}')
+        return None
+    if recorded is None:
+        return None
+    report, regressions = recorded
+    logger.info(f'[Metrics] {metrics.format_summary(report)}')
+    for stage, current_ms, baseline_ms in regressions:
+        logger.warning(f'[Metrics] {stage} 变慢: 平均 {current_ms:.1f}ms，历史中位数 {baseline_ms:.1f}ms')
+    return recorded
+
+
+def run_spider(force=False, spider_name='hku_arts_news', revalidate=0, sites=None, metrics_dir=None):
+    """运行 Scrapy 爬虫（先做主页预检，无变化则跳过；force=True 时跳过预检）
+
+    sites 为逗号分隔的站点名（news_sites 爬虫），metrics_dir 为本次运行写指标的目录
+    （多个站点并发运行时各用各的，避免互相覆盖 last_run.json）。
+    返回 False 表示爬虫运行失败；跳过本轮或运行成功返回 True。
+    """
     logger.info('=' * 60)
     logger.info(f'[Spider Run] 开始爬虫任务 ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
     logger.info('=' * 60)
+
+    probe_state = None
+    if not force:
+        changed, probe_state = probe_homepage()
+        if not changed:
+            logger.info('[Spider Skip] 新闻列表无变化，跳过本轮爬取')
+            return True
     
     try:
         # 运行 Scrapy 爬虫
         # Run scrapy crawl for the spider name. No need to pass start_urls as spider defines it.
         cmd = [
-            sys.executable, '-m', 'scrapy.cmdline', 'crawl', 'hku_arts_news',
+            sys.executable, '-m', 'scrapy.cmdline', 'crawl', spider_name,
             '--loglevel=INFO'
         ]
+        if revalidate:
+            cmd += ['-a', f'revalidate={revalidate}']
+        if sites:
+            cmd += ['-a', f'sites={sites}']
+        if metrics_dir:
+            cmd += ['-s', f'METRICS_DIR={metrics_dir}']
         
+        started = time.time()
         result = subprocess.run(cmd, cwd=Path(__file__).parent)
+        record_metrics(started, metrics_dir)
         
         if result.returncode == 0:
             logger.info('[Spider Success] 爬虫运行完成')
-        else:
-            logger.error(f'[Spider Error] 爬虫运行失败 (code: {result.returncode})')
+            if probe_state:
+                _save_probe_state(probe_state)
+            return True
+        logger.error(f'[Spider Error] 爬虫运行失败 (code: {result.returncode})')
+        return False
             
     except Exception as e:
         logger.error(f'[Spider Exception] {e}')
+        return False
+
+
+def make_target(store, site, force=False, revalidate=0, multi_site=False):
+    """一个站点对应的轮询目标：poll() 运行一次爬虫并返回该站点本次新增的文章数
+
+    单站点（HKU 文学院）沿用 hku_arts_news 爬虫与主页预检；
+    多站点时每个站点单独运行 news_sites 爬虫，指标写到 metrics/<站点名>/。
+    """
+    matches = site_matcher(site)
+    name = site['name']
+
+    def poll():
+        started = datetime.now().isoformat()
+        if multi_site:
+            ok = run_spider(force=True, spider_name='news_sites', revalidate=revalidate,
+                            sites=name, metrics_dir=METRICS_DIR / name)
+        else:
+            ok = run_spider(force=force, revalidate=revalidate)
+        if not ok:
+            raise RuntimeError(f'{name} 爬虫运行失败')
+        return sum(1 for url, _ in store.scraped_since(started) if matches(url))
+
+    return PollTarget(name, poll, history=lambda: site_history(store, site))
+
+
+def run_adaptive(policy, workers, force=False, all_sites=False, revalidate=0):
+    """自适应调度：每个站点一个目标，按发文规律安排检测，最多 workers 个爬虫同时运行"""
+    store = open_store(DATA_DIR)
+    sites = load_sites() if all_sites else load_sites(names=['hku_arts'])
+    targets = [make_target(store, site, force=force, revalidate=revalidate, multi_site=all_sites)
+               for site in sites]
+    logger.info(f'[Scheduler] {len(targets)} 个目标，最多 {workers} 个同时运行，'
+                f'间隔 {policy.min_interval // 60}~{policy.max_interval // 60} 分钟')
+    try:
+        AdaptiveScheduler(targets, policy, workers=workers).run()
+    finally:
+        store.close()
+
+
+class CrawlDaemon:
+    """守护进程调度器：在同一个 Twisted reactor 中按间隔调度爬虫
+
+    每轮先在线程池中做主页预检，有变化才通过 CrawlerRunner 启动一次爬取；
+    单轮预检或爬虫异常只记录日志，随后照常安排下一轮。
+    传入 policy（hku_scraper.scheduler.PollPolicy）时按发文规律与本轮结果自适应计算下轮间隔，否则固定 interval。
+    """
+
+    def __init__(self, runner, spider_cls, interval, reactor, store,
+                 probe=None, defer_probe=None, force=False, spider_kwargs=None,
+                 policy=None, history=None):
+        self.runner = runner
+        self.spider_cls = spider_cls
+        self.interval = interval
+        self.reactor = reactor
+        # 常驻内存的文章存储（含已抓取 URL 集合），由 spider 与 SaveJsonPipeline 共享
+        self.store = store
+        self.spider_kwargs = spider_kwargs or {}
+        # 本轮爬虫开始时间，用于判断 last_run.json 是否为本轮写出
+        self.crawl_started = None
+        if force:
+            self.probe = lambda: (True, None)
+        else:
+            self.probe = probe or (lambda: probe_homepage(self.store))
+        if defer_probe is None:
+            # 预检使用同步 requests，放到线程池中避免阻塞 reactor
+            from twisted.internet import threads
+            defer_probe = threads.deferToThread
+        self.defer_probe = defer_probe
+        self.scheduler = None
+        if policy is not None:
+            self.scheduler = AdaptiveScheduler([], policy, clock=reactor.seconds)
+            self.target = PollTarget('daemon', None, history=history)
+        # 本轮开始时的文章数与是否出错，用于计算自适应间隔
+        self.articles_before = 0
+        self.failed = False
+
+    def next_delay(self):
+        if self.scheduler is None:
+            return self.interval
+        if self.failed:
+            return self.scheduler.record(self.target, error=True)
+        return self.scheduler.record(self.target, len(self.store) - self.articles_before)
+
+    def schedule_next(self, _=None):
+        from twisted.internet import task
+        delay = self.next_delay()
+        logger.info(f'[Wait] 等待 {delay / 60:.0f} 分钟后下次检测...\n')
+        task.deferLater(self.reactor, delay, self.run_cycle)
+
+    def on_crawl_done(self, _, probe_state):
+        logger.info('[Spider Success] 爬虫运行完成')
+        record_metrics(self.crawl_started)
+        if probe_state:
+            _save_probe_state(probe_state)
+
+    def on_crawl_error(self, failure):
+        self.failed = True
+        logger.error(f'[Spider Exception] {failure.getErrorMessage()}')
+        if self.crawl_started is not None:
+            record_metrics(self.crawl_started)
+
+    def start_crawl(self, probe_result):
+        changed, probe_state = probe_result
+        if not changed:
+            logger.info('[Spider Skip] 新闻列表无变化，跳过本轮爬取')
+            return None
+        self.crawl_started = time.time()
+        d = self.runner.crawl(self.spider_cls, store=self.store, **self.spider_kwargs)
+        d.addCallback(self.on_crawl_done, probe_state)
+        return d
+
+    def run_cycle(self):
+        logger.info('=' * 60)
+        logger.info(f'[Spider Run] 开始爬虫任务 ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")})')
+        logger.info('=' * 60)
+        self.crawl_started = None
+        self.articles_before = len(self.store)
+        self.failed = False
+        d = self.defer_probe(self.probe)
+        d.addCallback(self.start_crawl)
+        d.addErrback(self.on_crawl_error)
+        d.addBoth(self.schedule_next)
+        return d
+
+
+def run_daemon(interval, force=False, all_sites=False, revalidate=0, policy=None):
+    """守护进程模式：解释器、Scrapy/Twisted 导入和配置只加载一次，文章存储常驻内存
+
+    注意：CrawlerRunner 每轮仍会新建 Crawler（含下载器与连接池），HTTP 连接不跨轮复用。
+    """
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'hku_scraper.settings')
+    from scrapy.utils.project import get_project_settings
+    from scrapy.utils.log import configure_logging
+    from scrapy.utils.reactor import install_reactor
+
+    settings = get_project_settings()
+    if settings.get('TWISTED_REACTOR'):
+        install_reactor(settings.get('TWISTED_REACTOR'))
+
+    from twisted.internet import reactor
+    from scrapy.crawler import CrawlerRunner
+    from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+    from hku_scraper.spiders.news_sites_spider import NewsSitesSpider
+
+    configure_logging(settings, install_root_handler=False)
+    store = open_store(DATA_DIR)
+    logger.info(f'[Daemon] 已加载文章存储 {len(store)} 条')
+
+    spider_cls = NewsSitesSpider if all_sites else HKUArtsNewsSpider
+    # 守护进程每轮抓取全部目标站点，发文规律按这些站点合并统计
+    sites = load_sites() if all_sites else load_sites(names=['hku_arts'])
+    daemon = CrawlDaemon(CrawlerRunner(settings), spider_cls, interval,
+                         reactor, store, force=force,
+                         spider_kwargs={'revalidate': revalidate} if revalidate else None,
+                         policy=policy,
+                         history=lambda: [ts for site in sites for ts in site_history(store, site)])
+    reactor.callWhenRunning(daemon.run_cycle)
+    reactor.run()
+    store.close()
+    logger.info('[Shutdown] 爬虫已停止')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='HKU 文学院新闻定时爬虫')
+    parser.add_argument('--daemon', action='store_true',
+                        help='常驻进程模式，在同一 reactor 内调度爬虫')
+    parser.add_argument('--schedule', choices=('adaptive', 'fixed'), default='adaptive',
+                        help='adaptive: 按发文规律自适应间隔（默认）；fixed: 固定 --interval')
+    parser.add_argument('--interval', type=int, default=60 * 60,
+                        help='固定间隔模式的检测间隔（秒），默认 3600')
+    parser.add_argument('--min-interval', type=int, default=DEFAULT_MIN_INTERVAL,
+                        help=f'自适应模式最短间隔（秒），默认 {DEFAULT_MIN_INTERVAL}')
+    parser.add_argument('--max-interval', type=int, default=DEFAULT_MAX_INTERVAL,
+                        help=f'自适应模式最长间隔（秒），默认 {DEFAULT_MAX_INTERVAL}')
+    parser.add_argument('--polls-per-week', type=int, default=DEFAULT_POLLS_PER_WEEK,
+                        help=f'自适应模式每个站点每周的检测次数预算，默认 {DEFAULT_POLLS_PER_WEEK}')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'自适应模式最多同时运行的爬虫数，默认 {DEFAULT_WORKERS}')
+    parser.add_argument('--no-probe', action='store_true',
+                        help='跳过主页预检，每轮都完整爬取')
+    parser.add_argument('--all-sites', action='store_true',
+                        help='抓取 config/sites.json 中的全部站点（主页预检只覆盖 HKU 文学院，此时不做预检）')
+    parser.add_argument('--revalidate', type=int, default=0, metavar='N',
+                        help='每轮对最近 N 篇已抓取文章发送条件请求，检测内容修改（此时不做预检）')
+    return parser.parse_args(argv)
 
 
 def main():
     """主函数：定时运行爬虫"""
+    args = parse_args()
+    interval = args.interval
+    # 主页预检只针对 HKU 文学院主页，多站点模式下每轮都完整爬取
+    # 复查已抓取文章与主页列表是否变化无关，开启时同样每轮都运行
+    force = args.no_probe or args.all_sites or args.revalidate > 0
+    spider_name = 'news_sites' if args.all_sites else 'hku_arts_news'
+
+    policy = None
+    if args.schedule == 'adaptive':
+        policy = PollPolicy(args.min_interval, args.max_interval, args.polls_per_week)
+
     logger.info('[HKU Arts Scraper Runner] 启动...')
-    logger.info('[Config] 检测间隔: 60分钟')
-    
-    interval = 60 * 60  # 60分钟 = 3600秒
+    if policy is None:
+        logger.info(f'[Config] 检测间隔: {interval // 60}分钟')
+    else:
+        logger.info(f'[Config] 自适应检测间隔: {args.min_interval // 60}~{args.max_interval // 60}分钟，'
+                    f'每周约 {args.polls_per_week} 次')
+
+    if args.daemon:
+        logger.info('[Config] 运行模式: 守护进程')
+        run_daemon(interval, force=force, all_sites=args.all_sites, revalidate=args.revalidate,
+                   policy=policy)
+        return
     
     try:
+        if policy is not None:
+            run_adaptive(policy, args.workers, force=force, all_sites=args.all_sites,
+                         revalidate=args.revalidate)
+            return
         while True:
-            run_spider()
+            run_spider(force=force, spider_name=spider_name, revalidate=args.revalidate)
             
             logger.info(f'[Wait] 等待 {interval // 60} 分钟后下次检测...\n')
             time.sleep(interval)
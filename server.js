@@ -9,6 +9,7 @@ const express = require('express');
 const path = require('path');
 const { scrapeWebsiteToExcel, scrapeMultipleUrls } = require('./scraper');
 const { sendWeChatWebhook, sendWeChatImage } = require('./wechat');
+const { readArticle, readArchivedImage } = require('./hku_archive');
 
 const app = express();
 const PORT = process.env.PORT || 3000;
@@ -504,7 +505,12 @@ app.post('/api/config/wechat', async (req, res) => {
         if (!fs.existsSync(cfgDir)) fs.mkdirSync(cfgDir, { recursive: true });
 
         const cfgFile = path.join(cfgDir, 'wechat.json');
-        const payload = { webhookUrl, savedAt: new Date().toISOString() };
+        // keep other settings (e.g. webhookUrls for extra robots) already in the file
+        let existing = {};
+        if (fs.existsSync(cfgFile)) {
+            try { existing = JSON.parse(fs.readFileSync(cfgFile, 'utf-8')); } catch (e) { existing = {}; }
+        }
+        const payload = { ...existing, webhookUrl, savedAt: new Date().toISOString() };
         fs.writeFileSync(cfgFile, JSON.stringify(payload, null, 2), { encoding: 'utf-8' });
         process.env.WECHAT_WEBHOOK = webhookUrl;
 
@@ -640,14 +646,13 @@ app.get('/api/hku-news', async (req, res) => {
 app.get('/api/hku-news/:id', async (req, res) => {
     try {
         const { id } = req.params;
-        const articleFile = path.join(process.env.USERPROFILE, 'Desktop', 'hku_news_data', `${id}_article.json`);
-        const fs = require('fs');
+        // 较早的文章可能已被 hku_scraper.archive 打包进 archive/ 段文件
+        const articleData = readArticle(path.join(process.env.USERPROFILE, 'Desktop', 'hku_news_data'), id);
 
-        if (!fs.existsSync(articleFile)) {
+        if (!articleData) {
             return res.status(404).json({ success: false, error: '新闻不存在' });
         }
 
-        const articleData = JSON.parse(fs.readFileSync(articleFile, 'utf-8'));
         res.json({ success: true, data: articleData });
     } catch (err) {
         console.error('GET /api/hku-news/:id error:', err);
@@ -672,14 +677,13 @@ app.get('/api/hku-news/:id', async (req, res) => {
             }
 
             const fs = require('fs');
-            const articleFile = path.join(process.env.USERPROFILE, 'Desktop', 'hku_news_data', `${id}_article.json`);
+            const dataDir = path.join(process.env.USERPROFILE, 'Desktop', 'hku_news_data');
+            const articleData = readArticle(dataDir, id);
 
-            if (!fs.existsSync(articleFile)) {
+            if (!articleData) {
                 return res.status(404).json({ success: false, error: '新闻不存在' });
             }
 
-            const articleData = JSON.parse(fs.readFileSync(articleFile, 'utf-8'));
-
             // Build a concise markdown message for WeChat Work robot
             const plainText = (articleData.text || '').replace(/\s+/g, ' ').trim();
             const short = plainText.length > 2000 ? plainText.slice(0, 2000) + '...' : plainText;
@@ -699,12 +703,13 @@ app.get('/api/hku-news/:id', async (req, res) => {
             // 发送所有图片
             const imageResults = [];
             if (Array.isArray(articleData.images) && articleData.images.length > 0) {
-                const imagesDir = path.join(process.env.USERPROFILE, 'Desktop', 'hku_news_data', 'images');
+                const imagesDir = path.join(dataDir, 'images');
                 for (const imgRelPath of articleData.images) {
                     const imgPath = path.join(imagesDir, imgRelPath);
-                    if (fs.existsSync(imgPath)) {
+                    const image = fs.existsSync(imgPath) ? imgPath : readArchivedImage(dataDir, imgRelPath);
+                    if (image) {
                         try {
-                            const imgResp = await sendWeChatImage(finalWebhook, imgPath);
+                            const imgResp = await sendWeChatImage(finalWebhook, image);
                             imageResults.push({ image: imgRelPath, success: true, response: imgResp });
                         } catch (ie) {
                             imageResults.push({ image: imgRelPath, success: false, error: ie.message });
@@ -0,0 +1,13 @@
+import pytest
+
+from hku_scraper import delivery
+
+
+@pytest.fixture
+def data_home(tmp_path, monkeypatch):
+    """把 Desktop/hku_news_data 指向临时目录，并关闭企业微信 webhook"""
+    monkeypatch.delenv('USERPROFILE', raising=False)
+    monkeypatch.delenv('WECHAT_WEBHOOK', raising=False)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setattr(delivery, 'CONFIG_FILE', tmp_path / 'missing_wechat.json')
+    return tmp_path / 'Desktop' / 'hku_news_data'
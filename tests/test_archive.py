@@ -0,0 +1,128 @@
+import json
+import shutil
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from hku_scraper.archive import (
+    ARCHIVE_DIR, INDEX_FILE, ArchiveReader, compact, main, read_article, read_image,
+)
+from hku_scraper.store import ArticleStore
+
+NOW = datetime(2025, 6, 1)
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _save(store, data_dir, url, scraped_at, images=()):
+    article = {'title': url, 'url': url, 'text': '正文 ' * 50, 'images': list(images),
+               'scraped_at': scraped_at, 'status': 'completed'}
+    article_id, _ = store.add_article(article)
+    store.write_article_file(data_dir, article_id, article)
+    for rel_path in images:
+        image_file = data_dir / 'images' / rel_path
+        image_file.parent.mkdir(parents=True, exist_ok=True)
+        image_file.write_bytes(rel_path.encode() * 100)
+    return article_id
+
+
+@pytest.fixture
+def data(tmp_path):
+    store = ArticleStore(tmp_path / 'articles.db')
+    old = _save(store, tmp_path, 'u-old', '2025-01-01T00:00:00', ['full/a.jpg', 'full/shared.jpg'])
+    older = _save(store, tmp_path, 'u-older', '2024-12-01T00:00:00')
+    new = _save(store, tmp_path, 'u-new', '2025-05-30T00:00:00', ['full/shared.jpg'])
+    yield store, tmp_path, (old, older, new)
+    store.close()
+
+
+def test_compact_packs_cold_articles_and_their_images(data):
+    store, data_dir, (old, older, new) = data
+    original = (data_dir / f'{old}_article.json').read_bytes()
+
+    result = compact(store, data_dir, older_than_days=90, now=NOW)
+    assert result['articles'] == 2 and result['images'] == 1
+    assert result['segment'] == 'segment-000001.seg'
+    assert result['bytes_out'] < result['bytes_in']
+
+    # 冷数据散文件已删除，热数据与仍被热文章引用的图片保留
+    assert not (data_dir / f'{old}_article.json').exists()
+    assert not (data_dir / f'{older}_article.json').exists()
+    assert (data_dir / f'{new}_article.json').exists()
+    assert not (data_dir / 'images/full/a.jpg').exists()
+    assert (data_dir / 'images/full/shared.jpg').exists()
+
+    with ArchiveReader(data_dir) as reader:
+        assert reader.get_article_bytes(old) == original
+        assert reader.get_article(older)['url'] == 'u-older'
+        assert new not in reader and 999 not in reader
+        assert reader.get_image('full/a.jpg') == b'full/a.jpg' * 100
+        assert reader.get_image('full/missing.jpg') is None
+    assert read_article(new, data_dir)['url'] == 'u-new'
+    assert read_article(old, data_dir)['url'] == 'u-old'
+    assert read_image('full/shared.jpg', data_dir) == b'full/shared.jpg' * 100
+    assert read_article(999, data_dir) is None
+
+
+def test_second_compaction_appends_a_segment_and_reader_reloads(data):
+    store, data_dir, (old, older, new) = data
+    compact(store, data_dir, older_than_days=90, now=NOW)
+    reader = ArchiveReader(data_dir)
+    assert new not in reader
+
+    later = _save(store, data_dir, 'u-later', '2025-05-31T00:00:00')
+    result = compact(store, data_dir, older_than_days=1, now=datetime(2025, 12, 1))
+    assert result['articles'] == 2 and result['segment'] == 'segment-000002.seg'
+    # 同一个 reader 发现索引已替换，能读到新段中的文章，旧段仍可读
+    assert reader.get_article(new)['url'] == 'u-new'
+    assert reader.get_article(later)['url'] == 'u-later'
+    assert reader.get_article(old)['url'] == 'u-old'
+    assert reader.get_image('full/shared.jpg') == b'full/shared.jpg' * 100
+    reader.close()
+
+    assert compact(store, data_dir, older_than_days=1, now=datetime(2025, 12, 1))['segment'] is None
+
+
+def test_hot_file_written_after_archiving_wins(data):
+    store, data_dir, (old, _, _) = data
+    compact(store, data_dir, older_than_days=90, now=NOW)
+    store.write_article_file(data_dir, old, {'url': 'u-old', 'title': '已更新'})
+    assert read_article(old, data_dir)['title'] == '已更新'
+
+
+def test_corrupt_record_is_detected(data):
+    store, data_dir, (old, _, _) = data
+    compact(store, data_dir, older_than_days=90, now=NOW)
+    segment = data_dir / ARCHIVE_DIR / 'segment-000001.seg'
+    raw = bytearray(segment.read_bytes())
+    raw[20] ^= 0xFF
+    segment.write_bytes(bytes(raw))
+    with ArchiveReader(data_dir) as reader, pytest.raises(ValueError):
+        reader.get_article(old)
+
+
+def test_cli_compact_and_show(data_home, capsys):
+    store = ArticleStore(data_home / 'articles.db')
+    article_id = _save(store, data_home, 'u-cli', '2020-01-01T00:00:00')
+    store.close()
+    assert main(['compact', '30']) == 0
+    assert (data_home / ARCHIVE_DIR / INDEX_FILE).exists()
+    assert main(['show', str(article_id)]) == 0
+    assert '"url": "u-cli"' in capsys.readouterr().out
+    assert main(['show', '42']) == 1
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='需要 Node.js')
+def test_node_reader_reads_the_same_archive(data):
+    store, data_dir, (old, _, _) = data
+    compact(store, data_dir, older_than_days=90, now=NOW)
+    script = (
+        "const a = require(process.argv[1]);"
+        "const art = a.readArticle(process.argv[2], process.argv[3]);"
+        "const img = a.readArchivedImage(process.argv[2], 'full/a.jpg');"
+        "console.log(JSON.stringify({url: art.url, image: img.length, missing: a.readArticle(process.argv[2], 999)}));"
+    )
+    out = subprocess.run(['node', '-e', script, str(REPO_ROOT / 'hku_archive.js'), str(data_dir), str(old)],
+                         capture_output=True, text=True, check=True).stdout
+    assert json.loads(out) == {'url': 'u-old', 'image': len(b'full/a.jpg' * 100), 'missing': None}
@@ -0,0 +1,46 @@
+import json
+from urllib.request import Request, urlopen
+
+from benchmarks.bench_crawl import index_buckets, percentile
+from benchmarks.servers import MockWebhook, SyntheticSite
+from hku_scraper.fingerprint import hamming, simhash
+
+
+def _get(url):
+    with urlopen(url, timeout=5) as resp:
+        return resp.status, resp.read()
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) is None
+
+
+def test_index_buckets_group_by_corpus_size():
+    rows = index_buckets([(0, 1.0), (10, 3.0), (260, 5.0)], bucket=250)
+    assert [(r['articles_from'], r['count'], r['mean_ms']) for r in rows] == [(0, 2, 2.0), (250, 1, 5.0)]
+
+
+def test_synthetic_site_serves_pages_and_distinct_articles():
+    with SyntheticSite(pages=3, per_page=4, text_chars=500, images=1) as site:
+        status, body = _get(f'{site.base_url}/news?page=2')
+        assert status == 200 and body.count(b'<li>') == 4
+        _, first = _get(f'{site.base_url}/news/0')
+        _, second = _get(f'{site.base_url}/news/1')
+        status, image = _get(f'{site.base_url}/img/0-0.png')
+        assert status == 200 and image.startswith(b'\x89PNG')
+        assert site.site_definition()['pagination']['max_pages'] == 3
+    # 合成文章不能被内容指纹判成近似重复
+    assert hamming(simhash(first.decode()), simhash(second.decode())) > 10
+
+
+def test_mock_webhook_counts_messages():
+    with MockWebhook() as webhook:
+        for kind in ('markdown', 'markdown', 'image'):
+            req = Request(webhook.url, data=json.dumps({'msgtype': kind}).encode(),
+                          headers={'Content-Type': 'application/json'})
+            with urlopen(req, timeout=5) as resp:
+                assert json.load(resp)['errcode'] == 0
+        assert webhook.counts == {'markdown': 2, 'image': 1}
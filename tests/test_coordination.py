@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+
+from hku_scraper.coordination import SqliteCoordinator, open_coordinator
+from hku_scraper.pipelines import SaveJsonPipeline
+from hku_scraper.spiders.news_sites_spider import NewsSitesSpider
+
+SITES = {'sites': [
+    {'name': name, 'start_urls': [f'https://{name}.example/news'], 'list_selector': 'li',
+     'link_selector': 'a::attr(href)', 'title_selector': 'a::text', 'detail_selector': 'div'}
+    for name in ('alpha', 'beta', 'gamma', 'delta')
+]}
+LIST_PAGE = b'<ul><li><a href="/a/1">One</a></li><li><a href="/a/2">Two</a></li></ul>'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _coordinator(tmp_path, instance, clock, **kwargs):
+    return SqliteCoordinator(tmp_path / 'shared' / 'coordination.db', instance_id=instance, clock=clock, **kwargs)
+
+
+def test_sites_are_split_by_lease_and_rebalanced(tmp_path):
+    clock = Clock()
+    names = ['alpha', 'beta', 'gamma', 'delta']
+    a = _coordinator(tmp_path, 'host-a', clock, lease_secs=100)
+    assert a.acquire_sites(names, 4) == names
+
+    b = _coordinator(tmp_path, 'host-b', clock, lease_secs=100)
+    # 租约未到期，B 暂时分不到站点，但已登记为存活实例
+    assert b.acquire_sites(names, 4) == []
+    clock.now += 10
+    # A 续约时份额变为 2，放弃超出份额的站点
+    assert a.acquire_sites(names, 4) == ['gamma', 'delta']
+    assert b.acquire_sites(names, 4) == ['alpha', 'beta']
+    assert a.acquire_sites(names, 4) == ['gamma', 'delta']
+
+    # A 下线，租约到期后 B 接手
+    clock.now += 101
+    assert b.acquire_sites(names, 4) == names
+    b.release_sites(['alpha'])
+    assert _coordinator(tmp_path, 'host-c', clock).acquire_sites(['alpha'], 4) == ['alpha']
+    a.close()
+    b.close()
+
+
+def test_url_claims_are_shared_and_expire(tmp_path):
+    clock = Clock()
+    a = _coordinator(tmp_path, 'host-a', clock, claim_secs=60)
+    b = _coordinator(tmp_path, 'host-b', clock, claim_secs=60)
+    assert a.claim_urls(['u1', 'u2']) == {'u1', 'u2'}
+    assert b.claim_urls(['u2', 'u3']) == {'u3'}
+    # 本实例已认领的可以再次认领（续抓）
+    assert a.claim_urls(['u1', 'u2']) == {'u1', 'u2'}
+    a.mark_done(['u1'])
+    clock.now += 61
+    # A 没完成的 u2 过期后转给 B，已保存的 u1 不再交出
+    assert b.claim_urls(['u1', 'u2']) == {'u2'}
+    assert a.claim_urls(['u2']) == set()
+
+    assert a.claim_delivery('u1') and a.claim_delivery('u1')
+    assert not b.claim_delivery('u1')
+    a.close()
+    b.close()
+
+
+def _claim_in_process(db_file, instance, urls, queue):
+    coordinator = SqliteCoordinator(db_file, instance_id=instance)
+    claimed = set()
+    for i in range(0, len(urls), 10):
+        claimed |= coordinator.claim_urls(urls[i:i + 10])
+    coordinator.close()
+    queue.put(sorted(claimed))
+
+
+def test_concurrent_instances_never_claim_the_same_url(tmp_path):
+    urls = [f'https://alpha.example/a/{i}' for i in range(200)]
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    db_file = tmp_path / 'coordination.db'
+    SqliteCoordinator(db_file).close()
+    workers = [ctx.Process(target=_claim_in_process, args=(db_file, f'host-{i}', urls, queue)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    claimed = [url for result in results for url in result]
+    assert sorted(claimed) == sorted(urls)
+
+
+def test_open_coordinator_picks_backend_from_url(tmp_path):
+    coordinator = open_coordinator(f'sqlite://{tmp_path}/coordination.db', instance_id='host-a')
+    assert isinstance(coordinator, SqliteCoordinator) and coordinator.db_file == tmp_path / 'coordination.db'
+    coordinator.close()
+    with pytest.raises(ValueError):
+        open_coordinator('redis://localhost/0')
+    with pytest.raises(ValueError):
+        open_coordinator(str(tmp_path / 'coordination.db'))
+
+
+def test_two_instances_split_detail_pages_and_notifications(data_home, tmp_path):
+    sites_file = tmp_path / 'sites.json'
+    sites_file.write_text(json.dumps(SITES), encoding='utf-8')
+    clock = Clock()
+    spiders = [NewsSitesSpider(sites='alpha', sites_file=sites_file,
+                               coordinator=_coordinator(tmp_path, host, clock))
+               for host in ('host-a', 'host-b')]
+    url = 'https://alpha.example/news'
+    response = HtmlResponse(url, body=LIST_PAGE, encoding='utf-8', request=Request(url, meta={'site': 'alpha'}))
+
+    first = [r.url for r in spiders[0].parse(response) if r.callback == spiders[0].parse_article]
+    assert first == ['https://alpha.example/a/1', 'https://alpha.example/a/2']
+    # 另一台主机的本地 articles.db 里没有这些 URL，也不会再请求
+    assert [r.url for r in spiders[1].parse(response) if r.callback == spiders[1].parse_article] == []
+
+    sent = []
+    pipeline = SaveJsonPipeline({'WECHAT_WEBHOOK_URL': 'https://example.invalid/webhook'})
+    pipeline.send_to_wechat = lambda article, spider: sent.append((spider.coordinator.instance_id, article['url']))
+    item = {'title': 'One', 'url': 'https://alpha.example/a/1', 'text': 'x', 'scraped_at': 's'}
+    for spider in spiders:
+        pipeline._notify(item, 'notify', spider)
+    assert sent == [('host-a', 'https://alpha.example/a/1')]
+
+    # 站点租约：先启动的实例抓取 alpha，另一个实例整站跳过
+    assert [r.url for r in spiders[0].start_requests() if r.callback == spiders[0].parse] == [url]
+    assert list(spiders[1].start_requests()) == []
+    for spider in spiders:
+        spider.closed('finished')
+        spider.coordinator.close()
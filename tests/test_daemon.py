@@ -0,0 +1,152 @@
+from scrapy.http import HtmlResponse, Request
+from twisted.internet import defer, task
+
+import hku_scraper_runner
+from hku_scraper.pipelines import SaveJsonPipeline
+from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+from hku_scraper.store import open_store
+
+HOMEPAGE = b'''
+<html><body><div class="inner-box"><ul class="news">
+  <li><a href="/news/a">Article A</a></li>
+  <li><a href="/news/b">Article B</a></li>
+</ul></div></body></html>
+'''
+
+
+def _homepage_response():
+    url = 'https://arts.hku.hk/'
+    return HtmlResponse(url=url, body=HOMEPAGE, encoding='utf-8', request=Request(url))
+
+
+def _run_pipeline(spider, item):
+    pipeline = SaveJsonPipeline()
+    pipeline.send_to_wechat = lambda article, spider: None
+    pipeline.open_spider(spider)
+    pipeline.process_item(item, spider)
+    pipeline.close_spider(spider)
+    return pipeline
+
+
+class FakeRunner:
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def crawl(self, spider_cls, **kwargs):
+        self.calls.append((spider_cls, kwargs))
+        if isinstance(self.result, Exception):
+            return defer.fail(self.result)
+        return defer.succeed(self.result)
+
+
+def _daemon(runner, probe_result, clock):
+    return hku_scraper_runner.CrawlDaemon(
+        runner, HKUArtsNewsSpider, 600, clock, {},
+        probe=lambda: probe_result,
+        defer_probe=defer.maybeDeferred,
+    )
+
+
+def test_saved_item_is_skipped_in_next_daemon_cycle(data_home):
+    store = open_store(data_home)
+
+    first = HKUArtsNewsSpider(store=store)
+    detail_requests = list(first.parse(_homepage_response()))
+    assert [r.url for r in detail_requests] == ['https://arts.hku.hk/news/a', 'https://arts.hku.hk/news/b']
+    _run_pipeline(first, {'title': 'Article A', 'url': 'https://arts.hku.hk/news/a',
+                          'text': 'x', 'scraped_at': '2025-01-01T00:00:00'})
+
+    # 下一轮复用同一个常驻 store，不重新读盘
+    second = HKUArtsNewsSpider(store=store)
+    detail_requests = list(second.parse(_homepage_response()))
+    assert [r.url for r in detail_requests] == ['https://arts.hku.hk/news/b']
+    store.close()
+
+
+def test_daemon_store_is_not_closed_by_spider(data_home):
+    store = open_store(data_home)
+    spider = HKUArtsNewsSpider(store=store)
+    spider.closed('finished')
+    # 连接仍可用
+    assert store.get_id('https://arts.hku.hk/news/a') is None
+    store.close()
+
+
+def test_start_request_always_revalidates_http_cache(data_home):
+    start = list(HKUArtsNewsSpider().start_requests())
+    assert start[0].meta.get('httpcache_revalidate') is True
+    assert not start[0].meta.get('dont_cache')
+
+
+def test_failed_crawl_still_schedules_next_cycle(monkeypatch):
+    saved = []
+    monkeypatch.setattr(hku_scraper_runner, '_save_probe_state', saved.append)
+    clock = task.Clock()
+    runner = FakeRunner(RuntimeError('boom'))
+    daemon = _daemon(runner, (True, {'fingerprint': 'abc'}), clock)
+
+    daemon.run_cycle()
+    assert len(runner.calls) == 1
+    assert saved == []
+    assert len(clock.getDelayedCalls()) == 1
+
+    # 下一轮照常执行
+    clock.advance(600)
+    assert len(runner.calls) == 2
+
+
+def test_successful_crawl_saves_probe_state(monkeypatch):
+    saved = []
+    monkeypatch.setattr(hku_scraper_runner, '_save_probe_state', saved.append)
+    clock = task.Clock()
+    runner = FakeRunner(None)
+    daemon = _daemon(runner, (True, {'fingerprint': 'abc'}), clock)
+
+    daemon.run_cycle()
+    assert saved == [{'fingerprint': 'abc'}]
+    assert runner.calls[0][1]['store'] is daemon.store
+    assert len(clock.getDelayedCalls()) == 1
+
+
+def test_unchanged_probe_skips_crawl(monkeypatch):
+    clock = task.Clock()
+    runner = FakeRunner(None)
+    daemon = _daemon(runner, (False, None), clock)
+
+    daemon.run_cycle()
+    assert runner.calls == []
+    assert len(clock.getDelayedCalls()) == 1
+
+
+def test_probe_exception_still_schedules_next_cycle():
+    clock = task.Clock()
+    runner = FakeRunner(None)
+
+    def broken_probe():
+        raise OSError('network down')
+
+    daemon = hku_scraper_runner.CrawlDaemon(
+        runner, HKUArtsNewsSpider, 600, clock, {},
+        probe=broken_probe, defer_probe=defer.maybeDeferred,
+    )
+    daemon.run_cycle()
+    assert runner.calls == []
+    assert len(clock.getDelayedCalls()) == 1
+
+
+def test_details_left_by_interrupted_run_are_requested_first(data_home):
+    store = open_store(data_home)
+    first = HKUArtsNewsSpider(store=store)
+    list(first.parse(_homepage_response()))
+    # 只保存了 A 就中断
+    _run_pipeline(first, {'title': 'Article A', 'url': 'https://arts.hku.hk/news/a',
+                          'text': 'x', 'scraped_at': '2025-01-01T00:00:00'})
+    store.close()
+
+    second = HKUArtsNewsSpider()
+    start = list(second.start_requests())
+    assert start[0].url == 'https://arts.hku.hk/news/b'
+    assert start[0].callback == second.parse_article and start[0].meta['title'] == 'Article B'
+    assert start[1].meta.get('httpcache_revalidate') is True
+    second.closed('finished')
@@ -0,0 +1,297 @@
+import base64
+import hashlib
+import json
+import time
+
+from hku_scraper import delivery
+from hku_scraper.delivery import DeliveryWorker, Outbox, TokenBucket
+from hku_scraper.pipelines import SaveJsonPipeline
+from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+
+WEBHOOK = 'https://example.invalid/webhook'
+
+
+class FakeResponse:
+    def __init__(self, result):
+        self.result = result
+
+    def json(self):
+        return self.result
+
+
+class FakeSession:
+    """按顺序返回预设结果，记录发送的 payload"""
+
+    def __init__(self, results=None):
+        self.results = list(results or [])
+        self.sent = []
+
+    def post(self, url, json=None, timeout=None):
+        self.sent.append(json)
+        result = self.results.pop(0) if self.results else {'errcode': 0}
+        if isinstance(result, Exception):
+            raise result
+        return FakeResponse(result)
+
+    def close(self):
+        pass
+
+
+def _markdown(text):
+    return {'msgtype': 'markdown', 'markdown': {'content': text}}
+
+
+def _worker(outbox, session, **kwargs):
+    return DeliveryWorker(outbox, session=session, bucket=TokenBucket(6000), **kwargs)
+
+
+def test_due_returns_one_message_per_article_in_order(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')])
+    outbox.enqueue('b', WEBHOOK, [_markdown('b1')])
+    due = outbox.due()
+    assert [json.loads(m['payload'])['markdown']['content'] for m in due] == ['a1', 'b1']
+    outbox.mark_sent(due[0]['id'])
+    assert [json.loads(m['payload'])['markdown']['content'] for m in outbox.due()] == ['a2', 'b1']
+    outbox.close()
+
+
+def test_failed_message_blocks_later_segments_until_retry(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')])
+    session = FakeSession([{'errcode': 45009, 'errmsg': 'api freq out of limit'}])
+    worker = _worker(outbox, session)
+    first = outbox.due()[0]
+    assert worker.send_one(first) is False
+    # a1 在退避中，a2 不能抢先发送
+    assert outbox.due() == []
+    assert outbox.next_wakeup() > time.time()
+    outbox.close()
+
+
+def test_message_is_dead_after_max_attempts(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')])
+    worker = _worker(outbox, FakeSession([OSError('reset')]), max_attempts=1)
+    assert worker.send_one(outbox.due()[0]) is False
+    # 放弃的消息不再阻塞后续消息
+    assert [json.loads(m['payload'])['markdown']['content'] for m in outbox.due()] == ['a2']
+    outbox.close()
+
+
+def test_pending_messages_survive_restart_and_drain(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')])
+    outbox.close()
+
+    reopened = Outbox(tmp_path / 'outbox.db')
+    session = FakeSession()
+    worker = _worker(reopened, session)
+    worker.start()
+    worker.stop(drain_timeout=5)
+    assert [p['markdown']['content'] for p in session.sent] == ['a1', 'a2']
+    assert reopened.pending_count() == 0
+    reopened.close()
+
+
+def test_image_payload_is_built_at_send_time(tmp_path):
+    img = tmp_path / 'a.jpg'
+    img.write_bytes(b'\xff\xd8fake')
+    payload = delivery.build_payload({'msgtype': 'image', 'image_file': str(img)})
+    assert payload['msgtype'] == 'image'
+    assert payload['image']['md5'] == hashlib.md5(b'\xff\xd8fake').hexdigest()
+    assert base64.b64decode(payload['image']['base64']) == b'\xff\xd8fake'
+
+
+def test_token_bucket_limits_rate():
+    now = [0.0]
+    bucket = TokenBucket(rate_per_minute=60, capacity=2, clock=lambda: now[0])
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 1.0
+    now[0] += 1.0
+    assert bucket.try_acquire() == 0
+
+
+def test_pipeline_enqueues_instead_of_posting(data_home):
+    pipeline = SaveJsonPipeline({'WECHAT_WEBHOOK_URL': WEBHOOK, 'WECHAT_DRAIN_TIMEOUT': 0})
+    spider = HKUArtsNewsSpider()
+    pipeline.open_spider(spider)
+    # 只测入队，不让后台线程真正发送
+    pipeline.delivery.stop()
+    pipeline.process_item({'title': 'T', 'url': 'https://arts.hku.hk/news/a', 'text': '正文' * 3000,
+                           'scraped_at': 's'}, spider)
+    assert pipeline.outbox.pending_count() > 1
+    pipeline.outbox.close()
+    spider.closed('finished')
+
+
+def test_image_messages_carry_precomputed_md5(data_home):
+    pipeline = SaveJsonPipeline()
+    spider = HKUArtsNewsSpider()
+    pipeline.open_spider(spider)
+    (data_home / 'images' / 'full').mkdir(parents=True)
+    (data_home / 'images' / 'full' / 'a.jpg').write_bytes(b'jpeg')
+    (data_home / 'images' / 'full' / 'big.jpg').write_bytes(b'jpeg')
+    article = {
+        'title': 'T', 'url': 'u', 'text': 'x', 'scraped_at': 's',
+        'images': ['full/a.jpg', 'full/big.jpg'],
+        'image_meta': [{'path': 'full/a.jpg', 'checksum': 'abc', 'size': 4, 'b64_len': 8},
+                       {'path': 'full/big.jpg', 'checksum': 'def', 'size': 3 * 1024 * 1024}],
+    }
+    messages = pipeline.build_wechat_messages(article, spider)
+    images = [m for m in messages if m['msgtype'] == 'image']
+    assert images == [{'msgtype': 'image', 'image_file': str(data_home / 'images' / 'full' / 'a.jpg'),
+                       'md5': 'abc'}]
+    assert delivery.build_payload(images[0])['image']['md5'] == 'abc'
+    pipeline.close_spider(spider)
+    spider.closed('finished')
+
+
+def test_enqueue_ignores_repeated_dedupe_key(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    assert outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')], dedupe_key='a@1') == 2
+    assert outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')], dedupe_key='a@1') == 0
+    # 同一篇文章的新版本照常入队
+    assert outbox.enqueue('a', WEBHOOK, [_markdown('a1')], dedupe_key='a@2') == 1
+    assert outbox.pending_count() == 3
+    outbox.close()
+
+
+def test_message_interrupted_while_sending_is_not_resent(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('a', WEBHOOK, [_markdown('a1'), _markdown('a2')])
+    outbox.enqueue('b', WEBHOOK, [_markdown('b1')])
+    a1, b1 = outbox.due()
+    outbox.claim(a1['id'])
+    # 发送途中的消息阻塞同一篇文章的后续消息
+    assert [m['id'] for m in outbox.due()] == [b1['id']]
+    # 失败重试回到 pending
+    worker = _worker(outbox, FakeSession([OSError('reset')]))
+    assert worker.send_one(b1) is False
+    assert outbox.pending_count() == 3 - 1
+    outbox.close()
+
+    # 进程在请求途中退出：重新打开时 a1 无法确认是否送达，不再重发
+    outbox = Outbox(tmp_path / 'outbox.db')
+    assert outbox.recover_interrupted(now=time.time() + delivery.STALE_SENDING_SECS + 1) == 1
+    row = outbox.conn.execute('SELECT status FROM messages WHERE id = ?', (a1['id'],)).fetchone()
+    assert row['status'] == 'unknown'
+    assert [json.loads(m['payload'])['markdown']['content'] for m in outbox.due(now=time.time() + 3600)] == [
+        'a2', 'b1']
+    outbox.close()
+
+
+def test_article_committed_before_crash_is_enqueued_once(data_home):
+    from hku_scraper.store import open_store
+
+    store = open_store(data_home)
+    article = {'title': 'T', 'url': 'https://arts.hku.hk/news/a', 'text': '正文', 'images': [],
+               'scraped_at': '2025-01-01T00:00:00', 'status': 'completed'}
+    # 上次运行在提交之后、写文件与入队之前退出
+    article_id, _ = store.add_article(article, post_save='notify')
+    store.close()
+
+    for crashed_after_enqueue in (False, True):
+        spider = HKUArtsNewsSpider()
+        if crashed_after_enqueue:
+            # 这次假设上次运行在入队之后、清除标记之前退出
+            with spider.store.conn:
+                spider.store.conn.execute("UPDATE articles SET post_save = 'notify'")
+        pipeline = SaveJsonPipeline({'WECHAT_WEBHOOK_URL': WEBHOOK, 'WECHAT_DRAIN_TIMEOUT': 0})
+        pipeline.open_spider(spider)
+        pipeline.delivery.stop()
+        assert pipeline.outbox.pending_count() == 1
+        assert (data_home / f'{article_id}_article.json').exists()
+        assert spider.store.unfinished_saves() == []
+        pipeline.outbox.close()
+        spider.closed('finished')
+
+
+def test_config_lists_every_webhook_once(data_home, monkeypatch, tmp_path):
+    config = tmp_path / 'wechat.json'
+    config.write_text(json.dumps({'webhookUrl': 'https://a.invalid', 'savedAt': 'x',
+                                  'webhookUrls': ['https://b.invalid', 'https://a.invalid']}), encoding='utf-8')
+    assert delivery.load_webhook_urls() == []
+    monkeypatch.setenv('WECHAT_WEBHOOK', 'https://env1.invalid, https://env2.invalid')
+    assert delivery.load_webhook_urls() == ['https://env1.invalid', 'https://env2.invalid']
+    monkeypatch.setattr(delivery, 'CONFIG_FILE', config)
+    assert delivery.load_webhook_urls() == ['https://a.invalid', 'https://b.invalid']
+
+
+def test_fan_out_keeps_order_per_webhook_and_builds_payload_once(tmp_path, monkeypatch):
+    hooks = ['https://a.invalid/webhook', 'https://b.invalid/webhook']
+    outbox = Outbox(tmp_path / 'outbox.db')
+    img = tmp_path / 'a.jpg'
+    img.write_bytes(b'\xff\xd8fake')
+    messages = [_markdown('a1'), {'msgtype': 'image', 'image_file': str(img)}]
+    assert outbox.enqueue('a', hooks, messages, dedupe_key='a@1') == 4
+    assert outbox.enqueue('a', hooks, messages, dedupe_key='a@1') == 0
+    # 两个机器人各自从第一条开始，互不阻塞
+    assert [(m['webhook'], json.loads(m['payload'])['msgtype']) for m in outbox.due()] == [
+        (hooks[0], 'markdown'), (hooks[1], 'markdown')]
+
+    built = []
+    real_build = delivery.build_payload
+    monkeypatch.setattr(delivery, 'build_payload', lambda m: built.append(m['msgtype']) or real_build(m))
+    session = FakeSession()
+    worker = DeliveryWorker(outbox, session=session)
+    worker.start()
+    worker.stop(drain_timeout=5)
+    assert len(session.sent) == 4 and outbox.pending_count() == 0
+    assert built.count('image') == 1
+    # 每个机器人单独限速
+    assert set(worker.buckets) == set(hooks)
+    outbox.close()
+
+
+def test_throttled_webhook_does_not_hold_back_others(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.enqueue('a', 'https://slow.invalid', [_markdown('a1')])
+    outbox.enqueue('b', 'https://fast.invalid', [_markdown('b1')])
+    session = FakeSession()
+    worker = DeliveryWorker(outbox, session=session)
+    worker.bucket_for('https://slow.invalid').penalize()
+    worker.start()
+    deadline = time.time() + 5
+    while not session.sent and time.time() < deadline:
+        time.sleep(0.01)
+    worker.stop()
+    assert [p['markdown']['content'] for p in session.sent] == ['b1']
+    outbox.close()
+
+
+def test_digest_mode_packs_crawl_into_one_message_per_webhook(data_home):
+    hooks = ['https://a.invalid/webhook', 'https://b.invalid/webhook']
+    spider = HKUArtsNewsSpider()
+    pipeline = SaveJsonPipeline({'WECHAT_WEBHOOK_URL': hooks, 'WECHAT_DIGEST': True,
+                                 'WECHAT_DRAIN_TIMEOUT': 0})
+    pipeline.open_spider(spider)
+    pipeline.delivery.stop()
+    for i in range(5):
+        pipeline.process_item({'title': f'T{i}', 'url': f'https://arts.hku.hk/news/{i}', 'text': '正文' * 3000,
+                               'scraped_at': 's'}, spider)
+    # 爬取期间只进入摘要，不产生逐篇消息
+    assert pipeline.outbox.pending_count() == 0 and pipeline.outbox.digest_pending() == 5
+    pipeline._flush_digest(spider, pipeline.digest_window)
+    assert pipeline.outbox.digest_pending() == 0
+    due = pipeline.outbox.due()
+    assert [m['webhook'] for m in due] == hooks
+    content = json.loads(due[0]['payload'])['markdown']['content']
+    assert content.startswith('**新闻速递（5 篇）**') and '[T4](https://arts.hku.hk/news/4)' in content
+    # 已合并的文章补做时不会再进入摘要
+    pipeline.send_to_wechat({'title': 'T0', 'url': 'https://arts.hku.hk/news/0', 'text': 'x', 'scraped_at': 's'},
+                            spider)
+    assert pipeline.outbox.digest_pending() == 0
+    pipeline.outbox.close()
+    spider.closed('finished')
+
+
+def test_digest_window_holds_articles_until_oldest_is_due(tmp_path):
+    outbox = Outbox(tmp_path / 'outbox.db')
+    outbox.add_to_digest('T1', 'u1', 's1', 'u1@1')
+    assert outbox.flush_digest([WEBHOOK], older_than=3600) == 0
+    assert outbox.flush_digest([], older_than=0) == 0
+    assert outbox.flush_digest([WEBHOOK], older_than=3600, now=time.time() + 3601) == 1
+    assert outbox.pending_count() == 1 and outbox.digest_pending() == 0
+    outbox.close()
@@ -0,0 +1,29 @@
+from hku_scraper.digest import pack_digest, summarize, truncate_bytes
+from hku_scraper.segmenter import utf8_len
+
+
+def _item(i):
+    return {'title': f'第 {i} 篇新闻', 'url': f'https://arts.hku.hk/news/{i}', 'summary': summarize('正文' * 500)}
+
+
+def test_summary_is_cut_on_character_boundary():
+    assert summarize('  第一段\n\n 第二段  ') == '第一段 第二段'
+    cut = truncate_bytes('香港大学' * 10, 10)
+    assert cut == '香港…' and utf8_len(cut) <= 10
+    assert summarize(None) == ''
+
+
+def test_articles_are_packed_into_few_messages_under_limit():
+    items = [_item(i) for i in range(1, 41)]
+    messages = pack_digest(items, max_bytes=4050)
+    assert all(utf8_len(m) <= 4050 for m in messages)
+    # 每篇约 300 字节，40 篇装进 4 条消息，而不是 40 篇各自的正文与图片消息
+    assert len(messages) == 4
+    assert messages[0].startswith('**新闻速递（13 篇）**') and messages[3].startswith('**新闻速递（1 篇）**')
+    # 序号跨消息连续，顺序不变
+    assert messages[1].split('\n\n')[1].startswith('**14.** [第 14 篇新闻](https://arts.hku.hk/news/14)\n> 正文正文')
+    assert sum(m.count('](https://') for m in messages) == 40
+
+    (single,) = pack_digest([{'title': 'T' * 5000, 'url': 'u', 'summary': ''}], max_bytes=1000)
+    assert utf8_len(single) <= 1000
+    assert pack_digest([]) == []
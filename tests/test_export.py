@@ -0,0 +1,127 @@
+import json
+
+import pytest
+
+from hku_scraper.export import export, iter_articles, main
+from hku_scraper.store import ArticleStore, connect
+
+SITES = {'sites': [
+    {'name': 'hku_arts', 'start_urls': ['https://arts.hku.hk/news'], 'list_selector': 'li', 'detail_selector': 'div'},
+    {'name': 'alpha', 'start_urls': ['https://alpha.example/news'], 'list_selector': 'li', 'detail_selector': 'div'},
+]}
+
+
+def _article(url, scraped_at, site=None, text='正文'):
+    return {'title': url.rsplit('/', 1)[-1], 'url': url, 'site': site, 'text': text,
+            'images': ['full/a.jpg'], 'scraped_at': scraped_at, 'status': 'completed'}
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    store = ArticleStore(tmp_path / 'articles.db')
+    # hku_arts_news 爬虫保存的文章没有 site 字段，按域名归属
+    store.add_article(_article('https://arts.hku.hk/news/1', '2025-01-10T09:00:00'))
+    store.add_article(_article('https://alpha.example/a/1', '2025-01-31T23:59:59', site='alpha'))
+    store.add_article(_article('https://alpha.example/a/2', '2025-02-01T00:00:00', site='alpha'))
+    store.add_article(_article('https://arts.hku.hk/news/2', '2025-03-01T08:00:00'))
+    sites_file = tmp_path / 'sites.json'
+    sites_file.write_text(json.dumps(SITES), encoding='utf-8')
+    yield store, tmp_path, sites_file
+    store.close()
+
+
+def _read_jsonl(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+def test_jsonl_export_streams_in_batches_with_filters(corpus):
+    store, data_dir, sites_file = corpus
+    conn = connect(data_dir / 'articles.db')
+    assert [a['id'] for a in iter_articles(conn, batch_size=1)] == [1, 2, 3, 4]
+    # --to 只给日期时包含当天
+    assert [a['id'] for a in iter_articles(conn, start='2025-01-11', end='2025-01-31', batch_size=2)] == [2]
+    conn.close()
+
+    result = export('jsonl', data_dir / 'out' / 'alpha.jsonl', data_dir, sites=['alpha'], sites_file=sites_file)
+    rows = _read_jsonl(result['output'])
+    assert result['rows'] == 2 and [r['id'] for r in rows] == [2, 3]
+    assert rows[0]['text'] == '正文' and rows[0]['images'] == ['full/a.jpg']
+
+    result = export('jsonl', data_dir / 'arts.jsonl', data_dir, sites=['hku_arts'], sites_file=sites_file)
+    assert [r['url'] for r in _read_jsonl(result['output'])] == [
+        'https://arts.hku.hk/news/1', 'https://arts.hku.hk/news/2']
+    assert not list(data_dir.glob('**/*.tmp'))
+
+
+def test_incremental_export_emits_only_changes_since_watermark(corpus):
+    store, data_dir, _ = corpus
+    first = export('jsonl', data_dir / 'd1.jsonl', data_dir, incremental='analysts')
+    assert first['rows'] == 4 and first['since'] == 0
+
+    store.add_article(_article('https://alpha.example/a/3', '2025-03-02T00:00:00', site='alpha'))
+    store.update_article(1, _article('https://arts.hku.hk/news/1', '2025-03-02T01:00:00', text='修改后'))
+    # 只更新校验头不算内容变化
+    store.update_validators(2, etag='"v2"')
+    second = export('jsonl', data_dir / 'd2.jsonl', data_dir, incremental='analysts')
+    rows = _read_jsonl(second['output'])
+    assert second['since'] == first['watermark']
+    assert sorted(r['id'] for r in rows) == [1, 5]
+    assert {r['id']: r['text'] for r in rows}[1] == '修改后'
+
+    assert export('jsonl', data_dir / 'd3.jsonl', data_dir, incremental='analysts')['rows'] == 0
+    # 不同名称的水位相互独立
+    assert export('jsonl', data_dir / 'other.jsonl', data_dir, incremental='bi')['rows'] == 5
+
+
+def test_failed_export_keeps_watermark_and_previous_file(corpus, monkeypatch):
+    store, data_dir, _ = corpus
+    output = data_dir / 'corpus.jsonl'
+    output.write_text('previous\n', encoding='utf-8')
+
+    def broken(*args, **kwargs):
+        yield {'id': 1}
+        raise OSError('disk full')
+
+    monkeypatch.setattr('hku_scraper.export.iter_articles', broken)
+    with pytest.raises(OSError):
+        export('jsonl', output, data_dir, incremental='analysts')
+    monkeypatch.undo()
+
+    assert output.read_text(encoding='utf-8') == 'previous\n'
+    assert not list(data_dir.glob('*.tmp'))
+    assert export('jsonl', output, data_dir, incremental='analysts')['rows'] == 4
+
+
+def test_parquet_export_writes_row_groups(corpus):
+    pq = pytest.importorskip('pyarrow.parquet')
+    _, data_dir, _ = corpus
+    result = export('parquet', data_dir / 'corpus.parquet', data_dir, row_group_size=3, batch_size=2)
+    parquet = pq.ParquetFile(result['output'])
+    assert parquet.metadata.num_row_groups == 2 and parquet.metadata.num_rows == 4
+    table = parquet.read()
+    assert table.column('id').to_pylist() == [1, 2, 3, 4]
+    assert table.column('images').to_pylist()[0] == ['full/a.jpg']
+    assert table.column('site').to_pylist() == [None, 'alpha', 'alpha', None]
+
+
+def test_xlsx_export_uses_write_only_sheet(corpus):
+    openpyxl = pytest.importorskip('openpyxl')
+    store, data_dir, _ = corpus
+    store.add_article(_article('https://alpha.example/a/bad', '2025-03-03T00:00:00', site='alpha',
+                               text='含控制字符\x07的正文'))
+    result = export('xlsx', data_dir / 'corpus.xlsx', data_dir, start='2025-03-01')
+    sheet = openpyxl.load_workbook(result['output'], read_only=True)['articles']
+    rows = list(sheet.iter_rows(values_only=True))
+    assert rows[0][:3] == ('id', 'title', 'url')
+    assert [r[0] for r in rows[1:]] == [4, 5]
+    assert rows[2][7] == '含控制字符的正文'
+
+
+def test_cli(corpus, monkeypatch, capsys):
+    _, data_dir, _ = corpus
+    monkeypatch.setattr('hku_scraper.export.get_data_dir', lambda: data_dir)
+    assert main(['jsonl', str(data_dir / 'cli.jsonl'), '--from', '2025-02-01', '--incremental', 'cli']) == 0
+    assert '[Export] 已导出 2 篇文章' in capsys.readouterr().out
+    assert main(['jsonl']) == 1
+    assert main(['csv', 'out.csv']) == 1
+    assert main(['jsonl', 'out.jsonl', '--bogus', 'x']) == 1
@@ -0,0 +1,45 @@
+from lxml import html
+from scrapy.http import HtmlResponse
+
+from benchmarks.bench_extractor import legacy_extract
+from hku_scraper.extractor import extract_article
+
+BASE = 'https://arts.hku.hk/news/a'
+
+
+def _extract(body, **kwargs):
+    return extract_article(html.fromstring(body), BASE, 'div.content-container', **kwargs)
+
+
+def test_matches_legacy_output_on_plain_article():
+    body = ('<html><body><nav>menu</nav><div class="content-container">'
+            '<h1> 標題 </h1><p>第一段\n  文字<b>粗體</b>尾巴</p>\n<p>Second&nbsp;para</p>'
+            '<img src=" /a.jpg "><img data-src="/b.jpg"><img src="/c.jpg" data-src="/c@2x.jpg">'
+            '</div></body></html>')
+    response = HtmlResponse(url=BASE, body=body.encode('utf-8'), encoding='utf-8')
+    assert _extract(body) == legacy_extract(response)
+
+
+def test_skips_script_style_and_keeps_comment_tail():
+    body = ('<div class="content-container">a<script>var x=1;</script>b<style>.c{}</style>'
+            '<p>c<!-- hidden -->d</p><noscript>n</noscript>e</div>')
+    assert _extract(body) == ('a b c d e', [])
+
+
+def test_stops_at_text_and_image_caps():
+    words = ' '.join(f'w{i}' for i in range(1000))
+    imgs = ''.join(f'<img src="/{i}.jpg">' for i in range(50))
+    text, images = _extract(f'<div class="content-container"><p>{words}</p>{imgs}</div>',
+                            text_limit=20, image_limit=3)
+    assert text == 'w0 w1 w2 w3 w4 w5 w6'[:20]
+    assert images == ['https://arts.hku.hk/0.jpg', 'https://arts.hku.hk/1.jpg', 'https://arts.hku.hk/2.jpg']
+
+
+def test_nested_containers_are_not_counted_twice():
+    body = ('<div><div class="content-container">outer<div class="content-container">inner'
+            '<img src="/x.jpg"></div></div><div class="content-container">second</div></div>')
+    assert _extract(body) == ('outer inner second', ['https://arts.hku.hk/x.jpg'])
+
+
+def test_missing_container_yields_nothing():
+    assert _extract('<div class="other">text<img src="/x.jpg"></div>') == ('', [])
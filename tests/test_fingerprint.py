@@ -0,0 +1,118 @@
+import sqlite3
+
+from scrapy.http import HtmlResponse, Request
+
+from hku_scraper.fingerprint import hamming, simhash, from_hex, to_hex
+from hku_scraper.pipelines import SaveJsonPipeline
+from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+from hku_scraper.store import ArticleStore
+
+BASE = ('香港大學文學院今日公布本年度傑出教學獎得主，評審委員會表揚多位教師在課程設計、'
+        '學生指導及跨學科合作方面的貢獻。The Faculty of Arts congratulates all awardees '
+        'and thanks the committee for its careful work over the past semester. ') * 4
+URL = 'https://arts.hku.hk/news/award'
+
+
+def _detail(text, headers=None, **meta):
+    body = f'<html><body><div class="content-container"><p>{text}</p></div></body></html>'
+    meta = {'title': 'Award', 'url': URL, 'site': 'hku_arts', **meta}
+    return HtmlResponse(url=URL, body=body.encode('utf-8'), encoding='utf-8', headers=headers,
+                        request=Request(URL, meta=meta))
+
+
+def _pipeline(spider):
+    pipeline = SaveJsonPipeline()
+    sent = []
+    pipeline.send_to_wechat = lambda article, spider: sent.append(article)
+    pipeline.open_spider(spider)
+    return pipeline, sent
+
+
+def test_simhash_is_stable_and_distance_tracks_edits():
+    assert simhash(BASE) == simhash(BASE)
+    assert simhash('') is None
+    small_edit = BASE + ' 附：頒獎典禮照片。'
+    rewrite = '圖書館將於下月起延長開放時間，並新增自修室座位。Library hours are extended. ' * 4
+    assert hamming(simhash(BASE), simhash(small_edit)) < hamming(simhash(BASE), simhash(rewrite))
+    assert hamming(simhash(BASE), simhash(rewrite)) > 10
+    assert from_hex(to_hex(simhash(BASE))) == simhash(BASE)
+
+
+def test_store_persists_fingerprints_and_adds_columns_to_old_db(tmp_path):
+    db = tmp_path / 'articles.db'
+    conn = sqlite3.connect(db)
+    conn.execute('CREATE TABLE articles (id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE, '
+                 'title TEXT, file TEXT, scraped_at TEXT, status TEXT, body TEXT)')
+    conn.commit()
+    conn.close()
+
+    store = ArticleStore(db)
+    fp = simhash(BASE)
+    article_id, _ = store.add_article({'url': URL, 'title': 'Award'}, fp, etag='"v1"')
+    store.close()
+
+    store = ArticleStore(db)
+    assert store.get_fingerprint(article_id) == fp
+    assert store.recent_articles(5) == [{'id': article_id, 'url': URL, 'title': 'Award',
+                                         'etag': '"v1"', 'last_modified': None}]
+    assert store.find_near_duplicate(fp) == article_id
+    assert store.find_near_duplicate(fp, exclude_id=article_id) is None
+    store.close()
+
+
+def test_revalidation_requests_are_conditional(data_home):
+    spider = HKUArtsNewsSpider(revalidate=5)
+    spider.store.add_article({'url': URL, 'title': 'Award'}, simhash(BASE),
+                             etag='"v1"', last_modified='Mon, 01 Jan 2024 00:00:00 GMT')
+    spider.store.add_article({'url': 'https://elsewhere.example/x', 'title': 'Other'})
+    requests = list(spider.start_requests())
+    revalidations = [r for r in requests if 'revalidate_of' in r.meta]
+    assert [r.url for r in revalidations] == [URL]
+    assert revalidations[0].headers[b'If-None-Match'] == b'"v1"'
+    assert 304 in revalidations[0].meta['handle_httpstatus_list']
+
+    not_modified = HtmlResponse(url=URL, status=304, body=b'',
+                                request=Request(URL, meta=revalidations[0].meta))
+    assert list(spider.parse_article(not_modified)) == []
+    spider.closed('finished')
+
+
+def test_only_real_changes_are_resaved_and_resent(data_home):
+    spider = HKUArtsNewsSpider()
+    pipeline, sent = _pipeline(spider)
+    item, = spider.parse_article(_detail(BASE, headers={'ETag': '"v1"'}))
+    pipeline.process_item(item, spider)
+    article_id = spider.store.get_id(URL)
+    assert len(sent) == 1
+
+    # 内容相同：只更新校验头，不推送
+    item, = spider.parse_article(_detail(BASE, headers={'ETag': '"v2"'}, revalidate_of=article_id))
+    pipeline.process_item(item, spider)
+    assert len(sent) == 1
+    assert spider.store.recent_articles(1)[0]['etag'] == '"v2"'
+
+    # 内容被改写：覆盖保存并以【更新】再次推送
+    rewrite = '本文已更正：獲獎名單有誤，現已重新公布。The list of awardees has been corrected. ' * 4
+    item, = spider.parse_article(_detail(rewrite, revalidate_of=article_id))
+    pipeline.process_item(item, spider)
+    assert len(sent) == 2
+    assert sent[1]['title'] == '【更新】Award'
+    assert spider.store.get_article(article_id)['text'].startswith('本文已更正')
+    pipeline.close_spider(spider)
+    spider.closed('finished')
+
+
+def test_near_duplicate_across_urls_is_flagged_not_sent(data_home):
+    spider = HKUArtsNewsSpider()
+    pipeline, sent = _pipeline(spider)
+    item, = spider.parse_article(_detail(BASE))
+    pipeline.process_item(item, spider)
+
+    other_url = 'https://arts.hku.hk/events/award-repost'
+    item, = spider.parse_article(_detail(BASE, url=other_url))
+    pipeline.process_item(item, spider)
+    assert len(sent) == 1
+    duplicate = spider.store.get_article(spider.store.get_id(other_url))
+    assert duplicate['duplicate_of'] == spider.store.get_id(URL)
+    pipeline.close_spider(spider)
+    spider.closed('finished')
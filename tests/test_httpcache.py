@@ -0,0 +1,131 @@
+import os
+import zlib
+
+import pytest
+from scrapy import Spider
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.utils.test import get_crawler
+
+from hku_scraper.httpcache import CACHE_DB, ResponseCache, encode_body, main
+
+PAGE = b'<html><body>' + '<li><a href="/news/1">新闻</a></li>'.encode() * 200 + b'</body></html>'
+
+
+@pytest.fixture
+def middleware(tmp_path):
+    crawler = get_crawler(Spider, {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_POLICY': 'hku_scraper.httpcache.RevalidatingPolicy',
+        'HTTPCACHE_STORAGE': 'hku_scraper.httpcache.CompressedLRUStorage',
+        'HTTPCACHE_DIR': str(tmp_path / 'httpcache'),
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+    })
+    crawler.spider = Spider.from_crawler(crawler, name='hku_arts_news')
+    mw = HttpCacheMiddleware.from_crawler(crawler)
+    mw.spider_opened(crawler.spider)
+    yield mw
+    mw.spider_closed(crawler.spider)
+
+
+def _fetch(mw, request, server_response):
+    """模拟下载器：缓存中间件先处理请求，需要回源时返回 server_response"""
+    cached = mw.process_request(request)
+    if cached is not None:
+        return cached, False
+    response = server_response(request)
+    return mw.process_response(request, response), True
+
+
+def test_list_page_is_revalidated_every_time(middleware):
+    def first(request):
+        return HtmlResponse('https://arts.hku.hk/', body=PAGE, request=request,
+                            headers={'ETag': '"v1"', 'Content-Type': 'text/html'})
+
+    response, hit_network = _fetch(middleware, Request('https://arts.hku.hk/', meta={'httpcache_revalidate': True}),
+                                   first)
+    assert hit_network and response.body == PAGE
+
+    seen = []
+
+    def not_modified(request):
+        seen.append(request.headers.get('If-None-Match'))
+        return Response(request.url, status=304, request=request)
+
+    request = Request('https://arts.hku.hk/', meta={'httpcache_revalidate': True})
+    response, hit_network = _fetch(middleware, request, not_modified)
+    # 仍然回源，但只收到 304，内容来自缓存
+    assert hit_network and seen == [b'"v1"']
+    assert response.status == 200 and response.body == PAGE and 'cached' in response.flags
+
+    changed = PAGE.replace(b'/news/1', b'/news/2')
+    request = Request('https://arts.hku.hk/', meta={'httpcache_revalidate': True})
+    response, _ = _fetch(middleware, request, lambda r: HtmlResponse(r.url, body=changed, request=r,
+                                                                     headers={'ETag': '"v2"'}))
+    assert response.body == changed
+    stats = middleware.stats.get_stats()
+    assert stats['httpcache/revalidate'] == 1 and stats['httpcache/invalidate'] == 1
+
+
+def test_detail_pages_and_images_are_served_from_cache(middleware):
+    calls = []
+
+    def server(request):
+        calls.append(request.url)
+        return HtmlResponse(request.url, body=PAGE, request=request, headers={'Content-Type': 'text/html'})
+
+    for _ in range(3):
+        response, _ = _fetch(middleware, Request('https://arts.hku.hk/news/1'), server)
+        assert response.body == PAGE
+    assert calls == ['https://arts.hku.hk/news/1']
+
+    # 错误响应与 no-store 不缓存
+    _fetch(middleware, Request('https://arts.hku.hk/404'), lambda r: Response(r.url, status=404, request=r))
+    _fetch(middleware, Request('https://arts.hku.hk/private'),
+           lambda r: Response(r.url, body=b'x', request=r, headers={'Cache-Control': 'no-store'}))
+    assert len(middleware.storage.cache) == 1
+
+
+def test_text_is_compressed_and_binary_is_stored_raw():
+    stored, compressed = encode_body(PAGE, {b'Content-Type': b'text/html; charset=utf-8'})
+    assert compressed and len(stored) < len(PAGE) / 5 and zlib.decompress(stored) == PAGE
+    jpeg = os.urandom(4096)
+    assert encode_body(jpeg, {b'Content-Type': b'image/jpeg'}) == (jpeg, False)
+    # 服务器已 gzip 的正文原样保存
+    assert encode_body(PAGE, {b'Content-Type': b'text/html', b'Content-Encoding': b'gzip'}) == (PAGE, False)
+
+
+def test_lru_prune_keeps_recently_used_entries(tmp_path):
+    cache = ResponseCache(tmp_path / CACHE_DB, max_bytes=10 * 4096, prune_ratio=0.5)
+    headers = {b'Content-Type': b'image/png'}
+    for i in range(8):
+        cache.put(f'fp{i}', f'https://img/{i}', 200, headers, os.urandom(4096))
+    # 最早写入的 fp0 刚被读过，不应被淘汰
+    assert cache.get('fp0') is not None
+    for i in range(8, 12):
+        cache.put(f'fp{i}', f'https://img/{i}', 200, headers, os.urandom(4096))
+    cache.wait()
+    assert cache.total_bytes <= 10 * 4096
+    assert cache.get('fp0') is not None
+    assert cache.get('fp1') is None and cache.get('fp11') is not None
+    cache.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    size_before = os.path.getsize(cache.db_file)
+    remaining = len(cache)
+    assert cache.prune(max_bytes=4096)[0] == remaining
+    cache.close()
+
+    # 淘汰后的空闲页还给文件系统；重新打开时总大小从数据库重新统计
+    assert os.path.getsize(tmp_path / CACHE_DB) < size_before
+    reopened = ResponseCache(tmp_path / CACHE_DB, max_bytes=0)
+    assert len(reopened) == 0 and reopened.total_bytes == 0
+    reopened.close()
+
+
+def test_cli_stats_and_prune(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'scrapy.cfg').write_text('[settings]\ndefault = hku_scraper.settings\n')
+    assert main(['stats']) == 0
+    assert main(['prune', '1']) == 0
+    assert '[HttpCache]' in capsys.readouterr().out
+    assert (tmp_path / '.scrapy' / 'httpcache' / CACHE_DB).exists()
+    assert main([]) == 1
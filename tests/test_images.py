@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from scrapy import Spider
+from scrapy.http import Request, Response
+from scrapy.utils.test import get_crawler
+
+from hku_scraper.fingerprint import simhash
+from hku_scraper.images import IMAGE_CONTENT_TYPES, CachedImagesPipeline, b64_length, shrink_jpeg
+from hku_scraper.store import ArticleStore
+
+
+def _jpeg_bytes(color=(200, 30, 30), size=(80, 60)):
+    buf = BytesIO()
+    Image.new('RGB', size, color).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def _noise_image(size):
+    rng = random.Random(0)
+    return Image.frombytes('RGB', size, bytes(rng.getrandbits(8) for _ in range(size[0] * size[1] * 3)))
+
+
+@pytest.fixture
+def make_pipeline(tmp_path):
+    pipelines = []
+
+    def make(**settings):
+        crawler = get_crawler(settings_dict={'IMAGES_STORE': str(tmp_path / 'images'), **settings})
+        pipeline = CachedImagesPipeline.from_crawler(crawler)
+        pipeline.crawler.stats.open_spider()
+        pipelines.append(pipeline)
+        return pipeline
+
+    yield make
+    for pipeline in pipelines:
+        pipeline.close_spider()
+
+
+def _download(pipeline, url, body):
+    request = Request(url)
+    response = Response(url, body=body, request=request)
+    info = pipeline.SpiderInfo(Spider('test'))
+    return asyncio.run(pipeline.media_downloaded(response, request, info))
+
+
+def test_shrink_jpeg_fits_budget():
+    image = _noise_image((600, 600))
+    _, buf = shrink_jpeg(image, 60 * 1024)
+    assert buf.getbuffer().nbytes <= 60 * 1024
+
+
+def test_same_content_from_two_urls_is_stored_once(make_pipeline, tmp_path):
+    pipeline = make_pipeline()
+    body = _jpeg_bytes()
+    first = _download(pipeline, 'https://arts.hku.hk/a.jpg', body)
+    second = _download(pipeline, 'https://arts.hku.hk/copy-of-a.jpg', body)
+
+    assert first['path'] == second['path'] == f'full/{hashlib.sha1(body).hexdigest()}.jpg'
+    assert first['checksum'] == second['checksum']
+    stored = (tmp_path / 'images' / first['path']).read_bytes()
+    assert first['checksum'] == hashlib.md5(stored).hexdigest()
+    assert first['size'] == len(stored)
+    assert first['b64_len'] == b64_length(len(stored))
+    assert len(list((tmp_path / 'images' / 'full').iterdir())) == 1
+
+
+def test_known_url_is_not_downloaded_again(make_pipeline):
+    pipeline = make_pipeline()
+    saved = _download(pipeline, 'https://arts.hku.hk/a.jpg', _jpeg_bytes())
+    pipeline.close_spider()
+
+    # 下一次运行：新的管道实例直接命中缓存
+    reopened = make_pipeline()
+    cached = reopened.media_to_download(Request('https://arts.hku.hk/a.jpg'), None)
+    assert cached['status'] == 'uptodate'
+    assert cached['path'] == saved['path']
+    assert cached['checksum'] == saved['checksum']
+    assert reopened.media_to_download(Request('https://arts.hku.hk/other.jpg'), None) is None
+
+
+def test_oversized_image_is_recompressed(make_pipeline, tmp_path):
+    pipeline = make_pipeline(IMAGES_MAX_BYTES=40 * 1024)
+    buf = BytesIO()
+    _noise_image((400, 400)).save(buf, 'PNG')
+    result = _download(pipeline, 'https://arts.hku.hk/big.png', buf.getvalue())
+    assert result['size'] <= 40 * 1024
+    assert (tmp_path / 'images' / result['path']).stat().st_size == result['size']
+
+
+def test_only_images_that_will_be_saved_are_requested(make_pipeline, tmp_path):
+    pipeline = make_pipeline()
+    info = pipeline.SpiderInfo(Spider('test'))
+    urls = ['https://arts.hku.hk/a.jpg', 'https://arts.hku.hk/b.jpg', 'https://arts.hku.hk/a.jpg']
+    requests = pipeline.get_media_requests({'image_urls': urls}, info)
+    assert [r.url for r in requests] == urls[:2]
+    assert all(r.meta['download_accept'] == IMAGE_CONTENT_TYPES for r in requests)
+
+    store = ArticleStore(tmp_path / 'articles.db')
+    text = '同一篇文章的正文内容 ' * 20
+    article_id, _ = store.add_article({'url': 'https://arts.hku.hk/news/1'}, simhash(text))
+    pipeline.crawler.spider = Spider('test', store=store)
+    # 复查后内容未变化：SaveJsonPipeline 不会保存，不下载图片
+    item = {'image_urls': urls, 'revalidate_of': article_id, 'fingerprint': simhash(text)}
+    assert pipeline.get_media_requests(item, info) == []
+    assert pipeline.crawler.stats.get_value('images/skipped_unchanged') == 1
+    changed = {**item, 'fingerprint': simhash('完全不同的另一篇文章 ' * 20)}
+    assert len(pipeline.get_media_requests(changed, info)) == 2
+    store.close()
@@ -0,0 +1,70 @@
+import pytest
+from scrapy.exceptions import DownloadCancelledError, IgnoreRequest, StopDownload
+from scrapy.http import Headers, Request
+from scrapy.utils.test import get_crawler
+
+from hku_scraper.limits import DownloadSizeLimits, content_type_of, size_limit
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def mw():
+    crawler = get_crawler(settings_dict={'DOWNLOAD_SIZE_LIMITS': {'text/html': 1 * MB, 'image/*': 4 * MB, '*': 256}})
+    crawler.stats.open_spider()
+    return DownloadSizeLimits.from_crawler(crawler)
+
+
+def _headers(content_type=None):
+    return Headers({'Content-Type': content_type} if content_type else {})
+
+
+def test_limit_lookup_by_type():
+    limits = {'text/html': 10, 'image/*': 20, '*': 5}
+    assert size_limit(limits, 'text/html') == 10
+    assert size_limit(limits, 'image/webp') == 20
+    assert size_limit(limits, 'application/pdf') == 5
+    assert size_limit(limits, None) == 5
+    assert content_type_of(_headers('Text/HTML; charset=utf-8'), 'https://a/x') == 'text/html'
+    # 没有 Content-Type 时按扩展名猜测
+    assert content_type_of(_headers(), 'https://a/photo.JPG') == 'image/jpeg'
+
+
+def test_oversized_content_length_aborts_before_body(mw):
+    request = Request('https://arts.hku.hk/news/1')
+    with pytest.raises(StopDownload) as exc:
+        mw.headers_received(_headers('text/html'), 5 * MB, request)
+    assert exc.value.fail
+    with pytest.raises(IgnoreRequest):
+        mw.process_exception(request, exc.value)
+    assert mw.stats.get_value('download_limits/size') == 1
+
+    # 同样大小的图片在图片上限之内
+    image = Request('https://arts.hku.hk/big.jpg')
+    mw.headers_received(_headers('image/jpeg'), 3 * MB, image)
+    assert image.meta['download_maxsize'] == 4 * MB
+
+
+def test_unknown_length_gets_type_cap_as_maxsize(mw):
+    request = Request('https://arts.hku.hk/video', meta={'download_maxsize': 128})
+    # 已有更小的上限时保留
+    mw.headers_received(_headers('video/mp4'), 'twisted.web.iweb.UNKNOWN_LENGTH', request)
+    assert request.meta['download_maxsize'] == 128
+
+    streamed = Request('https://arts.hku.hk/news/2')
+    mw.headers_received(_headers('text/html'), 'twisted.web.iweb.UNKNOWN_LENGTH', streamed)
+    assert streamed.meta['download_maxsize'] == 1 * MB
+    # 边收边超限由 Scrapy 取消下载，这里转为 IgnoreRequest
+    with pytest.raises(IgnoreRequest):
+        mw.process_exception(streamed, DownloadCancelledError())
+    # 其它异常不处理
+    assert mw.process_exception(streamed, ValueError()) is None
+
+
+def test_image_request_rejects_other_types(mw):
+    request = Request('https://arts.hku.hk/img/1', meta={'download_accept': ('image/',)})
+    with pytest.raises(StopDownload):
+        mw.headers_received(_headers('text/html'), 100, request)
+    assert mw.stats.get_value('download_limits/type') == 1
+    ok = Request('https://arts.hku.hk/img/2', meta={'download_accept': ('image/',)})
+    mw.headers_received(_headers('image/png'), 100, ok)
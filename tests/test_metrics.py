@@ -0,0 +1,106 @@
+import json
+import time
+
+import pytest
+from scrapy import Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+import hku_scraper_runner
+from hku_scraper import metrics
+from hku_scraper.metrics import CallbackTimingMiddleware, CrawlMetrics, StageMetrics
+
+
+def _report(mean_ms, finished_ts=None):
+    return {
+        'spider': 'hku_arts_news', 'finish_reason': 'finished', 'duration_s': 1.0,
+        'finished_ts': finished_ts or time.time(),
+        'counters': {'items': 1},
+        'stages': {'download': {'count': 1, 'total_s': mean_ms / 1000, 'mean_ms': mean_ms,
+                                'p50_ms': mean_ms, 'p99_ms': mean_ms, 'max_ms': mean_ms}},
+    }
+
+
+def _crawler(tmp_path, **settings):
+    crawler = get_crawler(Spider, {'METRICS_DIR': str(tmp_path), **settings})
+    crawler.spider = Spider('hku_arts_news')
+    return crawler
+
+
+def test_stage_summary_and_counters():
+    m = StageMetrics()
+    for seconds in (0.1, 0.2, 0.3):
+        m.observe('save_json', seconds)
+    m.count('wechat_sent')
+    with m.timer('images'):
+        pass
+    summary = m.stage_summary()
+    assert summary['save_json']['count'] == 3
+    assert summary['save_json']['p50_ms'] == 200.0
+    assert summary['images']['count'] == 1
+    assert summary['parse']['count'] == 0
+    assert m.counters == {'wechat_sent': 1}
+
+
+def test_callback_middleware_times_generator_body(tmp_path):
+    crawler = _crawler(tmp_path)
+    ext = CrawlMetrics(crawler)
+    mw = CallbackTimingMiddleware(crawler)
+
+    def parse_article(response):
+        time.sleep(0.01)
+        yield {'a': 1}
+        time.sleep(0.01)
+
+    request = Request('https://arts.hku.hk/news/a', callback=parse_article)
+    response = HtmlResponse(url=request.url, body=b'', request=request)
+    assert list(mw.process_spider_output(response, parse_article(response))) == [{'a': 1}]
+    samples = ext.samples['parse_article']
+    assert len(samples) == 1 and samples[0] >= 0.02
+
+
+def test_spider_closed_writes_json_and_prometheus(tmp_path):
+    crawler = _crawler(tmp_path)
+    ext = CrawlMetrics(crawler)
+    crawler.stats.open_spider()
+    ext.spider_opened(crawler.spider)
+    crawler.stats.set_value('downloader/response_bytes', 1234)
+    crawler.stats.set_value('retry/count', 2)
+    ext.response_downloaded(None, Request('https://arts.hku.hk/', meta={'download_latency': 0.5}),
+                            crawler.spider)
+    ext.spider_closed(crawler.spider, 'finished')
+
+    report = json.loads((tmp_path / metrics.LAST_RUN_FILE).read_text(encoding='utf-8'))
+    assert report['counters']['response_bytes'] == 1234
+    assert report['counters']['retries'] == 2
+    assert report['stages']['download']['count'] == 1
+    prom = (tmp_path / metrics.PROM_FILE).read_text(encoding='utf-8')
+    assert 'hku_scraper_stage_seconds_total{spider="hku_arts_news",stage="download"} 0.5' in prom
+    assert 'hku_scraper_run_counter{spider="hku_arts_news",name="retries"} 2' in prom
+
+
+def test_metrics_can_be_disabled(tmp_path):
+    crawler = _crawler(tmp_path, METRICS_ENABLED=False)
+    with pytest.raises(NotConfigured):
+        CrawlMetrics(crawler)
+
+
+def test_history_is_rolling_and_flags_regressions(tmp_path):
+    for mean_ms in (10, 11, 12, 10):
+        (tmp_path / metrics.LAST_RUN_FILE).write_text(json.dumps(_report(mean_ms)))
+        _, regressions = metrics.record_run(tmp_path, keep=3)
+        assert regressions == []
+    (tmp_path / metrics.LAST_RUN_FILE).write_text(json.dumps(_report(40)))
+    _, regressions = metrics.record_run(tmp_path, keep=3)
+    assert regressions == [('download', 40, 11)]
+    history = metrics.load_history(tmp_path / metrics.HISTORY_FILE)
+    assert [run['stages']['download']['mean_ms'] for run in history] == [12, 10, 40]
+
+
+def test_runner_ignores_metrics_from_an_earlier_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(hku_scraper_runner, 'METRICS_DIR', tmp_path)
+    (tmp_path / metrics.LAST_RUN_FILE).write_text(json.dumps(_report(10, finished_ts=100.0)))
+    assert hku_scraper_runner.record_metrics(since=200.0) is None
+    assert hku_scraper_runner.record_metrics(since=50.0) is not None
+    assert len(metrics.load_history(tmp_path / metrics.HISTORY_FILE)) == 1
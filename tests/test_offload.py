@@ -0,0 +1,145 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from hku_scraper.extractor import extract_article, prepare_article
+from hku_scraper.fingerprint import simhash
+from hku_scraper.offload import OffloadPipeline, Sequencer, WorkerPool, get_pool
+from hku_scraper.spiders.news_sites_spider import NewsSitesSpider
+
+DETAIL = '<html><body><div class="body"><p>第一段 正文</p><script>x()</script>' \
+         '<p>second paragraph</p><img src="/img/1.png"></div></body></html>'
+SITES = {'sites': [{'name': 'alpha', 'start_urls': ['https://alpha.example/news'],
+                    'list_selector': 'li', 'detail_selector': 'div.body'}]}
+
+
+class FakeReactor:
+    """callFromThread 只把回调放进队列，由测试线程取出执行（模拟 reactor 线程）"""
+
+    def __init__(self):
+        self.calls = queue.Queue()
+
+    def callFromThread(self, func, *args):
+        self.calls.put((func, args))
+
+    def run_until(self, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            func, args = self.calls.get(timeout=max(deadline - time.monotonic(), 0.01))
+            func(*args)
+
+
+def _sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def _fail():
+    raise ValueError('bad page')
+
+
+def test_results_leave_in_submission_order():
+    reactor = FakeReactor()
+    pool = WorkerPool('thread', workers=3, reactor=reactor)
+    sequencer = Sequencer()
+    delivered = []
+    for i, seconds in enumerate((0.15, 0.0, 0.05)):
+        sequencer.wrap(pool.submit(_sleep_and_return, seconds, i)).addCallback(delivered.append)
+    failed = []
+    sequencer.wrap(pool.submit(_fail)).addErrback(lambda f: failed.append(f.value))
+    sequencer.wrap(pool.submit(_sleep_and_return, 0, 'after error')).addCallback(delivered.append)
+    reactor.run_until(lambda: len(delivered) == 4)
+    pool.close()
+    assert delivered == [0, 1, 2, 'after error']
+    assert isinstance(failed[0], ValueError)
+
+
+def test_pending_tasks_are_bounded():
+    reactor = FakeReactor()
+    pool = WorkerPool('thread', workers=4, max_pending=2, reactor=reactor)
+    release = threading.Event()
+    started = []
+    lock = threading.Lock()
+
+    def blocked(i):
+        with lock:
+            started.append(i)
+        release.wait(5)
+        return i
+
+    results = []
+    for i in range(5):
+        pool.submit_local(blocked, i).addCallback(results.append)
+    time.sleep(0.1)
+    # 线程有 4 个，但同时在途的只有 2 个
+    assert started == [0, 1]
+    release.set()
+    reactor.run_until(lambda: len(results) == 5)
+    pool.close()
+    assert sorted(results) == [0, 1, 2, 3, 4]
+
+
+def test_serial_lane_runs_one_at_a_time_in_order():
+    reactor = FakeReactor()
+    pool = WorkerPool('thread', workers=4, reactor=reactor)
+    order = []
+    for i in range(6):
+        pool.submit_local(lambda i=i: order.append((i, threading.current_thread().name)), serial=True)
+    reactor.run_until(lambda: len(order) == 6)
+    pool.close()
+    assert [i for i, _ in order] == list(range(6))
+    assert len({name for _, name in order}) == 1
+
+
+def test_process_pool_matches_inline_extraction():
+    reactor = FakeReactor()
+    pool = WorkerPool('process', workers=1, reactor=reactor)
+    results = []
+    pool.submit(prepare_article, DETAIL, 'https://alpha.example/a/1', 'div.body', 5000, 10).addCallback(results.append)
+    reactor.run_until(lambda: results, timeout=60)
+    pool.close()
+    text, images, fingerprint, elapsed = results[0]
+    expected_text, expected_images = extract_article(
+        HtmlResponse('https://alpha.example/a/1', body=DETAIL.encode(), encoding='utf-8').selector.root,
+        'https://alpha.example/a/1', 'div.body')
+    assert (text, images) == (expected_text, expected_images) == (
+        '第一段 正文 second paragraph', ['https://alpha.example/img/1.png'])
+    assert fingerprint == simhash(text) and elapsed >= 0
+
+
+def test_unknown_pool_kind():
+    with pytest.raises(ValueError):
+        WorkerPool('fiber')
+
+
+def test_spider_hands_extraction_to_pipeline(data_home, tmp_path):
+    sites_file = tmp_path / 'sites.json'
+    sites_file.write_text(json.dumps(SITES), encoding='utf-8')
+    crawler = get_crawler(NewsSitesSpider, {
+        'SITES_FILE': str(sites_file),
+        'ITEM_PIPELINES': {'hku_scraper.offload.OffloadPipeline': 50},
+        'OFFLOAD_WORKERS': 0,
+    })
+    spider = NewsSitesSpider.from_crawler(crawler, sites_file=sites_file)
+    url = 'https://alpha.example/a/1'
+    response = HtmlResponse(url, body=DETAIL.encode(), encoding='utf-8',
+                            request=Request(url, meta={'title': 'One', 'url': url, 'site': 'alpha'}))
+    (item,) = spider.parse_article(response)
+    assert 'text' not in item and item['_extract']['detail'] == 'div.body'
+    # 交给 worker 的是响应原始字节，而不是再解码出的字符串副本
+    assert item['_extract']['html'] is response.body
+
+    pipeline = OffloadPipeline.from_crawler(crawler)
+    assert get_pool(crawler) is pipeline.pool and pipeline.pool.inline
+    item = asyncio.run(pipeline.process_item(item))
+    assert '_extract' not in item
+    assert item['text'] == '第一段 正文 second paragraph'
+    assert item['image_urls'] == ['https://alpha.example/img/1.png']
+    assert item['fingerprint'] == simhash(item['text'])
+    spider.closed('finished')
@@ -0,0 +1,146 @@
+import json
+import subprocess
+
+import pytest
+
+import hku_scraper_runner
+
+LIST_AB = '''
+<html><body>
+<div class="banner">Welcome {banner}</div>
+<div class="inner-box"><ul class="news">
+  <li><a href="/news/a">Article A</a></li>
+  <li><a href="/news/b">Article B</a></li>
+</ul></div></body></html>
+'''
+
+LIST_BA = '''
+<html><body><div class="inner-box"><ul class="news">
+  <li><a href="https://arts.hku.hk/news/b"> Article B </a></li>
+  <li><a href="/news/a">Article A</a></li>
+</ul></div></body></html>
+'''
+
+NO_LIST = '<html><body><div class="inner-box"><p>Nothing here</p></div></body></html>'
+
+LINK_A = 'https://arts.hku.hk/news/a'
+LINK_B = 'https://arts.hku.hk/news/b'
+
+
+class FakeResponse:
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.url = hku_scraper_runner.HOMEPAGE_URL
+
+
+@pytest.fixture
+def probe_env(tmp_path, monkeypatch):
+    """把预检状态文件指向临时目录，并记录 requests.get 的调用"""
+    monkeypatch.setattr(hku_scraper_runner, 'DATA_DIR', tmp_path)
+    monkeypatch.setattr(hku_scraper_runner, 'PROBE_STATE_FILE', tmp_path / 'probe_state.json')
+    calls = []
+
+    def use(response):
+        def fake_get(url, headers=None, timeout=None):
+            calls.append(headers)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        monkeypatch.setattr(hku_scraper_runner.requests, 'get', fake_get)
+        return calls
+
+    return use
+
+
+def _state_file():
+    return hku_scraper_runner.PROBE_STATE_FILE
+
+
+def test_fingerprint_ignores_order_and_rest_of_page():
+    fp = hku_scraper_runner.news_list_fingerprint(LIST_AB.format(banner='1'))
+    assert fp is not None
+    assert fp == hku_scraper_runner.news_list_fingerprint(LIST_AB.format(banner='2'))
+    assert fp == hku_scraper_runner.news_list_fingerprint(LIST_BA)
+
+
+def test_fingerprint_none_when_list_missing():
+    assert hku_scraper_runner.news_list_fingerprint(NO_LIST) is None
+
+
+def test_network_error_falls_through_to_crawl(probe_env):
+    probe_env(OSError('connection refused'))
+    assert hku_scraper_runner.probe_homepage(index={}) == (True, None)
+
+
+def test_non_200_falls_through_to_crawl(probe_env):
+    probe_env(FakeResponse(503))
+    assert hku_scraper_runner.probe_homepage(index={}) == (True, None)
+
+
+def test_missing_list_falls_through_to_crawl(probe_env):
+    probe_env(FakeResponse(200, NO_LIST))
+    assert hku_scraper_runner.probe_homepage(index={}) == (True, None)
+
+
+def test_new_list_crawls_and_defers_state(probe_env):
+    probe_env(FakeResponse(200, LIST_AB.format(banner=''), {'ETag': '"v1"'}))
+    changed, new_state = hku_scraper_runner.probe_homepage(index={})
+    assert changed is True
+    assert new_state['etag'] == '"v1"'
+    assert new_state['links'] == [LINK_A, LINK_B]
+    # 状态要等爬虫成功后才保存
+    assert not _state_file().exists()
+
+
+def test_unchanged_list_with_all_links_known_skips(probe_env):
+    html = LIST_AB.format(banner='')
+    hku_scraper_runner._save_probe_state({
+        'fingerprint': hku_scraper_runner.news_list_fingerprint(html), 'etag': '"v1"'})
+    probe_env(FakeResponse(200, html, {'ETag': '"v2"'}))
+    assert hku_scraper_runner.probe_homepage(index={LINK_A: {}, LINK_B: {}}) == (False, None)
+    assert json.loads(_state_file().read_text(encoding='utf-8'))['etag'] == '"v2"'
+
+
+def test_unchanged_list_with_unsaved_link_crawls(probe_env):
+    html = LIST_AB.format(banner='')
+    hku_scraper_runner._save_probe_state({'fingerprint': hku_scraper_runner.news_list_fingerprint(html)})
+    probe_env(FakeResponse(200, html))
+    changed, _ = hku_scraper_runner.probe_homepage(index={LINK_A: {}})
+    assert changed is True
+
+
+def test_304_sends_validators_and_skips_when_all_known(probe_env):
+    hku_scraper_runner._save_probe_state({
+        'etag': '"v1"', 'last_modified': 'Mon, 01 Jan 2024 00:00:00 GMT', 'links': [LINK_A, LINK_B]})
+    calls = probe_env(FakeResponse(304))
+    assert hku_scraper_runner.probe_homepage(index={LINK_A: {}, LINK_B: {}}) == (False, None)
+    assert calls[0]['If-None-Match'] == '"v1"'
+    assert calls[0]['If-Modified-Since'] == 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+def test_304_with_failed_article_crawls(probe_env):
+    hku_scraper_runner._save_probe_state({'etag': '"v1"', 'links': [LINK_A, LINK_B]})
+    probe_env(FakeResponse(304))
+    assert hku_scraper_runner.probe_homepage(index={LINK_A: {}}) == (True, None)
+
+
+@pytest.mark.parametrize('returncode, saved', [(0, True), (1, False)])
+def test_run_spider_saves_state_only_after_success(probe_env, monkeypatch, returncode, saved):
+    probe_env(FakeResponse(200, LIST_AB.format(banner='')))
+    monkeypatch.setattr(hku_scraper_runner, 'load_news_index', lambda path: {})
+    monkeypatch.setattr(hku_scraper_runner.subprocess, 'run',
+                        lambda cmd, cwd=None: subprocess.CompletedProcess(cmd, returncode))
+    hku_scraper_runner.run_spider()
+    assert _state_file().exists() is saved
+
+
+def test_no_probe_flag_skips_probe(probe_env, monkeypatch):
+    calls = probe_env(OSError('should not be called'))
+    crawled = []
+    monkeypatch.setattr(hku_scraper_runner.subprocess, 'run',
+                        lambda cmd, cwd=None: crawled.append(cmd) or subprocess.CompletedProcess(cmd, 0))
+    args = hku_scraper_runner.parse_args(['--no-probe'])
+    hku_scraper_runner.run_spider(force=args.no_probe)
+    assert calls == [] and len(crawled) == 1
@@ -0,0 +1,98 @@
+import json
+import threading
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from hku_scraper.readmodel import ReadModel, make_server
+from hku_scraper.store import ArticleStore
+
+
+def _article(i, scraped_at=None, text='body'):
+    return {'title': f'T{i}', 'url': f'https://arts.hku.hk/news/{i}', 'site': 'arts', 'text': text,
+            'images': [], 'scraped_at': scraped_at or f'2025-01-{i:02d}T00:00:00', 'status': 'completed'}
+
+
+def _store(tmp_path, count):
+    store = ArticleStore(tmp_path / 'articles.db')
+    for i in range(1, count + 1):
+        store.add_article(_article(i))
+    return store
+
+
+def test_pages_are_newest_first(tmp_path):
+    store = _store(tmp_path, 5)
+    model = ReadModel(tmp_path)
+    etag, payload = model.page(1, 2)
+    assert [a['id'] for a in payload['data']] == [5, 4]
+    assert payload['total'] == 5 and payload['data'][0]['site'] == 'arts'
+    assert payload['data'][0]['file'] == '5_article.json'
+    assert [a['id'] for a in model.page(3, 2)[1]['data']] == [1]
+    assert model.page(4, 2)[1]['data'] == []
+    # 没有写入时 ETag 不变
+    assert model.page(1, 2)[0] == etag
+    model.close()
+    store.close()
+
+
+def test_writes_from_another_connection_are_applied_incrementally(tmp_path):
+    store = _store(tmp_path, 3)
+    model = ReadModel(tmp_path)
+    etag, _ = model.page(1, 2)
+    old_etag, body = model.detail(2)
+    assert json.loads(body)['data']['text'] == 'body'
+    assert model.detail(2)[1] is body and model.hits == 1
+
+    store.add_article(_article(4))
+    # 修改后抓取时间变新，排到最前面，缓存的正文被淘汰
+    store.update_article(2, _article(2, scraped_at='2025-02-01T00:00:00', text='changed'))
+    assert model.refresh() == 2
+    new_etag, payload = model.page(1, 2)
+    assert new_etag != etag
+    assert [a['id'] for a in payload['data']] == [2, 4] and payload['total'] == 4
+    detail_etag, body = model.detail(2)
+    assert detail_etag != old_etag and json.loads(body)['data']['text'] == 'changed'
+    assert model.refresh() == 0
+    assert model.detail(99) == (None, None)
+    model.close()
+    store.close()
+
+
+def test_detail_cache_is_bounded_by_bytes(tmp_path):
+    store = _store(tmp_path, 4)
+    model = ReadModel(tmp_path, cache_bytes=600)
+    for i in (1, 2, 3, 4):
+        model.detail(i)
+    assert len(model._cache) < 4 and model._cached_bytes <= 600
+    assert list(model._cache)[-1] == 4
+    model.close()
+    store.close()
+
+
+def test_http_server_answers_with_etags(tmp_path):
+    store = _store(tmp_path, 3)
+    model = ReadModel(tmp_path)
+    server = make_server(model, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}/api/hku-news'
+    try:
+        with urlopen(f'{base}?page=1&page_size=2') as response:
+            etag = response.headers['ETag']
+            assert [a['id'] for a in json.load(response)['data']] == [3, 2]
+        try:
+            urlopen(Request(f'{base}?page=1&page_size=2', headers={'If-None-Match': etag}))
+            raise AssertionError('expected 304')
+        except HTTPError as e:
+            assert e.code == 304
+        with urlopen(f'{base}/1') as response:
+            assert json.load(response) == {'success': True, 'data': _article(1)}
+        for path, code in (('/9', 404), ('/abc', 404), ('?page=0', 400), ('?page_size=x', 400)):
+            try:
+                urlopen(base + path)
+                raise AssertionError(f'expected {code}')
+            except HTTPError as e:
+                assert e.code == code
+    finally:
+        server.shutdown()
+        server.server_close()
+        model.close()
+        store.close()
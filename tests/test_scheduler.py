@@ -0,0 +1,170 @@
+import random
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from twisted.internet import defer, task
+
+import hku_scraper_runner
+from hku_scraper.scheduler import (
+    MAX_IDLE_FACTOR, AdaptiveScheduler, PollPolicy, PollTarget, PublicationRhythm, hour_of_week,
+)
+from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+from hku_scraper.store import ArticleStore
+
+# 2025-06-02 是星期一
+MONDAY = datetime(2025, 6, 2)
+
+
+def _weekday_mornings(weeks=4, per_day=2):
+    """过去几周每个工作日上午 10 点左右发文"""
+    stamps = []
+    for week in range(1, weeks + 1):
+        for day in range(5):
+            for i in range(per_day):
+                when = MONDAY - timedelta(weeks=week) + timedelta(days=day, hours=10, minutes=10 * i)
+                stamps.append(when.isoformat())
+    return stamps
+
+
+def _policy(**kwargs):
+    return PollPolicy(jitter=0, rng=random.Random(0), **kwargs)
+
+
+def test_rhythm_learns_active_hours():
+    rhythm = PublicationRhythm(_weekday_mornings() + ['garbage', None], now=MONDAY)
+    assert rhythm.total == 40
+    assert rhythm.rate(MONDAY + timedelta(hours=10)) > 10 * rhythm.rate(MONDAY - timedelta(hours=20))
+    # 相邻小时也有一部分
+    assert rhythm.rate(MONDAY + timedelta(hours=11)) > rhythm.rate(MONDAY + timedelta(hours=14))
+    # 没有历史时所有时段到达率相同且大于 0
+    empty = PublicationRhythm([], now=MONDAY)
+    assert len(set(empty.rates)) == 1 and empty.rates[0] > 0
+
+
+def test_active_window_polls_faster_than_quiet_hours():
+    policy = _policy(min_interval=300, max_interval=4 * 3600)
+    rhythm = PublicationRhythm(_weekday_mornings(), now=MONDAY)
+    active = policy.next_delay(rhythm, MONDAY + timedelta(hours=10))
+    quiet = policy.next_delay(rhythm, MONDAY - timedelta(hours=20))
+    assert 300 <= active < quiet <= 4 * 3600
+    # 总轮询次数不超过预算
+    assert sum(policy.polls_per_hour(rhythm)) == pytest.approx(policy.polls_per_week)
+
+
+def test_wakes_up_when_active_window_starts():
+    policy = _policy(min_interval=300, max_interval=12 * 3600, polls_per_week=20)
+    rhythm = PublicationRhythm(_weekday_mornings(), now=MONDAY)
+    # 凌晨安静，但 10 点左右活跃：不会一直睡到 12 小时上限而错过活跃时段
+    delay = policy.next_delay(rhythm, MONDAY)
+    assert hour_of_week(MONDAY + timedelta(seconds=delay)) <= 10
+    # 周日零点之后是一整天的安静时段，间隔更长
+    assert policy.next_delay(rhythm, MONDAY - timedelta(days=1)) > delay
+
+
+def test_idle_and_error_backoff():
+    policy = _policy(min_interval=600, max_interval=8 * 3600)
+    rhythm = PublicationRhythm(_weekday_mornings(), now=MONDAY)
+    now = MONDAY + timedelta(hours=10)
+    base = policy.next_delay(rhythm, now)
+    assert policy.next_delay(rhythm, now, idle_polls=2) > base
+    assert policy.next_delay(rhythm, now, idle_polls=100) == pytest.approx(base * MAX_IDLE_FACTOR)
+    assert policy.next_delay(rhythm, now, errors=3) >= 600 * 8
+    assert policy.next_delay(rhythm, now, errors=30) == 8 * 3600
+
+
+def test_jitter_stays_within_bounds():
+    policy = PollPolicy(min_interval=600, max_interval=3600, jitter=0.1, rng=random.Random(1))
+    rhythm = PublicationRhythm([], now=MONDAY)
+    delays = {policy.next_delay(rhythm, MONDAY) for _ in range(20)}
+    assert len(delays) > 1
+    assert all(0.9 * 600 <= d <= 1.1 * 3600 for d in delays)
+
+
+def test_invalid_interval_range():
+    with pytest.raises(ValueError):
+        PollPolicy(min_interval=600, max_interval=60)
+
+
+def test_scheduler_bounds_concurrency_and_backs_off():
+    now = [MONDAY.timestamp()]
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+    polls = []
+
+    def make_poll(name, result):
+        def poll():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            try:
+                polls.append(name)
+                if isinstance(result, Exception):
+                    raise result
+                return result
+            finally:
+                with lock:
+                    active[0] -= 1
+        return poll
+
+    targets = [PollTarget('news', make_poll('news', 2)),
+               PollTarget('quiet', make_poll('quiet', 0)),
+               PollTarget('broken', make_poll('broken', RuntimeError('down')))]
+    scheduler = AdaptiveScheduler(targets, _policy(min_interval=600, max_interval=7200), workers=2,
+                                  clock=lambda: now[0], sleep=lambda s: now.__setitem__(0, now[0] + s))
+    assert scheduler.run(max_polls=9) == 9
+    assert peak[0] <= 2
+    assert set(polls) == {'news', 'quiet', 'broken'}
+    news, quiet, broken = targets
+    assert news.idle_polls == 0 and news.errors == 0
+    assert quiet.idle_polls >= 1
+    assert broken.errors >= 1
+    # 出错的目标退避得更久
+    assert broken.next_due - now[0] > news.next_due - now[0] - 600
+
+
+def test_make_target_counts_new_articles_of_its_site(tmp_path, monkeypatch):
+    store = ArticleStore(tmp_path / 'articles.db')
+    site = {'name': 'hku_arts', 'allowed_domains': ['arts.hku.hk']}
+    results = iter([True, False])
+
+    def fake_run_spider(**kwargs):
+        stamp = datetime.now().isoformat()
+        store.add_article({'url': 'https://arts.hku.hk/news/1', 'scraped_at': stamp})
+        store.add_article({'url': 'https://other.example/news/1', 'scraped_at': stamp})
+        return next(results)
+
+    monkeypatch.setattr(hku_scraper_runner, 'run_spider', fake_run_spider)
+    target = hku_scraper_runner.make_target(store, site)
+    assert target.poll() == 1
+    assert len(target.history()) == 1
+    with pytest.raises(RuntimeError):
+        target.poll()
+    store.close()
+
+
+class _GrowingRunner:
+    """每次 crawl 往 store 里加一篇文章"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def crawl(self, spider_cls, store, **kwargs):
+        self.calls += 1
+        store[f'u{self.calls}'] = True
+        return defer.succeed(None)
+
+
+def test_daemon_uses_adaptive_delay():
+    clock = task.Clock()
+    clock.advance(MONDAY.timestamp())
+    policy = _policy(min_interval=600, max_interval=7200)
+    daemon = hku_scraper_runner.CrawlDaemon(
+        _GrowingRunner(), HKUArtsNewsSpider, 3600, clock, {},
+        probe=lambda: (True, None), defer_probe=defer.maybeDeferred, policy=policy)
+    daemon.run_cycle()
+    assert daemon.target.idle_polls == 0
+    (call,) = clock.getDelayedCalls()
+    assert 600 <= call.getTime() - clock.seconds() <= 7200
+    assert call.getTime() - clock.seconds() != 3600
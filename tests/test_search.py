@@ -0,0 +1,94 @@
+from hku_scraper.pipelines import SaveJsonPipeline
+from hku_scraper.search import SearchIndex, main, open_index, search, tokenize
+from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+from hku_scraper.store import ArticleStore
+
+
+def _article(url, title, text):
+    return {'title': title, 'url': url, 'text': text, 'images': [],
+            'scraped_at': '2025-01-01T00:00:00', 'status': 'completed'}
+
+
+def test_tokenize_cjk_bigrams_and_latin_words():
+    assert tokenize('香港大學 Faculty of Arts 2025年') == [
+        '香港', '港大', '大學', 'faculty', 'of', 'arts', '2025', '年']
+    # 标点分开的中文不会跨标点组成两字词
+    assert tokenize('文學。院') == ['文學', '院']
+
+
+def test_bm25_ranks_matching_articles(tmp_path):
+    index = SearchIndex(tmp_path / 'search.db')
+    index.index_article(1, _article('u1', '講座通知', '文學院將舉辦中國歷史講座，歡迎參加。'))
+    index.index_article(2, _article('u2', '招生資訊', '本科課程招生，截止日期為三月。'))
+    index.index_article(3, _article('u3', 'History Seminar', 'A seminar on Chinese history and art.'))
+
+    hits = index.search('歷史講座')
+    assert [hit['id'] for hit in hits] == [1]
+    assert hits[0]['title'] == '講座通知' and hits[0]['url'] == 'u1'
+    assert [hit['id'] for hit in index.search('History')] == [3]
+    assert index.search('不存在的詞') == []
+    assert index.search('') == []
+    index.close()
+
+
+def test_title_match_outranks_body_match(tmp_path):
+    index = SearchIndex(tmp_path / 'search.db')
+    index.index_article(1, _article('u1', '新聞', '本周有展覽開幕。'))
+    index.index_article(2, _article('u2', '展覽開幕', '詳情請見網站。'))
+    assert [hit['id'] for hit in index.search('展覽')] == [2, 1]
+    index.close()
+
+
+def test_reindex_replaces_old_content(tmp_path):
+    index = SearchIndex(tmp_path / 'search.db')
+    index.index_article(1, _article('u1', 'old', '舊內容 apple'))
+    index.index_article(1, _article('u1', 'new', '新內容 banana'))
+    assert len(index) == 1
+    assert index.search('apple') == []
+    assert [hit['id'] for hit in index.search('banana')] == [1]
+
+    index.remove_article(1)
+    assert len(index) == 0
+    assert index.search('banana') == []
+    index.close()
+
+
+def test_sync_catches_up_with_store(tmp_path):
+    store = ArticleStore(tmp_path / 'articles.db')
+    store.add_article(_article('u1', '甲', 'alpha'))
+    store.add_article(_article('u2', '乙', 'beta'))
+    index = open_index(tmp_path, store)
+    assert index.doc_ids() == {1, 2}
+    store.add_article(_article('u3', '丙', 'gamma'))
+    assert index.sync(store) == 1
+    assert [hit['id'] for hit in index.search('gamma')] == [3]
+    assert index.rebuild(store) == 3 and len(index) == 3
+    index.close()
+    store.close()
+
+
+def test_pipeline_indexes_saved_and_changed_articles(data_home):
+    spider = HKUArtsNewsSpider()
+    pipeline = SaveJsonPipeline()
+    pipeline.send_to_wechat = lambda article, spider: None
+    pipeline.open_spider(spider)
+    pipeline.process_item(_article('https://arts.hku.hk/news/a', '書展', '文學院參加香港書展'), spider)
+    pipeline.process_item({**_article('https://arts.hku.hk/news/a', '書展', '改為參加音樂節'),
+                           'revalidate_of': 1}, spider)
+    pipeline.close_spider(spider)
+    spider.closed('finished')
+
+    assert [hit['id'] for hit in search('音樂節', data_dir=data_home)] == [1]
+    assert search('香港書展', data_dir=data_home)[0]['title'] == '書展'
+
+
+def test_cli_query_and_rebuild(data_home, capsys):
+    store = ArticleStore(data_home / 'articles.db')
+    store.add_article(_article('u1', '講座', '比較文學講座'))
+    store.close()
+    assert main(['rebuild', str(data_home)]) == 0
+    assert main(['query', '比較文學']) == 0
+    out = capsys.readouterr().out
+    assert '#1 講座' in out and '共 1 条结果' in out
+    assert main([]) == 1
+    assert search('講座', data_dir=data_home)[0]['url'] == 'u1'
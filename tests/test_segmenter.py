@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from hku_scraper.segmenter import (
+    CONTINUE_SUFFIX, MAX_SEGMENT_BYTES, SENTENCE_ENDINGS, SOFT_BREAKS,
+    char_boundary, last_break, split_markdown, utf8_len,
+)
+
+ALPHABETS = [
+    'abcdefghij klmnop.,!?',
+    '香港大学文学院新闻发布会。，！？；、',
+    'Ünïcödé ß — “quotes” … ',
+    '😀🎉🏛📚 ',
+]
+
+
+def _random_text(rng, length):
+    alphabet = ''.join(rng.sample(ALPHABETS, rng.randint(1, len(ALPHABETS))))
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def _body(segment, title):
+    """去掉段头、续段后缀和最终后缀，得到正文部分"""
+    header_end = segment.index('**\n\n') + 4 if segment.startswith(f'**{title}') else 0
+    body = segment[header_end:]
+    if body.endswith(CONTINUE_SUFFIX):
+        return body[:-len(CONTINUE_SUFFIX)]
+    return body[:body.rindex('\n\n[阅读原文]')]
+
+
+@pytest.mark.parametrize('seed', range(60))
+def test_segments_never_exceed_limit_and_keep_all_text(seed):
+    rng = random.Random(seed)
+    limit = rng.choice([MAX_SEGMENT_BYTES, 1000, 300])
+    # 标题 + 链接后缀本身必须放得下，过长的标题由 test_title_too_long_raises 覆盖
+    title = _random_text(rng, rng.randint(1, 80 if limit > 300 else 20)).strip() or 'T'
+    text = _random_text(rng, rng.choice([10, 500, 3000, 20000]))
+
+    segments = split_markdown(title, text, 'https://arts.hku.hk/news/x', '2025-01-01T00:00:00', limit)
+
+    assert all(utf8_len(s) <= limit for s in segments)
+    assert segments[-1].endswith('_抓取时间: 2025-01-01T00:00:00_')
+    assert all(s.endswith(CONTINUE_SUFFIX) for s in segments[:-1])
+    # 只在断点处丢弃空白，非空白字符一个不少
+    joined = ''.join(_body(s, title) for s in segments)
+    assert ''.join(joined.split()) == ''.join(text.split())
+
+
+def test_short_article_is_single_message():
+    segments = split_markdown('标题', '正文', 'u', 't')
+    assert segments == ['**标题**\n\n正文\n\n[阅读原文](u)\n\n_抓取时间: t_']
+
+
+def test_prefers_sentence_boundaries():
+    sentence = '香港大学文学院今天举行了新闻发布会。'
+    segments = split_markdown('T', sentence * 400, 'u', 't')
+    assert len(segments) > 1
+    for segment in segments[:-1]:
+        assert segment[:-len(CONTINUE_SUFFIX)].endswith('。')
+
+
+def test_continuation_headers_are_numbered():
+    segments = split_markdown('T', 'a' * 10000, 'u', 't')
+    assert segments[0].startswith('**T**\n\n')
+    assert segments[1].startswith('**T（续2）**\n\n')
+
+
+def test_char_boundary_and_last_break():
+    data = 'a中😀. b，c'.encode('utf-8')
+    # 落在“中”的第 2 个字节上，回退到“中”的起点
+    assert char_boundary(data, 2) == 1
+    assert char_boundary(data, 4) == 4
+    # 句点之后断开，空格留给下一段去掉
+    assert last_break(data, 0, len(data), SENTENCE_ENDINGS) == 9
+    assert last_break(data, 0, len(data), SOFT_BREAKS) == data.index('，'.encode('utf-8')) + 3
+    assert last_break(data, 9, len(data), SENTENCE_ENDINGS) is None
+
+
+def test_title_too_long_raises():
+    with pytest.raises(ValueError):
+        split_markdown('标' * 200, 'x' * 1000, 'u', 't', max_bytes=300)
@@ -0,0 +1,215 @@
+import asyncio
+import json
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from scrapy.utils.test import get_crawler
+
+from hku_scraper.sites import load_sites, download_slots
+from hku_scraper.spiders.news_sites_spider import NewsSitesSpider
+from hku_scraper.throttle import SiteAutoThrottle
+
+SITES = {
+    'sites': [
+        {
+            'name': 'alpha',
+            'start_urls': ['https://alpha.example/news'],
+            'list_selector': 'ul.list li',
+            'detail_selector': 'div.body',
+            'pagination': {'next_selector': 'a.next::attr(href)', 'max_pages': 2},
+            'text_limit': 10,
+            'politeness': {'concurrency': 8, 'delay': 0.25},
+        },
+        {
+            'name': 'beta',
+            'start_urls': ['https://beta.example/'],
+            'list_selector': 'div.news article',
+            'link_selector': 'h2 a::attr(href)',
+            'title_selector': 'h2 a::text',
+            'detail_selector': 'main',
+            'politeness': {'concurrency': 1, 'delay': 5},
+        },
+    ]
+}
+
+ALPHA_LIST = b'''
+<html><body><ul class="list">
+  <li><a href="/a/1">One</a></li>
+  <li><a href="/a/2">Two</a></li>
+</ul><a class="next" href="/news?page=2">next</a></body></html>
+'''
+
+ALPHA_DETAIL = b'''
+<html><body><div class="body"><p>abcdefghijklmnop</p><img src="/img/1.png"></div></body></html>
+'''
+
+
+@pytest.fixture
+def sites_file(tmp_path):
+    path = tmp_path / 'sites.json'
+    path.write_text(json.dumps(SITES), encoding='utf-8')
+    return path
+
+
+def _response(page_url, body, **meta):
+    return HtmlResponse(url=page_url, body=body, encoding='utf-8', request=Request(page_url, meta=meta))
+
+
+def test_load_sites_fills_defaults(sites_file):
+    alpha, beta = load_sites(sites_file)
+    assert alpha['allowed_domains'] == ['alpha.example']
+    assert alpha['link_selector'] == 'a::attr(href)'
+    assert beta['image_limit'] == 10
+    assert [s['name'] for s in load_sites(sites_file, names=['beta'])] == ['beta']
+
+
+def test_load_sites_rejects_bad_definitions(tmp_path, sites_file):
+    with pytest.raises(ValueError):
+        load_sites(sites_file, names=['gamma'])
+    broken = tmp_path / 'broken.json'
+    broken.write_text(json.dumps({'sites': [{'name': 'x', 'start_urls': ['https://x/']}]}))
+    with pytest.raises(ValueError):
+        load_sites(broken)
+
+
+def test_download_slots_are_per_domain_and_conservative(sites_file):
+    sites = load_sites(sites_file)
+    sites.append({**sites[1], 'name': 'beta2', 'politeness': {'concurrency': 4, 'delay': 1}})
+    slots = download_slots(sites)
+    assert slots['alpha.example'] == {'concurrency': 8, 'delay': 0.25}
+    assert slots['beta.example'] == {'concurrency': 1, 'delay': 5.0}
+
+
+def test_bundled_sites_file_defines_hku_arts():
+    names = [site['name'] for site in load_sites()]
+    assert 'hku_arts' in names
+
+
+def test_spider_crawls_every_site_and_paginates(data_home, sites_file):
+    spider = NewsSitesSpider(sites_file=sites_file)
+    start = list(spider.start_requests())
+    assert {r.meta['site'] for r in start} == {'alpha', 'beta'}
+    assert all(r.meta['httpcache_revalidate'] for r in start)
+    assert set(spider.allowed_domains) == {'alpha.example', 'beta.example'}
+
+    out = list(spider.parse(_response('https://alpha.example/news', ALPHA_LIST, site='alpha', page=1)))
+    assert [r.url for r in out] == ['https://alpha.example/a/1', 'https://alpha.example/a/2',
+                                    'https://alpha.example/news?page=2']
+    assert out[-1].meta['page'] == 2
+
+    # 第 2 页已到 max_pages，不再翻页
+    out = list(spider.parse(_response('https://alpha.example/news?page=2', ALPHA_LIST, site='alpha', page=2)))
+    assert len(out) == 2
+    spider.closed('finished')
+
+
+def test_parse_article_uses_site_limits(data_home, sites_file):
+    spider = NewsSitesSpider(sites_file=sites_file, sites='alpha')
+    item, = spider.parse_article(_response('https://alpha.example/a/1', ALPHA_DETAIL,
+                                           site='alpha', title='One', url='https://alpha.example/a/1'))
+    assert item['site'] == 'alpha'
+    assert item['text'] == 'abcdefghij'
+    assert item['image_urls'] == ['https://alpha.example/img/1.png']
+    spider.closed('finished')
+
+
+def test_update_settings_merges_site_slots(sites_file):
+    crawler = get_crawler(NewsSitesSpider, {'SITES_FILE': str(sites_file),
+                                            'DOWNLOAD_SLOTS': {'beta.example': {'delay': 9}}})
+    slots = crawler.settings.getdict('DOWNLOAD_SLOTS')
+    assert slots['alpha.example']['delay'] == 0.25
+    assert slots['beta.example'] == {'delay': 9}
+
+
+class FakeSlot:
+    def __init__(self, delay):
+        self.delay = delay
+
+
+def test_site_throttle_keeps_slot_at_site_delay():
+    crawler = get_crawler(settings_dict={
+        'AUTOTHROTTLE_ENABLED': True,
+        'DOWNLOAD_DELAY': 0,
+        'DOWNLOAD_SLOTS': {'slow.example': {'delay': 3}},
+    })
+    throttle = SiteAutoThrottle(crawler)
+    throttle.mindelay, throttle.maxdelay = 0, 60
+    slow = HtmlResponse('https://slow.example/', body=b'', request=Request(
+        'https://slow.example/', meta={'download_slot': 'slow.example'}))
+    fast = HtmlResponse('https://fast.example/', body=b'', request=Request(
+        'https://fast.example/', meta={'download_slot': 'fast.example'}))
+
+    slot = FakeSlot(3)
+    throttle._adjust_delay(slot, 0.1, slow)
+    assert slot.delay == 3
+
+    slot = FakeSlot(3)
+    throttle._adjust_delay(slot, 0.1, fast)
+    assert slot.delay < 3
+
+
+def _known(spider, *urls):
+    for url in urls:
+        spider.store.add_article({'url': url, 'title': url})
+
+
+def test_incremental_stops_at_first_fully_known_page(data_home, sites_file):
+    spider = NewsSitesSpider(sites_file=sites_file, sites='alpha')
+    _known(spider, 'https://alpha.example/a/1', 'https://alpha.example/a/2')
+    out = list(spider.parse(_response('https://alpha.example/news', ALPHA_LIST, site='alpha', page=1)))
+    assert out == []
+    spider.closed('finished')
+
+
+def test_incremental_follows_page_with_any_new_url(data_home, sites_file):
+    spider = NewsSitesSpider(sites_file=sites_file, sites='alpha')
+    _known(spider, 'https://alpha.example/a/1')
+    out = list(spider.parse(_response('https://alpha.example/news', ALPHA_LIST, site='alpha', page=1)))
+    assert [r.url for r in out] == ['https://alpha.example/a/2', 'https://alpha.example/news?page=2']
+    spider.closed('finished')
+
+
+def test_backfill_walks_past_known_pages_within_budget(data_home, sites_file):
+    spider = NewsSitesSpider(sites_file=sites_file, sites='alpha', mode='backfill', budget=3)
+    _known(spider, 'https://alpha.example/a/1', 'https://alpha.example/a/2')
+    start = list(spider.start_requests())
+    assert len(start) == 1
+
+    # 已抓取的页面不提前停止，也不受 max_pages 限制
+    out = list(spider.parse(_response('https://alpha.example/news?page=5', ALPHA_LIST, site='alpha', page=5)))
+    assert [r.meta['page'] for r in out] == [6]
+
+    # 预算只剩 1：新的详情页用掉最后一次，下一页不再请求
+    older = ALPHA_LIST.replace(b'/a/1', b'/a/3').replace(b'/a/2', b'/a/4')
+    out = list(spider.parse(_response('https://alpha.example/news?page=6', older, site='alpha', page=6)))
+    assert [r.url for r in out] == ['https://alpha.example/a/3']
+    assert spider.budget == 0
+    spider.closed('finished')
+
+
+def test_url_template_pagination(data_home, tmp_path):
+    path = tmp_path / 'paged.json'
+    path.write_text(json.dumps({'sites': [{
+        'name': 'paged', 'start_urls': ['https://paged.example/news'],
+        'list_selector': 'ul.list li', 'detail_selector': 'div.body',
+        'pagination': {'url_template': '/news?page={page}'},
+    }]}), encoding='utf-8')
+    spider = NewsSitesSpider(sites_file=path)
+    out = list(spider.parse(_response('https://paged.example/news', ALPHA_LIST, site='paged', page=1)))
+    assert out[-1].url == 'https://paged.example/news?page=2'
+    spider.closed('finished')
+
+
+def test_unknown_mode_is_rejected(data_home, sites_file):
+    with pytest.raises(ValueError):
+        NewsSitesSpider(sites_file=sites_file, mode='everything')
+
+
+def test_async_start_yields_start_requests(data_home, sites_file):
+    spider = NewsSitesSpider(sites_file=sites_file)
+
+    async def collect():
+        return [request async for request in spider.start()]
+
+    assert [r.url for r in asyncio.run(collect())] == [r.url for r in spider.start_requests()]
+    spider.closed('finished')
@@ -0,0 +1,105 @@
+import json
+
+from hku_scraper.pipelines import SaveJsonPipeline
+from hku_scraper.spiders.hku_arts_spider import HKUArtsNewsSpider
+from hku_scraper.store import ArticleStore, open_store
+
+
+def _article(url, title='T'):
+    return {'title': title, 'url': url, 'text': 'body', 'images': [],
+            'scraped_at': '2025-01-01T00:00:00', 'status': 'completed'}
+
+
+def test_ids_are_stable_and_duplicates_are_ignored(tmp_path):
+    store = ArticleStore(tmp_path / 'articles.db')
+    assert store.add_article(_article('u1')) == (1, True)
+    assert store.add_article(_article('u2')) == (2, True)
+    assert store.add_article(_article('u1', title='changed')) == (1, False)
+    assert store.get_article(1)['title'] == 'T'
+    assert store.has_url('u2') and 'u3' not in store
+    store.close()
+
+
+def test_two_connections_never_share_an_id(tmp_path):
+    first = ArticleStore(tmp_path / 'articles.db')
+    second = ArticleStore(tmp_path / 'articles.db')
+    ids = {first.add_article(_article('a'))[0], second.add_article(_article('b'))[0],
+           first.add_article(_article('c'))[0]}
+    assert ids == {1, 2, 3}
+    # 另一个连接先写入的 URL 不会重复分配 id
+    assert second.add_article(_article('c')) == (3, False)
+    first.close()
+    second.close()
+
+
+def test_migrate_keeps_file_numbers_and_renumbers_collisions(tmp_path):
+    (tmp_path / 'news_index.json').write_text(json.dumps({
+        'u1': {'title': 'One', 'file': '1_article.json', 'scraped_at': 's1'},
+        'u2': {'title': 'Two', 'file': '2_article.json', 'scraped_at': 's2'},
+        # 旧版 len(index)+1 冲突：u3 覆盖了 2_article.json
+        'u3': {'title': 'Three', 'file': '2_article.json', 'scraped_at': 's3'},
+    }), encoding='utf-8')
+    (tmp_path / '1_article.json').write_text(json.dumps(_article('u1', 'One')), encoding='utf-8')
+    (tmp_path / '2_article.json').write_text(json.dumps(_article('u3', 'Three')), encoding='utf-8')
+
+    store = open_store(tmp_path)
+    assert len(store) == 3
+    assert store.get_id('u1') == 1
+    assert store.get_article(1)['title'] == 'One'
+    # 文件内容属于 u3，u2 只保留索引信息
+    assert store.get_article(store.get_id('u2')).get('text') is None
+    renumbered = store.get_id('u3')
+    assert renumbered not in (1, 2)
+    assert json.loads((tmp_path / f'{renumbered}_article.json').read_text(encoding='utf-8'))['url'] == 'u3'
+    # 再次迁移不会重复导入
+    assert store.migrate_from_json(tmp_path) == 0
+    store.close()
+
+
+def test_pipeline_exports_index_once_on_close(data_home):
+    spider = HKUArtsNewsSpider()
+    pipeline = SaveJsonPipeline()
+    pipeline.send_to_wechat = lambda article, spider: None
+    pipeline.open_spider(spider)
+    for url in ('https://arts.hku.hk/news/a', 'https://arts.hku.hk/news/b'):
+        pipeline.process_item(_article(url), spider)
+    assert not (data_home / 'news_index.json').exists()
+    assert (data_home / '2_article.json').exists()
+
+    pipeline.close_spider(spider)
+    index = json.loads((data_home / 'news_index.json').read_text(encoding='utf-8'))
+    assert index['https://arts.hku.hk/news/b']['file'] == '2_article.json'
+    assert spider.store.has_url('https://arts.hku.hk/news/a')
+    spider.closed('finished')
+
+
+def test_frontier_is_cleared_on_save_and_resumed_until_given_up(tmp_path):
+    store = ArticleStore(tmp_path / 'articles.db')
+    store.add_to_frontier([{'url': 'u1', 'site': 'alpha', 'title': 'One'},
+                           {'url': 'u2', 'site': 'alpha', 'title': 'Two'},
+                           {'url': 'u3', 'site': 'beta', 'title': 'Three'}])
+    store.add_article(_article('u1'))
+    assert store.frontier_size() == 2
+
+    pending, dropped = store.resume_frontier(['alpha'], max_attempts=2)
+    assert [(p['url'], p['title'], p['attempts']) for p in pending] == [('u2', 'Two', 1)] and dropped == 0
+    # 重新发现同一个详情页不会重置续抓次数
+    store.add_to_frontier([{'url': 'u2', 'site': 'alpha', 'title': 'Two'}])
+    assert store.resume_frontier(['alpha'], max_attempts=2)[0][0]['attempts'] == 2
+    assert store.resume_frontier(['alpha'], max_attempts=2) == ([], 1)
+    # 其他站点的不受影响
+    assert [p['url'] for p in store.resume_frontier(['beta'])[0]] == ['u3']
+    store.close()
+
+
+def test_unfinished_post_save_survives_reopen(tmp_path):
+    store = ArticleStore(tmp_path / 'articles.db')
+    store.add_article(_article('u1'), post_save='notify')
+    store.add_article(_article('u2'))
+    store.close()
+
+    store = ArticleStore(tmp_path / 'articles.db')
+    assert [(i, step, a['url']) for i, step, a in store.unfinished_saves()] == [(1, 'notify', 'u1')]
+    store.finish_post_save(1)
+    assert store.unfinished_saves() == []
+    store.close()
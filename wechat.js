@@ -50,13 +50,13 @@ module.exports = { sendWeChatWebhook };
 
 /**
  * Send an image message to WeChat Work robot webhook.
- * imagePath should be a local file path to the image.
+ * imagePath should be a local file path to the image (or a Buffer with the image bytes).
  * Robot expects base64 + md5.
  */
 async function sendWeChatImage(webhookUrl, imagePath) {
     return new Promise((resolve, reject) => {
         try {
-            const img = fs.readFileSync(imagePath);
+            const img = Buffer.isBuffer(imagePath) ? imagePath : fs.readFileSync(imagePath);
             const base64 = img.toString('base64');
             const md5 = crypto.createHash('md5').update(img).digest('hex');
 